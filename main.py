@@ -1,32 +1,919 @@
-from fastapi import FastAPI, Request, Form, Depends, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse
+import time
+
+# Wall time of this module's import, reported on /ready; `python -X importtime main.py`
+# breaks it down by module
+IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, Request, Form, Depends, HTTPException, Query, File, UploadFile
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, Response, StreamingResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.routing import Match
+from jinja2 import pass_context
+from markupsafe import Markup
 import google.oauth2.id_token
 from google.auth.transport import requests
 from google.cloud import firestore
-from typing import Dict, Any
+from google.cloud.firestore_v1.field_path import FieldPath
+from google.api_core.exceptions import Conflict
+from typing import Dict, Any, List, Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import asyncio
+import base64
+import bisect
+import contextlib
+import contextvars
+import csv
+import functools
+import gzip
+import hashlib
+import io
+import mimetypes
+import orjson
+import re
+import operator
+import shutil
+import statistics
+import sys
+import threading
 import os
+import urllib.error
+import urllib.request
+import zlib
+
+# Optional: brotli variants are only produced and served when it is installed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Warm the instance in the background once it starts serving, and stop the
+# live sync on shutdown
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm_up.start()
+    sync_monitor = asyncio.create_task(monitor_syncs()) if LIVE_SYNC else None
+    yield
+    warm_up.stop()
+    if sync_monitor is not None:
+        sync_monitor.cancel()
+    drivers_sync.stop()
+    teams_sync.stop()
 
 # define the app that will contain all of our routing for Fast API 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+# Transport for google-auth that keeps GET responses, i.e. Google's public
+# signing certs, in memory until their Cache-Control max-age runs out. The
+# underlying transport is built by `request_factory` on first use.
+class CachingAuthRequest:
+    def __init__(self, request_factory):
+        self._request_factory = request_factory
+        self._transport = None
+        self._responses = {}
+        self._lock = threading.Lock()
+
+    def _request(self, *args, **kwargs):
+        if self._transport is None:
+            with self._lock:
+                if self._transport is None:
+                    self._transport = self._request_factory()
+        return self._transport(*args, **kwargs)
+
+    def __call__(self, url, method='GET', body=None, headers=None, timeout=None, **kwargs):
+        if method != 'GET' or body is not None:
+            return self._request(url, method=method, body=body, headers=headers, timeout=timeout, **kwargs)
+
+        with self._lock:
+            cached = self._responses.get(url)
+            if cached is not None and cached[0] > time.time():
+                return cached[1]
+
+        response = self._request(url, method=method, headers=headers, timeout=timeout, **kwargs)
+        match = re.search(r'max-age=(\d+)', response.headers.get('cache-control', ''))
+        if response.status == 200 and match:
+            with self._lock:
+                self._responses[url] = (time.time() + int(match.group(1)), response)
+        return response
 
 # firebase adapter
-firebase_request_adapter = requests.Request()
+firebase_request_adapter = CachingAuthRequest(requests.Request)
+
+# Where verify_firebase_token fetches the signing certs from, so they can be fetched ahead of the first login
+FIREBASE_CERTS_URL = 'https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com'
+
+def fetch_firebase_certs():
+    response = firebase_request_adapter(FIREBASE_CERTS_URL)
+    if response.status != 200:
+        raise ValueError(f"Fetching the Firebase certs returned HTTP {response.status}")
+
+# In-process metrics, exposed in the Prometheus text format on /metrics.
+# Counters and histograms are keyed by a tuple of (label, value) pairs.
+METRICS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class MetricsRegistry:
+    def __init__(self, buckets: tuple = METRICS_BUCKETS):
+        self.buckets = buckets
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, help_text: str, labels: tuple = (), value: float = 1):
+        with self._lock:
+            self._help[name] = help_text
+            series = self._counters.setdefault(name, {})
+            series[labels] = series.get(labels, 0) + value
+
+    def observe(self, name: str, help_text: str, value: float, labels: tuple = ()):
+        with self._lock:
+            self._help[name] = help_text
+            series = self._histograms.setdefault(name, {})
+            counts = series.setdefault(labels, [0] * (len(self.buckets) + 2))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    @staticmethod
+    def _escape(value: Any) -> str:
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    @classmethod
+    def _labels(cls, labels: tuple) -> str:
+        if not labels:
+            return ''
+        return '{' + ','.join(f'{key}="{cls._escape(value)}"' for key, value in labels) + '}'
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines += [f"# HELP {name} {self._help[name]}", f"# TYPE {name} counter"]
+                lines += [f"{name}{self._labels(labels)} {value}" for labels, value in series.items()]
+            for name, series in sorted(self._histograms.items()):
+                lines += [f"# HELP {name} {self._help[name]}", f"# TYPE {name} histogram"]
+                for labels, counts in series.items():
+                    cumulative = 0
+                    for bound, count in zip(self.buckets + ('+Inf',), counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{self._labels(labels + (('le', bound),))} {cumulative}")
+                    lines.append(f"{name}_sum{self._labels(labels)} {counts[-1]}")
+                    lines.append(f"{name}_count{self._labels(labels)} {cumulative}")
+        return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry()
+
+# What the current request has done so far; shared by the threads it runs work on
+class RequestMetrics:
+    def __init__(self):
+        self.firestore_reads = 0
+        self.firestore_writes = 0
+        self.docs_streamed = 0
+        self.token_verify_seconds = 0.0
+        self.template_render_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, **amounts):
+        with self._lock:
+            for field, amount in amounts.items():
+                setattr(self, field, getattr(self, field) + amount)
+
+current_request_metrics = contextvars.ContextVar('current_request_metrics', default=None)
+
+def record_request(**amounts):
+    request_metrics = current_request_metrics.get()
+    if request_metrics is not None:
+        request_metrics.add(**amounts)
+
+# Firestore calls made outside any request, e.g. the live sync, count as 'background'
+def count_firestore(reads: int = 0, writes: int = 0, streamed: int = 0):
+    request_metrics = current_request_metrics.get()
+    if request_metrics is not None:
+        request_metrics.add(firestore_reads=reads, firestore_writes=writes, docs_streamed=streamed)
+        return
+    labels = (('route', 'background'),)
+    if reads:
+        metrics.inc('f1_firestore_reads_total', "Firestore documents read", labels, reads)
+    if writes:
+        metrics.inc('f1_firestore_writes_total', "Firestore writes issued", labels, writes)
+    if streamed:
+        metrics.inc('f1_firestore_docs_streamed_total', "Documents streamed from Firestore queries", labels, streamed)
+
+# Jinja2 templates that time every render
+class InstrumentedTemplates(Jinja2Templates):
+    def TemplateResponse(self, *args, **kwargs):
+        start = time.perf_counter()
+        response = super().TemplateResponse(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        name = next((arg for arg in args if isinstance(arg, str)), kwargs.get('name'))
+        metrics.observe('f1_template_render_seconds', "Template render time", elapsed, (('template', name),))
+        record_request(template_render_seconds=elapsed)
+        return response
+
+# Static assets. `python main.py build-assets` writes minified copies of the
+# stylesheets and scripts to static/dist under content-hashed names, with gzip
+# and brotli variants and a manifest; templates link them through asset_url(),
+# which falls back to the source files until a build exists. Built files never
+# change under a name, so they are cached for a year; anything else is revalidated.
+ASSET_DIST_DIR = os.path.join('static', 'dist')
+ASSET_MANIFEST = os.path.join(ASSET_DIST_DIR, 'manifest.json')
+ASSET_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+def load_asset_manifest() -> Dict[str, str]:
+    try:
+        with open(ASSET_MANIFEST, 'rb') as manifest:
+            return orjson.loads(manifest.read())
+    except FileNotFoundError:
+        return {}
+
+asset_manifest = load_asset_manifest()
+
+# Content codings an Accept-Encoding header allows, leaving out any refused with q=0
+def accepted_encodings(header: str) -> set:
+    encodings = set()
+    for item in header.split(','):
+        coding, *params = item.split(';')
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding.strip() and quality > 0:
+            encodings.add(coding.strip().lower())
+    return encodings
+
+# StaticFiles that serves a precompressed variant when the client accepts it
+# and sets Cache-Control by whether the file is a built asset
+class AssetFiles(StaticFiles):
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        variants = [(coding, full_path + suffix) for coding, suffix in ASSET_ENCODINGS
+                    if os.path.isfile(full_path + suffix)]
+        accepted = accepted_encodings(Headers(scope=scope).get('accept-encoding', ''))
+        for coding, path in variants:
+            if coding in accepted:
+                response = FileResponse(path, stat_result=os.stat(path), media_type=mimetypes.guess_type(full_path)[0],
+                                        headers={'Content-Encoding': coding})
+                break
+        else:
+            response = super().file_response(full_path, stat_result, scope, status_code)
+
+        if variants:
+            response.headers['Vary'] = 'Accept-Encoding'
+        if os.path.realpath(full_path).startswith(os.path.realpath(ASSET_DIST_DIR) + os.sep):
+            response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        else:
+            response.headers['Cache-Control'] = 'no-cache'
+        return response
 
 # define the static and templates directories
-app.mount('/static', StaticFiles(directory='static'), name='static')
-templates = Jinja2Templates(directory="templates")
+app.mount('/static', AssetFiles(directory='static'), name='static')
+templates = InstrumentedTemplates(directory="templates")
+
+# URL of a static file, by its path under static/
+@pass_context
+def asset_url(context, path: str) -> str:
+    return str(context['request'].url_for('static', path='/' + asset_manifest.get(path, path)))
+
+templates.env.globals['asset_url'] = asset_url
+templates.env.globals['assets'] = asset_manifest
+
+# Templates only change on deploy, so skip the per-render freshness check
+TEMPLATE_AUTO_RELOAD = os.environ.get('F1_TEMPLATE_AUTO_RELOAD', '0') == '1'
+templates.env.auto_reload = TEMPLATE_AUTO_RELOAD
+
+# Compile every template up front, so no request pays for parsing one, and
+# fingerprint their sources and the asset build so cached pages change when
+# either does
+TEMPLATE_FINGERPRINT = ''
+
+def precompile_templates():
+    global TEMPLATE_FINGERPRINT
+    digest = hashlib.sha256(orjson.dumps(asset_manifest, option=orjson.OPT_SORT_KEYS))
+    for name in templates.env.list_templates(extensions=['html']):
+        source, _, _ = templates.env.loader.get_source(templates.env, name)
+        digest.update(source.encode('utf-8'))
+        templates.env.get_template(name)
+    TEMPLATE_FINGERPRINT = digest.hexdigest()[:16]
+
+# Thin wrappers around the Firestore client, collection references, queries
+# and documents that count reads, writes and streamed documents against the
+# current request. Everything not wrapped passes straight through, so the
+# wrapped objects can be handed to batches and transactions as they are.
+class InstrumentedQuery:
+    def __init__(self, query):
+        self._query = query
+
+    def __getattr__(self, name):
+        return getattr(self._query, name)
+
+    def where(self, *args, **kwargs):
+        return InstrumentedQuery(self._query.where(*args, **kwargs))
+
+    def order_by(self, *args, **kwargs):
+        return InstrumentedQuery(self._query.order_by(*args, **kwargs))
+
+    def limit(self, *args, **kwargs):
+        return InstrumentedQuery(self._query.limit(*args, **kwargs))
+
+    def start_after(self, *args, **kwargs):
+        return InstrumentedQuery(self._query.start_after(*args, **kwargs))
+
+    def stream(self, *args, **kwargs):
+        for doc in self._query.stream(*args, **kwargs):
+            count_firestore(reads=1, streamed=1)
+            yield doc
+
+    def document(self, *args, **kwargs):
+        return InstrumentedDocument(self._query.document(*args, **kwargs))
+
+class InstrumentedDocument:
+    def __init__(self, document):
+        self._document = document
+
+    def __getattr__(self, name):
+        return getattr(self._document, name)
+
+    def get(self, *args, **kwargs):
+        count_firestore(reads=1)
+        return self._document.get(*args, **kwargs)
+
+    def set(self, *args, **kwargs):
+        count_firestore(writes=1)
+        return self._document.set(*args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        count_firestore(writes=1)
+        return self._document.update(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        count_firestore(writes=1)
+        return self._document.delete(*args, **kwargs)
+
+# A WriteBatch or Transaction
+class InstrumentedWrites:
+    def __init__(self, writes):
+        self._writes = writes
+
+    def __getattr__(self, name):
+        return getattr(self._writes, name)
+
+    def create(self, *args, **kwargs):
+        count_firestore(writes=1)
+        return self._writes.create(*args, **kwargs)
+
+    def set(self, *args, **kwargs):
+        count_firestore(writes=1)
+        return self._writes.set(*args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        count_firestore(writes=1)
+        return self._writes.update(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        count_firestore(writes=1)
+        return self._writes.delete(*args, **kwargs)
+
+# The client itself is built by `client_factory` on first use, as creating
+# it resolves credentials and opens the gRPC channel.
+class InstrumentedClient:
+    def __init__(self, client_factory):
+        self._client_factory = client_factory
+        self._lazy_client = None
+        self._lock = threading.Lock()
+
+    @property
+    def _client(self):
+        if self._lazy_client is None:
+            with self._lock:
+                if self._lazy_client is None:
+                    self._lazy_client = self._client_factory()
+        return self._lazy_client
+
+    def connect(self):
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def collection(self, *path):
+        return LazyCollection(self, *path)
+
+    def batch(self):
+        return InstrumentedWrites(self._client.batch())
+
+    def transaction(self, **kwargs):
+        return InstrumentedWrites(self._client.transaction(**kwargs))
+
+    def get_all(self, references, *args, **kwargs):
+        for doc in self._client.get_all(references, *args, **kwargs):
+            count_firestore(reads=1)
+            yield doc
+
+# A collection reference that is only resolved, along with the client, on first use
+class LazyCollection(InstrumentedQuery):
+    def __init__(self, client: InstrumentedClient, *path):
+        self._db = client
+        self._path = path
+        self._ref = None
+
+    @property
+    def _query(self):
+        if self._ref is None:
+            self._ref = self._db._client.collection(*self._path)
+        return self._ref
+
+    @property
+    def id(self) -> str:
+        return self._path[-1]
 
 # Initialize Firestore client
-db = firestore.Client()
+db = InstrumentedClient(firestore.Client)
 
 # References to Firestore collections
 drivers_ref = db.collection('drivers')
 teams_ref = db.collection('teams')
 
+# Name reservations: one document per normalized name, so creating a second
+# driver or team with the same name fails atomically inside Firestore
+driver_names_ref = db.collection('driver_names')
+team_names_ref = db.collection('team_names')
+
+# Bounded pool that runs the blocking Firestore and auth calls off the event loop
+FIRESTORE_MAX_WORKERS = int(os.environ.get('F1_FIRESTORE_MAX_WORKERS', '16'))
+firestore_executor = ThreadPoolExecutor(max_workers=FIRESTORE_MAX_WORKERS, thread_name_prefix='firestore')
+
+# Await a blocking call on the Firestore executor so other requests keep being
+# served; the call runs in a copy of the caller's context so it is counted
+# against the caller's request
+async def run_blocking(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(firestore_executor, functools.partial(context.run, func, *args, **kwargs))
+
+# Verified Firebase claims, keyed by a hash of the ID token and kept until the token's exp
+TOKEN_CACHE_MAX_ENTRIES = int(os.environ.get('F1_TOKEN_CACHE_MAX_ENTRIES', '10000'))
+
+class TokenCache:
+    def __init__(self, max_entries: int = TOKEN_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(id_token: str) -> str:
+        return hashlib.sha256(id_token.encode('utf-8')).hexdigest()
+
+    def get(self, id_token: str) -> Optional[Dict[str, Any]]:
+        key = self._key(id_token)
+        with self._lock:
+            claims = self._entries.get(key)
+            if claims is None:
+                return None
+            if claims.get('exp', 0) <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return claims
+
+    def put(self, id_token: str, claims: Dict[str, Any]):
+        key = self._key(id_token)
+        with self._lock:
+            self._entries[key] = claims
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+token_cache = TokenCache()
+
+# Function to verify a Firebase ID token, reusing claims already verified for it
+def verify_token(id_token: str) -> Dict[str, Any]:
+    claims = token_cache.get(id_token)
+    if claims is None:
+        start = time.perf_counter()
+        try:
+            claims = google.oauth2.id_token.verify_firebase_token(id_token, firebase_request_adapter)
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.observe('f1_token_verify_seconds', "Firebase ID token verification time", elapsed)
+            record_request(token_verify_seconds=elapsed)
+        if not claims:
+            raise ValueError("Invalid token")
+        token_cache.put(id_token, claims)
+    return claims
+
+# Shared auth dependency: (user_token, error_message) for the request's token cookie
+async def get_auth(request: Request) -> tuple:
+    id_token = request.cookies.get("token")
+    if not id_token:
+        return None, None
+
+    claims = token_cache.get(id_token)
+    if claims is not None:
+        return claims, None
+
+    try:
+        return await run_blocking(verify_token, id_token), None
+    except ValueError as err:
+        print(str(err))
+        return None, str(err)
+
+# Numeric fields that can be queried, with the type each is stored as
+DRIVER_NUMERIC_FIELDS = {
+    "age": int,
+    "total_pole_positions": int,
+    "total_race_wins": int,
+    "total_points_scored": float,
+    "total_world_titles": int,
+    "total_fastest_laps": int
+}
+
+TEAM_NUMERIC_FIELDS = {
+    "year_founded": int,
+    "total_pole_positions": int,
+    "total_race_wins": int,
+    "total_constructor_titles": int,
+    "previous_season_position": int
+}
+
+# Query comparisons mapped to the Firestore operator and the matching Python test
+QUERY_COMPARISONS = {
+    'lt': ('<', operator.lt),
+    'eq': ('==', operator.eq),
+    'gt': ('>', operator.gt)
+}
+
+QUERY_RESULT_LIMIT = int(os.environ.get('F1_QUERY_RESULT_LIMIT', '500'))
+
+# Listing and query pages
+PAGE_SIZE_DEFAULT = int(os.environ.get('F1_PAGE_SIZE_DEFAULT', '50'))
+PAGE_SIZE_MAX = int(os.environ.get('F1_PAGE_SIZE_MAX', '200'))
+
+def clamp_page_size(page_size: Optional[int]) -> int:
+    if not page_size or page_size < 1:
+        return PAGE_SIZE_DEFAULT
+    return min(page_size, PAGE_SIZE_MAX)
+
+# One page of records read through an index. `cursor` is the last id the index
+# returned for it, so paging goes on past a document deleted between the index
+# read and the fetch; None when the index had no more ids.
+class Page(list):
+    def __init__(self, items: list, cursor: Optional[str] = None):
+        super().__init__(items)
+        self.cursor = cursor
+
+# Cursor for the page after `items`, or None when this was the last page
+def next_cursor(items: list, page_size: int) -> Optional[str]:
+    if isinstance(items, Page):
+        return items.cursor
+    return items[-1]['id'] if len(items) == page_size else None
+
+# Normalized form of a driver or team name, used for every uniqueness check
+def normalize_name(name: str) -> str:
+    return name.strip().lower()
+
+# Raised when a create or rename would duplicate an existing name
+class NameTakenError(ValueError):
+    pass
+
+# Raised when a page cursor names a document there is no position for
+class StaleCursorError(ValueError):
+    pass
+
+# How many removed ids a sorted index remembers the last position of, so a
+# cursor naming a document deleted since its page was served still resumes
+DEPARTED_CURSOR_LIMIT = 1024
+
+# Sorted index over one numeric attribute. Values and ids are kept in two
+# parallel lists ordered by (value, id), so a range query is a bisect and a slice.
+class SortedIndex:
+    def __init__(self, field_type: type):
+        self.field_type = field_type
+        self._values = []
+        self._ids = []
+        self._value_by_id = {}
+        self._departed = OrderedDict()
+
+    def _coerce(self, value: Any):
+        try:
+            return self.field_type(value)
+        except (TypeError, ValueError):
+            return None
+
+    def build(self, items):
+        entries = []
+        for doc_id, value in items:
+            value = self._coerce(value)
+            if value is not None:
+                entries.append((value, doc_id))
+        entries.sort()
+        previous = self._value_by_id
+        self._values = [value for value, _ in entries]
+        self._ids = [doc_id for _, doc_id in entries]
+        self._value_by_id = {doc_id: value for value, doc_id in entries}
+        for doc_id, value in previous.items():
+            if doc_id not in self._value_by_id:
+                self._depart(doc_id, value)
+        for doc_id in self._value_by_id:
+            self._departed.pop(doc_id, None)
+
+    def add(self, doc_id: str, value: Any):
+        self.remove(doc_id)
+        value = self._coerce(value)
+        if value is None:
+            return
+        i = self._position(value, doc_id)
+        self._values.insert(i, value)
+        self._ids.insert(i, doc_id)
+        self._value_by_id[doc_id] = value
+        self._departed.pop(doc_id, None)
+
+    def remove(self, doc_id: str):
+        value = self._value_by_id.pop(doc_id, None)
+        if value is None:
+            return
+        i = self._position(value, doc_id)
+        del self._values[i]
+        del self._ids[i]
+        self._depart(doc_id, value)
+
+    # Remember where a removed id was, dropping the oldest beyond the limit
+    def _depart(self, doc_id: str, value):
+        self._departed[doc_id] = value
+        self._departed.move_to_end(doc_id)
+        if len(self._departed) > DEPARTED_CURSOR_LIMIT:
+            self._departed.popitem(last=False)
+
+    # Position of (value, doc_id) in the (value, id) ordering
+    def _position(self, value, doc_id: str) -> int:
+        lo = bisect.bisect_left(self._values, value)
+        hi = bisect.bisect_right(self._values, value, lo)
+        return bisect.bisect_left(self._ids, doc_id, lo, hi)
+
+    # Bounds in the sorted order of the ids matching `<comparison> value`;
+    # 'prefix' matches string values starting with `value`
+    def span(self, comparison: str, value) -> tuple:
+        if comparison == 'lt':
+            return 0, bisect.bisect_left(self._values, value)
+        if comparison == 'eq':
+            return bisect.bisect_left(self._values, value), bisect.bisect_right(self._values, value)
+        if comparison == 'gt':
+            return bisect.bisect_right(self._values, value), len(self._values)
+        if comparison == 'between':
+            low, high = value
+            return bisect.bisect_left(self._values, low), bisect.bisect_right(self._values, high)
+        if comparison == 'prefix':
+            return bisect.bisect_left(self._values, value), bisect.bisect_left(self._values, value + '\uffff')
+        raise ValueError(f"Unknown comparison '{comparison}'")
+
+    # Ids between the bounds, resuming after the `start_after` id when it is
+    # given; an id removed since then resumes from where it was
+    def slice(self, start: int, stop: int, start_after: Optional[str] = None, limit: Optional[int] = None) -> list:
+        if start_after is not None:
+            if start_after in self._value_by_id:
+                start = max(start, self._position(self._value_by_id[start_after], start_after) + 1)
+            elif start_after in self._departed:
+                start = max(start, self._position(self._departed[start_after], start_after))
+            else:
+                raise StaleCursorError(f"Cursor '{start_after}' is no longer valid, start again from the first page")
+        if limit is not None:
+            stop = min(stop, start + limit)
+        return self._ids[start:stop]
+
+    def lt(self, value) -> list:
+        return self.slice(*self.span('lt', value))
+
+    def eq(self, value) -> list:
+        return self.slice(*self.span('eq', value))
+
+    def gt(self, value) -> list:
+        return self.slice(*self.span('gt', value))
+
+    # Ids with low <= value <= high; either bound may be None for an open range
+    def between(self, low=None, high=None) -> list:
+        start = 0 if low is None else bisect.bisect_left(self._values, low)
+        stop = len(self._values) if high is None else bisect.bisect_right(self._values, high)
+        return self._ids[start:stop]
+
+    # The k highest ids (lowest when `descending` is False), best first
+    def top(self, k: int, descending: bool = True) -> list:
+        if descending:
+            return self._ids[max(len(self._ids) - k, 0):][::-1]
+        return self._ids[:k]
+
+    # Competition rank (1 + the number of strictly better values), the value
+    # and the percentage of entries this one is at least as good as
+    def rank(self, doc_id: str, descending: bool = True) -> Optional[Dict[str, Any]]:
+        value = self._value_by_id.get(doc_id)
+        if value is None:
+            return None
+        total = len(self._values)
+        if descending:
+            better = total - bisect.bisect_right(self._values, value)
+            not_better = bisect.bisect_right(self._values, value)
+        else:
+            better = bisect.bisect_left(self._values, value)
+            not_better = total - better
+        return {'rank': better + 1, 'value': value, 'total': total, 'percentile': round(100 * not_better / total, 2)}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+# The sorted indexes for every numeric field of a collection
+class CollectionIndex:
+    def __init__(self, numeric_fields: Dict[str, type], group_field: Optional[str] = None):
+        self.numeric_fields = numeric_fields
+        self.indexes = {field: SortedIndex(field_type) for field, field_type in numeric_fields.items()}
+        self.names = {}
+        self._name_by_id = {}
+        self.name_order = SortedIndex(str)
+        self.group_field = group_field
+        self._groups = {}
+        self._group_by_id = {}
+        self.ready = False
+        self._lock = threading.Lock()
+
+    # Rebuild every index from a bulk load of the collection
+    def build(self, docs: list):
+        with self._lock:
+            for field, index in self.indexes.items():
+                index.build((doc['id'], doc[field]) for doc in docs if field in doc)
+            self.names = {}
+            self._name_by_id = {}
+            for doc in docs:
+                if doc.get('name'):
+                    key = normalize_name(doc['name'])
+                    self.names[key] = doc['id']
+                    self._name_by_id[doc['id']] = key
+            self.name_order.build((doc_id, key) for doc_id, key in self._name_by_id.items())
+            self._groups = {}
+            self._group_by_id = {}
+            if self.group_field:
+                for doc in docs:
+                    self._set_group(doc['id'], doc.get(self.group_field))
+            self.ready = True
+
+    def _set_name(self, doc_id: str, name: str):
+        self._drop_name(doc_id)
+        key = normalize_name(name)
+        self.names[key] = doc_id
+        self._name_by_id[doc_id] = key
+        self.name_order.add(doc_id, key)
+
+    def _drop_name(self, doc_id: str):
+        key = self._name_by_id.pop(doc_id, None)
+        if key is not None and self.names.get(key) == doc_id:
+            del self.names[key]
+        self.name_order.remove(doc_id)
+
+    def _set_group(self, doc_id: str, group: Optional[str]):
+        self._drop_group(doc_id)
+        if group:
+            self._groups.setdefault(group, set()).add(doc_id)
+            self._group_by_id[doc_id] = group
+
+    def _drop_group(self, doc_id: str):
+        group = self._group_by_id.pop(doc_id, None)
+        if group is not None:
+            self._groups[group].discard(doc_id)
+            if not self._groups[group]:
+                del self._groups[group]
+
+    # Index the given fields of a document; fields not passed are left as they are
+    def update(self, doc_id: str, fields: Dict[str, Any]):
+        with self._lock:
+            for field, index in self.indexes.items():
+                if field in fields:
+                    index.add(doc_id, fields[field])
+            if fields.get('name'):
+                self._set_name(doc_id, fields['name'])
+            if self.group_field and self.group_field in fields:
+                self._set_group(doc_id, fields[self.group_field])
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            for index in self.indexes.values():
+                index.remove(doc_id)
+            self._drop_name(doc_id)
+            self._drop_group(doc_id)
+
+    # Ids of the documents whose group field equals `group`, in id order
+    def members(self, group: str) -> list:
+        with self._lock:
+            return sorted(self._groups.get(group, ()))
+
+    # Id of the document holding this name, compared case-insensitively
+    def name_owner(self, name: str) -> Optional[str]:
+        with self._lock:
+            return self.names.get(normalize_name(name))
+
+    # Ids matching `attribute <comparison> value`, in ascending attribute order
+    def query(self, attribute: str, comparison: str, value: Any,
+              start_after: Optional[str] = None, limit: Optional[int] = None) -> list:
+        if attribute not in self.indexes:
+            raise ValueError(f"Cannot query on attribute '{attribute}'")
+        if comparison not in QUERY_COMPARISONS:
+            raise ValueError(f"Unknown comparison '{comparison}'")
+        query_value = self.numeric_fields[attribute](value)
+        with self._lock:
+            index = self.indexes[attribute]
+            return index.slice(*index.span(comparison, query_value), start_after, limit)
+
+    # Bounds of the ids matching one query predicate; 'in' gives one span per value
+    def _spans(self, attribute: str, comparison: str, value: Any) -> list:
+        index = self.indexes[attribute]
+        if comparison == 'in':
+            return [index.span('eq', item) for item in sorted(set(value))]
+        return [index.span(comparison, value)]
+
+    # Number of ids matching a predicate, used by the query planner
+    def count(self, attribute: str, comparison: str, value: Any) -> int:
+        with self._lock:
+            return sum(stop - start for start, stop in self._spans(attribute, comparison, value))
+
+    def match_ids(self, attribute: str, comparison: str, value: Any) -> list:
+        with self._lock:
+            index = self.indexes[attribute]
+            ids = []
+            for start, stop in self._spans(attribute, comparison, value):
+                ids.extend(index.slice(start, stop))
+            return ids
+
+    # Ids in name order, optionally only names starting with `prefix`
+    def by_name(self, prefix: str = '', start_after: Optional[str] = None, limit: Optional[int] = None) -> list:
+        with self._lock:
+            return self.name_order.slice(*self.name_order.span('prefix', normalize_name(prefix)), start_after, limit)
+
+    def between(self, attribute: str, low=None, high=None) -> list:
+        with self._lock:
+            return self.indexes[attribute].between(low, high)
+
+    def top(self, attribute: str, k: int, descending: bool = True) -> list:
+        if attribute not in self.indexes:
+            raise ValueError(f"Cannot rank on attribute '{attribute}'")
+        with self._lock:
+            return self.indexes[attribute].top(k, descending)
+
+    def rank(self, attribute: str, doc_id: str, descending: bool = True) -> Optional[Dict[str, Any]]:
+        if attribute not in self.indexes:
+            raise ValueError(f"Cannot rank on attribute '{attribute}'")
+        with self._lock:
+            return self.indexes[attribute].rank(doc_id, descending)
+
+# Shared behaviour of the record types. Records are slotted, so a cached
+# collection holds no per-document __dict__, and numeric fields are coerced
+# to their declared types once, when a record is loaded. Values that cannot
+# be coerced are kept as stored; missing fields are None and left out of to_dict.
+class Record:
+    __slots__ = ()
+    numeric_fields: Dict[str, type] = {}
+
+    @classmethod
+    def from_dict(cls, doc_id: Optional[str], data: Dict[str, Any]):
+        record = cls.__new__(cls)
+        for field in cls.__slots__:
+            value = data.get(field)
+            field_type = cls.numeric_fields.get(field)
+            if field_type is not None and value is not None and not isinstance(value, field_type):
+                try:
+                    value = field_type(value)
+                except (TypeError, ValueError):
+                    pass
+            setattr(record, field, value)
+        record.id = doc_id
+        return record
+
+    @classmethod
+    def from_snapshot(cls, doc):
+        return cls.from_dict(doc.id, doc.to_dict())
+
+    def get(self, field: str, default: Any = None) -> Any:
+        value = getattr(self, field, None)
+        return default if value is None else value
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {}
+        for field in self.__slots__:
+            value = getattr(self, field)
+            if value is not None:
+                data[field] = value
+        return data
+
+    # Hash of the record's data, the same on every instance
+    def fingerprint(self) -> str:
+        body = orjson.dumps(self.to_dict(), option=orjson.OPT_SORT_KEYS, default=str)
+        return hashlib.sha256(body).hexdigest()[:16]
+
 # Driver model
-class Driver:
+class Driver(Record):
+    __slots__ = ('id', 'name', 'name_lower', 'age', 'total_pole_positions', 'total_race_wins',
+                 'total_points_scored', 'total_world_titles', 'total_fastest_laps', 'team_id')
+    numeric_fields = DRIVER_NUMERIC_FIELDS
+
     def __init__(
         self,
         name: str,
@@ -36,9 +923,12 @@ class Driver:
         total_points_scored: float,
         total_world_titles: int,
         total_fastest_laps: int,
-        team_id: str 
+        team_id: str,
+        id: Optional[str] = None
     ):
+        self.id = id
         self.name = name
+        self.name_lower = normalize_name(name)
         self.age = age
         self.total_pole_positions = total_pole_positions
         self.total_race_wins = total_race_wins
@@ -46,21 +936,13 @@ class Driver:
         self.total_world_titles = total_world_titles
         self.total_fastest_laps = total_fastest_laps
         self.team_id = team_id
-    
-    def to_dict(self) -> Dict[str, Any]:
-        return {
-            "name": self.name,
-            "age": self.age,
-            "total_pole_positions": self.total_pole_positions,
-            "total_race_wins": self.total_race_wins,
-            "total_points_scored": self.total_points_scored,
-            "total_world_titles": self.total_world_titles,
-            "total_fastest_laps": self.total_fastest_laps,
-            "team_id": self.team_id
-        }
 
 # Team model
-class Team:
+class Team(Record):
+    __slots__ = ('id', 'name', 'name_lower', 'year_founded', 'total_pole_positions', 'total_race_wins',
+                 'total_constructor_titles', 'previous_season_position')
+    numeric_fields = TEAM_NUMERIC_FIELDS
+
     def __init__(
         self,
         name: str,
@@ -68,103 +950,1560 @@ class Team:
         total_pole_positions: int,
         total_race_wins: int,
         total_constructor_titles: int,
-        previous_season_position: int
+        previous_season_position: int,
+        id: Optional[str] = None
     ):
+        self.id = id
         self.name = name
+        self.name_lower = normalize_name(name)
         self.year_founded = year_founded
         self.total_pole_positions = total_pole_positions
         self.total_race_wins = total_race_wins
         self.total_constructor_titles = total_constructor_titles
         self.previous_season_position = previous_season_position
-    
-    def to_dict(self) -> Dict[str, Any]:
+
+# Cache settings, overridable through the environment
+CACHE_TTL_SECONDS = float(os.environ.get('F1_CACHE_TTL_SECONDS', '300'))
+CACHE_MAX_ENTRIES = int(os.environ.get('F1_CACHE_MAX_ENTRIES', '5000'))
+
+# In-process read-through cache in front of a Firestore collection, holding
+# one `record_type` record per document and handing out dicts. Entries
+# expire after `ttl` seconds and the least recently used entries are
+# evicted beyond `max_entries`. Writers keep it current through put/merge/remove,
+# which also keep the collection's sorted indexes in step and notify any
+# `listeners` with (doc_id, changed fields); doc_id is None after a full reload.
+# `version` goes up on every change, so anything derived from the cached data
+# can be keyed on it.
+# While `synced` is set a CollectionSync keeps the cache an exact replica of
+# the collection, so entries never expire or get evicted and misses are final.
+class CollectionCache:
+    def __init__(self, client, collection_ref, record_type: type, index: Optional[CollectionIndex] = None,
+                 ttl: float = CACHE_TTL_SECONDS, max_entries: int = CACHE_MAX_ENTRIES):
+        self.client = client
+        self.collection_ref = collection_ref
+        self.record_type = record_type
+        self.index = index
+        self.listeners = []
+        self.version = 0
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._loaded_at = None
+        self._indexed_at = None
+        self._reload_lock = threading.Lock()
+        self._digests = {}
+        self._digest = 0
+        self.synced = False
+        self._lock = threading.Lock()
+
+    def _is_fresh(self, stored_at: float) -> bool:
+        return self.synced or time.monotonic() - stored_at < self.ttl
+
+    # Keep the collection digest, the XOR of every entry's record digest, in
+    # step with one entry; a record of None drops the entry's digest. Returns
+    # whether the entry changed.
+    def _track(self, doc_id: str, record: Optional[Record]) -> bool:
+        previous = self._digests.pop(doc_id, None)
+        self._digest ^= previous or 0
+        digest = None
+        if record is not None:
+            digest = int(record.fingerprint(), 16)
+            self._digests[doc_id] = digest
+            self._digest ^= digest
+        return digest != previous
+
+    def _store(self, doc_id: str, record: Record) -> bool:
+        self._entries[doc_id] = (time.monotonic(), record)
+        self._entries.move_to_end(doc_id)
+        changed = self._track(doc_id, record)
+        while not self.synced and len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            self._track(evicted, None)
+            # the cache no longer holds the whole collection
+            self._loaded_at = None
+        return changed
+
+    # Return every document as a record, streaming the collection only when the cache is cold
+    def records(self) -> list:
+        with self._lock:
+            if self._loaded_at is not None and self._is_fresh(self._loaded_at):
+                return [record for _, record in self._entries.values()]
+        return self.reload()
+
+    # Stream the whole collection into the cache, rebuilding the index
+    def reload(self) -> list:
+        records = [self.record_type.from_snapshot(doc) for doc in self.collection_ref.stream()]
+        self.load(records)
+        return records
+
+    def _index_stale(self) -> bool:
+        with self._lock:
+            return not self.synced and (self._indexed_at is None or time.monotonic() - self._indexed_at >= self.ttl)
+
+    # Whether the index can answer for the collection. Writes from other
+    # instances only reach it through a live sync, so without one an index
+    # older than the TTL is rebuilt from a fresh load first, by one caller
+    # while the others wait.
+    def index_ready(self) -> bool:
+        if self.index is None or not self.index.ready:
+            return False
+        if self._index_stale():
+            with self._reload_lock:
+                if self._index_stale():
+                    self.reload()
+        return True
+
+    # Build the index when it is cold, or refresh it when it is stale
+    def ensure_index(self):
+        if not self.index_ready():
+            with self._reload_lock:
+                if self.index is not None and not self.index.ready:
+                    self.reload()
+
+    # Replace the contents with a full load of the collection; `synced` marks
+    # the cache as a live replica from here on
+    def load(self, records: list, synced: bool = False):
+        if self.index is not None:
+            self.index.build([record.to_dict() for record in records])
+        with self._lock:
+            self._entries.clear()
+            self._digests.clear()
+            self._digest = 0
+            self.synced = self.synced or synced
+            stored = records if self.synced else records[:self.max_entries]
+            for record in stored:
+                self._store(record.id, record)
+            self._loaded_at = time.monotonic() if len(stored) == len(records) else None
+            self._indexed_at = time.monotonic() if self.index is not None else None
+        self._notify(None, {})
+
+    # Return every document
+    def all(self) -> list:
+        return [record.to_dict() for record in self.records()]
+
+    # Return one document or None, reading through to Firestore on a miss
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(doc_id)
+            if entry is not None and self._is_fresh(entry[0]):
+                self._entries.move_to_end(doc_id)
+                return entry[1].to_dict()
+            if self.synced:
+                return None
+
+        doc = self.collection_ref.document(doc_id).get()
+        if not doc.exists:
+            self.remove(doc_id)
+            return None
+        record = self.record_type.from_snapshot(doc)
+        self.remember(record)
+        return record.to_dict()
+
+    # Return the documents for several ids, fetching all misses in one get_all round trip
+    def get_many(self, doc_ids) -> Dict[str, Dict[str, Any]]:
+        found = {}
+        missing = []
+        with self._lock:
+            for doc_id in dict.fromkeys(doc_ids):
+                entry = self._entries.get(doc_id)
+                if entry is not None and self._is_fresh(entry[0]):
+                    self._entries.move_to_end(doc_id)
+                    found[doc_id] = entry[1].to_dict()
+                elif not self.synced:
+                    missing.append(doc_id)
+
+        if missing:
+            refs = [self.collection_ref.document(doc_id) for doc_id in missing]
+            for doc in self.client.get_all(refs):
+                if doc.exists:
+                    record = self.record_type.from_snapshot(doc)
+                    self.remember(record)
+                    found[doc.id] = record.to_dict()
+        return found
+
+    # Return a record only if it is cached and fresh, never reading Firestore
+    def peek(self, doc_id: str) -> Optional[Record]:
+        with self._lock:
+            entry = self._entries.get(doc_id)
+            if entry is not None and self._is_fresh(entry[0]):
+                return entry[1]
+        return None
+
+    # Hash of the whole collection, or of just the documents in `doc_ids`,
+    # known only while synced. Digests are kept up to date as entries change,
+    # so this costs nothing for the collection and O(len(doc_ids)) otherwise.
+    def fingerprint(self, doc_ids: Optional[list] = None) -> Optional[str]:
+        with self._lock:
+            if not self.synced:
+                return None
+            if doc_ids is None:
+                return f"{self._digest:016x}"
+            return f"{functools.reduce(operator.xor, (self._digests.get(doc_id, 0) for doc_id in doc_ids), 0):016x}"
+
+    # Store a record read from Firestore; the version only moves if it differs
+    # from the cached copy
+    def remember(self, record: Record):
+        with self._lock:
+            if self._store(record.id, record):
+                self.version += 1
+        if self.index is not None:
+            self.index.update(record.id, record.to_dict())
+
+    def _notify(self, doc_id: Optional[str], fields: Dict[str, Any]):
+        self.version += 1
+        for listener in self.listeners:
+            listener(doc_id, fields)
+
+    # Store a document that was just written
+    def put(self, doc_id: str, data: Dict[str, Any]):
+        self.remember(self.record_type.from_dict(doc_id, data))
+        self._notify(doc_id, data)
+
+    # Apply a partial update to a cached document, mirroring DocumentReference.update
+    def merge(self, doc_id: str, fields: Dict[str, Any]):
+        with self._lock:
+            entry = self._entries.get(doc_id)
+            if entry is not None:
+                data = entry[1].to_dict()
+                data.update(fields)
+                record = self.record_type.from_dict(doc_id, data)
+                self._entries[doc_id] = (entry[0], record)
+                self._track(doc_id, record)
+        if self.index is not None:
+            self.index.update(doc_id, fields)
+        self._notify(doc_id, fields)
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            self._entries.pop(doc_id, None)
+            self._track(doc_id, None)
+        if self.index is not None:
+            self.index.remove(doc_id)
+        self._notify(doc_id, {})
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._digests.clear()
+            self._digest = 0
+            self._loaded_at = None
+            self._indexed_at = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+drivers_index = CollectionIndex(DRIVER_NUMERIC_FIELDS, group_field='team_id')
+teams_index = CollectionIndex(TEAM_NUMERIC_FIELDS)
+
+drivers_cache = CollectionCache(db, drivers_ref, Driver, drivers_index)
+teams_cache = CollectionCache(db, teams_ref, Team, teams_index)
+
+# Rendered template fragments keyed by the data they were built from, so a
+# fragment is rendered once per distinct content instead of once per request.
+# Fragments of data that has since changed are never hit again and age out.
+FRAGMENT_CACHE_MAX_ENTRIES = int(os.environ.get('F1_FRAGMENT_CACHE_MAX_ENTRIES', '500'))
+
+class FragmentCache:
+    def __init__(self, env, max_entries: int = FRAGMENT_CACHE_MAX_ENTRIES):
+        self.env = env
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def render(self, template_name: str, key: tuple, **context) -> Markup:
+        cache_key = (template_name, key)
+        with self._lock:
+            html = self._entries.get(cache_key)
+            if html is not None:
+                self._entries.move_to_end(cache_key)
+                metrics.inc('f1_fragment_cache_hits_total', "Template fragments served from the cache",
+                            (('template', template_name),))
+                return html
+
+        html = Markup(self.env.get_template(template_name).render(**context))
+        with self._lock:
+            self._entries[cache_key] = html
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        metrics.inc('f1_fragment_cache_misses_total', "Template fragments rendered", (('template', template_name),))
+        return html
+
+fragments = FragmentCache(templates.env)
+
+# Render the <option> tags for a page of records from `cache`, keyed on what
+# the tags show so a write racing the render cannot file stale markup under a
+# new key
+def option_tags(cache: CollectionCache, items: list, selected_id: Optional[str] = None) -> Markup:
+    key = (cache.collection_ref.id, tuple((item['id'], item['name']) for item in items), selected_id)
+    return fragments.render('fragments/options.html', key, items=items, selected_id=selected_id)
+
+templates.env.globals['team_option_tags'] = functools.partial(option_tags, teams_cache)
+templates.env.globals['driver_option_tags'] = functools.partial(option_tags, drivers_cache)
+
+# Keeps a collection cache in step with Firestore through an on_snapshot
+# watch, so writes made by other instances show up here within moments. The
+# first snapshot replaces the cache with the whole collection; later ones
+# apply just the changed documents, notifying the cache's listeners as local
+# writes do. Watch callbacks run on the Firestore client's own thread.
+# A watch whose stream has closed, or whose snapshot could not be applied, no
+# longer keeps the cache in step: check() notices, stops treating the cache
+# as synced and opens a new watch, which reloads the whole collection.
+class CollectionSync:
+    def __init__(self, cache: CollectionCache):
+        self.cache = cache
+        self.ready = False
+        self.running = False
+        self.last_sync = None
+        self.last_error = None
+        self.changes_applied = 0
+        self.restarts = 0
+        self._watch = None
+        self._failed = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            self.running = True
+            if self._watch is None:
+                self._failed = False
+                self._watch = self.cache.collection_ref.on_snapshot(self._on_snapshot)
+
+    def _close(self):
+        watch, self._watch = self._watch, None
+        self.cache.synced = False
+        self.ready = False
+        if watch is not None:
+            try:
+                watch.unsubscribe()
+            except Exception as e:
+                print(f"ERROR: closing {self.cache.collection_ref.id} watch: {e}")
+
+    def stop(self):
+        with self._lock:
+            self.running = False
+            self._close()
+
+    # Whether the sync should be running but its watch is gone, closed or failed
+    def broken(self) -> bool:
+        watch = self._watch
+        return self.running and (watch is None or self._failed or not getattr(watch, 'is_active', True))
+
+    # Replace a broken watch with a new one. Returns whether it did.
+    def check(self) -> bool:
+        with self._lock:
+            if not self.broken():
+                return False
+            print(f"WARNING: {self.cache.collection_ref.id} watch is down, restarting it")
+            self._close()
+            self.restarts += 1
+        self.start()
+        return True
+
+    def _on_snapshot(self, docs, changes, read_time):
+        try:
+            if not self.ready:
+                self.cache.load([self.cache.record_type.from_snapshot(doc) for doc in docs], synced=True)
+                self.ready = True
+            else:
+                for change in changes:
+                    if change.type.name == 'REMOVED':
+                        self.cache.remove(change.document.id)
+                    else:
+                        self.cache.put(change.document.id, change.document.to_dict())
+                self.changes_applied += len(changes)
+            self.last_sync = time.time()
+        except Exception as e:
+            print(f"ERROR: applying {self.cache.collection_ref.id} snapshot: {e}")
+            self.last_error = str(e)
+            # a change was lost, so the cache no longer matches Firestore
+            self._failed = True
+            self.cache.synced = False
+            self.ready = False
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'ready': self.ready,
+            'watch_active': self.running and not self.broken(),
+            'documents': len(self.cache),
+            'changes_applied': self.changes_applied,
+            'restarts': self.restarts,
+            'last_sync': self.last_sync,
+            'last_snapshot_age_seconds': round(time.time() - self.last_sync, 3) if self.last_sync else None,
+            'last_error': self.last_error
+        }
+
+# Live sync is on by default; with it off the caches fall back to TTL expiry
+LIVE_SYNC = os.environ.get('F1_LIVE_SYNC', '1') == '1'
+
+drivers_sync = CollectionSync(drivers_cache)
+teams_sync = CollectionSync(teams_cache)
+
+# How often the lifespan task looks for live syncs whose watch went down
+SYNC_CHECK_SECONDS = float(os.environ.get('F1_SYNC_CHECK_SECONDS', '10'))
+
+async def monitor_syncs():
+    while True:
+        await asyncio.sleep(SYNC_CHECK_SECONDS)
+        for sync in (drivers_sync, teams_sync):
+            try:
+                await run_blocking(sync.check)
+            except Exception as e:
+                print(f"ERROR: restarting {sync.cache.collection_ref.id} watch: {e}")
+
+# Background warm-up, started by the lifespan hook so the server accepts
+# connections straight away. It compiles the templates, opens the Firestore
+# client, fetches the Firebase signing certs and loads both collections:
+# through the live sync, or one bulk load each when that is off. Failed steps
+# are retried. /ready answers 200 only once every step is done, so the load
+# balancer holds traffic back until then.
+WARM_UP_RETRY_SECONDS = float(os.environ.get('F1_WARM_UP_RETRY_SECONDS', '5'))
+# A watch that has not delivered its first snapshot by then is restarted
+WARM_UP_SYNC_TIMEOUT_SECONDS = float(os.environ.get('F1_WARM_UP_SYNC_TIMEOUT_SECONDS', '30'))
+
+class InstanceWarmUp:
+    def __init__(self):
+        self.steps = {'templates': False, 'firestore': False, 'certs': False, 'drivers': False, 'teams': False}
+        self.started = None
+        self.finished = None
+        self._tasks = []
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._tasks = [asyncio.create_task(self.run())]
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+
+    async def _retry(self, step: str, function, *args):
+        while True:
+            try:
+                if asyncio.iscoroutinefunction(function):
+                    result = await function(*args)
+                else:
+                    result = await run_blocking(function, *args)
+                self.steps[step] = True
+                return result
+            except Exception as e:
+                print(f"ERROR: warm-up step {step}: {e}")
+                await asyncio.sleep(WARM_UP_RETRY_SECONDS)
+
+    # Start the watch and wait for its first snapshot, stopping it if that
+    # takes too long so the retry opens a fresh one
+    async def _sync(self, sync: CollectionSync):
+        await run_blocking(sync.start)
+        deadline = time.monotonic() + WARM_UP_SYNC_TIMEOUT_SECONDS
+        while not sync.ready:
+            if time.monotonic() > deadline:
+                await run_blocking(sync.stop)
+                raise TimeoutError(f"no snapshot of {sync.cache.collection_ref.id} "
+                                   f"after {WARM_UP_SYNC_TIMEOUT_SECONDS:.0f}s")
+            await asyncio.sleep(0.05)
+
+    async def _load(self, step: str, sync: CollectionSync):
+        if LIVE_SYNC:
+            await self._retry(step, self._sync, sync)
+        else:
+            await self._retry(step, sync.cache.all)
+
+    async def _open_firestore(self):
+        await self._retry('firestore', db.connect)
+        await asyncio.gather(self._load('drivers', drivers_sync), self._load('teams', teams_sync))
+
+    async def run(self):
+        precompile_templates()
+        self.steps['templates'] = True
+        await asyncio.gather(self._open_firestore(), self._retry('certs', fetch_firebase_certs))
+        self.finished = time.perf_counter()
+        metrics.observe('f1_warm_up_seconds', "Time from startup to ready", self.finished - self.started)
+        print(f"Ready after {self.finished - self.started:.2f}s (import took {IMPORT_SECONDS:.2f}s)")
+
+    def ready(self) -> bool:
+        return all(self.steps.values())
+
+    def status(self) -> Dict[str, Any]:
         return {
-            "name": self.name,
-            "year_founded": self.year_founded,
-            "total_pole_positions": self.total_pole_positions,
-            "total_race_wins": self.total_race_wins,
-            "total_constructor_titles": self.total_constructor_titles,
-            "previous_season_position": self.previous_season_position
+            'ready': self.ready(),
+            'steps': self.steps,
+            'import_seconds': round(IMPORT_SECONDS, 3),
+            'warm_up_seconds': round(self.finished - self.started, 3) if self.finished else None
         }
 
+warm_up = InstanceWarmUp()
+
+# HTTP caching for HTML pages. Each route registered with @conditional_route
+# has a version function that describes the data the page renders using only
+# what the caches already hold: document and collection fingerprints, which
+# match across instances. The middleware turns that, the page URL, the token
+# cookie and the templates into an ETag and answers a matching If-None-Match
+# with 304 before the route runs. A version of None means the data is not
+# known without a Firestore read, and the request then runs as usual.
+CONDITIONAL_ROUTES = {}
+
+def conditional_route(path: str):
+    def register(version_function):
+        CONDITIONAL_ROUTES[path] = version_function
+        return version_function
+    return register
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get('if-none-match', '')
+    tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+    return etag in tags or if_none_match.strip() == '*'
+
+# Pages are personalised by the token cookie, so they may only be revalidated
+# by the browser that holds it
+def page_cache_headers(etag: str) -> Dict[str, str]:
+    return {'ETag': etag, 'Cache-Control': 'private, no-cache', 'Vary': 'Cookie'}
+
+def page_etag(request: Request, route_path: str) -> Optional[str]:
+    id_token = request.cookies.get('token')
+    # an unverified or expired token changes what the page shows
+    if id_token and token_cache.get(id_token) is None:
+        return None
+    version = CONDITIONAL_ROUTES[route_path](**request.path_params)
+    if version is None:
+        return None
+    parts = [TEMPLATE_FINGERPRINT, request.url.path, request.url.query,
+             hashlib.sha256((id_token or '').encode('utf-8')).hexdigest(), *version]
+    return '"' + hashlib.sha256(orjson.dumps(parts)).hexdigest()[:32] + '"'
+
+@conditional_route('/driver/{driver_id}')
+def driver_page_version(driver_id: str) -> Optional[tuple]:
+    driver = drivers_cache.peek(driver_id)
+    if driver is None:
+        return ('missing',) if drivers_cache.synced else None
+    team = teams_cache.peek(driver.team_id) if driver.team_id else None
+    if team is None and driver.team_id and not teams_cache.synced:
+        return None
+    return driver.fingerprint(), team.fingerprint() if team else ''
+
+@conditional_route('/team/{team_id}')
+def team_page_version(team_id: str) -> Optional[tuple]:
+    team = teams_cache.peek(team_id)
+    if team is None and not teams_cache.synced:
+        return None
+    # the page lists the team's drivers, so it changes with the roster and nothing else
+    roster = drivers_cache.fingerprint(drivers_index.members(team_id))
+    if roster is None:
+        return None
+    return team.fingerprint() if team else 'missing', roster
+
+@conditional_route('/query-drivers')
+@conditional_route('/query-teams')
+def query_form_version() -> tuple:
+    return ()
+
+@conditional_route('/compare-drivers')
+def compare_drivers_version() -> Optional[tuple]:
+    drivers = drivers_cache.fingerprint()
+    return None if drivers is None else (drivers,)
+
+@conditional_route('/compare-teams')
+def compare_teams_version() -> Optional[tuple]:
+    teams = teams_cache.fingerprint()
+    return None if teams is None else (teams,)
+
+# Registered before the instrumentation middleware, so it runs inside it and
+# 304s are still measured
+@app.middleware("http")
+async def conditional_get(request: Request, call_next):
+    if request.method not in ('GET', 'HEAD'):
+        return await call_next(request)
+    for route in app.router.routes:
+        if getattr(route, 'path', None) in CONDITIONAL_ROUTES:
+            match, child_scope = route.matches(request.scope)
+            if match == Match.FULL:
+                break
+    else:
+        return await call_next(request)
+
+    request.scope['path_params'] = child_scope['path_params']
+    # computed before the route runs, so a response never carries the tag of newer data than it shows
+    etag = page_etag(request, route.path)
+    if etag is not None and etag_matches(request, etag):
+        request.scope['route'] = route
+        return Response(status_code=304, headers=page_cache_headers(etag))
+
+    response = await call_next(request)
+    if etag is not None and response.status_code == 200:
+        response.headers.update(page_cache_headers(etag))
+    return response
+
+# Per-request instrumentation: duration histogram and Firestore counters by
+# route template, plus one structured log line per request
+REQUEST_LOG = os.environ.get('F1_REQUEST_LOG', '1') == '1'
+
+@app.middleware("http")
+async def record_metrics(request: Request, call_next):
+    request_metrics = RequestMetrics()
+    context_token = current_request_metrics.set(request_metrics)
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        duration = time.perf_counter() - start
+        current_request_metrics.reset(context_token)
+        route = getattr(request.scope.get('route'), 'path', 'unmatched')
+        labels = (('route', route), ('method', request.method))
+        metrics.observe('f1_request_duration_seconds', "Request duration", duration, labels)
+        metrics.inc('f1_requests_total', "Requests served", labels + (('status', status_code),))
+        metrics.inc('f1_firestore_reads_total', "Firestore documents read", labels[:1], request_metrics.firestore_reads)
+        metrics.inc('f1_firestore_writes_total', "Firestore writes issued", labels[:1], request_metrics.firestore_writes)
+        metrics.inc('f1_firestore_docs_streamed_total', "Documents streamed from Firestore queries", labels[:1],
+                    request_metrics.docs_streamed)
+        if REQUEST_LOG:
+            print(orjson.dumps({
+                'method': request.method,
+                'path': request.url.path,
+                'route': route,
+                'status': status_code,
+                'duration_ms': round(duration * 1000, 2),
+                'firestore_reads': request_metrics.firestore_reads,
+                'firestore_writes': request_metrics.firestore_writes,
+                'docs_streamed': request_metrics.docs_streamed,
+                'token_verify_ms': round(request_metrics.token_verify_seconds * 1000, 2),
+                'template_render_ms': round(request_metrics.template_render_seconds * 1000, 2)
+            }).decode())
+
+# A cursor that can no longer be resumed is a client error: answer 400 so a
+# "Load more" loop stops instead of serving the first page again
+@app.exception_handler(StaleCursorError)
+async def stale_cursor(request: Request, err: StaleCursorError):
+    return JSONResponse({'detail': str(err)}, status_code=400)
+
+# Negotiated response compression. Compressible bodies are encoded with
+# brotli when the client accepts it and the package is installed, gzip
+# otherwise. Streamed bodies are flushed chunk by chunk, so exports still
+# arrive progressively. Small bodies and already encoded ones, such as the
+# precompressed static assets, go out as they are. Added last, so it wraps
+# everything, including the instrumentation.
+COMPRESS_MIN_BYTES = int(os.environ.get('F1_COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('F1_GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('F1_BROTLI_QUALITY', '5'))
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/x-ndjson', 'application/javascript', 'image/svg+xml')
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = accepted_encodings(accept_encoding)
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+class ResponseEncoder:
+    def __init__(self, coding: str):
+        self.coding = coding
+        if coding == 'br':
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def encode(self, chunk: bytes, final: bool) -> bytes:
+        if self.coding == 'br':
+            data = self._compressor.process(chunk)
+            return data + (self._compressor.finish() if final else self._compressor.flush())
+        data = self._compressor.compress(chunk)
+        return data + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    def _should_compress(self, start: Dict[str, Any], first_body: Dict[str, Any]) -> bool:
+        headers = Headers(raw=start['headers'])
+        if 'content-encoding' in headers or not headers.get('content-type', '').startswith(COMPRESSIBLE_TYPES):
+            return False
+        if first_body.get('more_body', False):
+            size = headers.get('content-length')
+            return size is None or int(size) >= self.minimum_size
+        return len(first_body.get('body', b'')) >= self.minimum_size
+
+    async def __call__(self, scope, receive, send):
+        coding = None
+        if scope['type'] == 'http':
+            coding = choose_encoding(Headers(scope=scope).get('accept-encoding', ''))
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        encoder = None
+        sizes = [0, 0]
+
+        # The start message is held back until the first body message shows
+        # whether the response is worth compressing
+        async def send_compressed(message):
+            nonlocal start, encoder
+            if message['type'] == 'http.response.start':
+                start = message
+                return
+            if start is not None:
+                if message['type'] == 'http.response.body' and self._should_compress(start, message):
+                    encoder = ResponseEncoder(coding)
+                    headers = MutableHeaders(raw=start['headers'])
+                    del headers['content-length']
+                    headers['content-encoding'] = coding
+                    headers.add_vary_header('Accept-Encoding')
+                    # the encoded bytes differ, but the representation is the same
+                    if headers.get('etag', '').startswith('"'):
+                        headers['etag'] = 'W/' + headers['etag']
+                await send(start)
+                start = None
+            if encoder is None or message['type'] != 'http.response.body':
+                await send(message)
+                return
+
+            body = message.get('body', b'')
+            final = not message.get('more_body', False)
+            encoded = encoder.encode(body, final)
+            sizes[0] += len(body)
+            sizes[1] += len(encoded)
+            if encoded or final:
+                await send({'type': 'http.response.body', 'body': encoded, 'more_body': not final})
+            if final:
+                labels = (('route', getattr(scope.get('route'), 'path', 'unmatched')), ('encoding', coding))
+                metrics.inc('f1_compression_input_bytes_total', "Response bytes before compression", labels, sizes[0])
+                metrics.inc('f1_compression_output_bytes_total', "Response bytes after compression", labels, sizes[1])
+
+        await self.app(scope, receive, send_compressed)
+
+app.add_middleware(CompressionMiddleware)
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return Response(content=metrics.render(), media_type='text/plain; version=0.0.4')
+
+# Request-scoped, DataLoader-style document reads. Loads issued in the same
+# event loop tick are combined into one get_many per collection, i.e. at most
+# one get_all round trip, and every result is memoized for the rest of the
+# request. Routes get a fresh one per request through `get_loader`.
+class RequestLoader:
+    def __init__(self, caches: Dict[str, CollectionCache]):
+        self.caches = caches
+        self._results = {}
+        self._pending = {}
+
+    async def load(self, collection: str, doc_id: str) -> Optional[Dict[str, Any]]:
+        key = (collection, doc_id)
+        future = self._results.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            pending = self._pending.setdefault(collection, {})
+            if not pending:
+                loop.call_soon(self._dispatch, collection)
+            future = pending[doc_id] = self._results[key] = loop.create_future()
+        doc = await future
+        return dict(doc) if doc is not None else None
+
+    def _dispatch(self, collection: str):
+        pending = self._pending.pop(collection, {})
+        if pending:
+            asyncio.ensure_future(self._fetch(collection, pending))
+
+    async def _fetch(self, collection: str, pending: Dict[str, asyncio.Future]):
+        try:
+            docs = await run_blocking(self.caches[collection].get_many, list(pending))
+        except Exception as e:
+            for future in pending.values():
+                future.set_exception(e)
+            return
+        for doc_id, future in pending.items():
+            future.set_result(docs.get(doc_id))
+
+def get_loader() -> RequestLoader:
+    return RequestLoader({'drivers': drivers_cache, 'teams': teams_cache})
+
+# Reservation document for a name; hashed because names may contain '/'
+def name_reservation(names_ref, name: str):
+    return names_ref.document(hashlib.sha256(normalize_name(name).encode('utf-8')).hexdigest())
+
+# Create a document and reserve its name in one atomic batch
+def create_named_document(collection_ref, names_ref, cache: CollectionCache, data: Dict[str, Any], label: str) -> str:
+    data = dict(data, name_lower=normalize_name(data['name']))
+    doc_ref = collection_ref.document()
+    batch = db.batch()
+    batch.create(name_reservation(names_ref, data['name']), {'name_lower': data['name_lower'], 'owner_id': doc_ref.id})
+    batch.set(doc_ref, data)
+    try:
+        batch.commit()
+    except Conflict:
+        raise NameTakenError(f"{label} '{data['name']}' already exists. Please use a different name.")
+    cache.put(doc_ref.id, data)
+    return doc_ref.id
+
+# Update a document, moving its name reservation in the same batch when the name changes
+def update_named_document(collection_ref, names_ref, cache: CollectionCache, doc_id: str,
+                          data: Dict[str, Any], previous_name: Optional[str], label: str):
+    data = dict(data, name_lower=normalize_name(data['name']))
+    batch = db.batch()
+    if previous_name is not None and normalize_name(previous_name) != data['name_lower']:
+        batch.create(name_reservation(names_ref, data['name']), {'name_lower': data['name_lower'], 'owner_id': doc_id})
+        batch.delete(name_reservation(names_ref, previous_name))
+    batch.update(collection_ref.document(doc_id), data)
+    try:
+        batch.commit()
+    except Conflict:
+        raise NameTakenError(f"{label} '{data['name']}' already exists. Please use a different name.")
+    cache.merge(doc_id, data)
+
 # Function to add a driver
 def add_driver(driver_data: Dict[str, Any]) -> str:
-    doc_ref = drivers_ref.document()
-    doc_ref.set(driver_data)
-    return doc_ref.id
+    return create_named_document(drivers_ref, driver_names_ref, drivers_cache, driver_data, "Driver")
 
 # Function to add a team
 def add_team(team_data: Dict[str, Any]) -> str:
-    doc_ref = teams_ref.document()
-    doc_ref.set(team_data)
-    return doc_ref.id
+    return create_named_document(teams_ref, team_names_ref, teams_cache, team_data, "Team")
+
+# Function to update a driver
+def update_driver_record(driver_id: str, driver_data: Dict[str, Any], previous_name: Optional[str] = None):
+    update_named_document(drivers_ref, driver_names_ref, drivers_cache, driver_id, driver_data, previous_name, "Driver")
+
+# Function to update a team
+def update_team_record(team_id: str, team_data: Dict[str, Any], previous_name: Optional[str] = None):
+    update_named_document(teams_ref, team_names_ref, teams_cache, team_id, team_data, previous_name, "Team")
+
+# Function to delete a driver and release its name
+def delete_driver_record(driver_id: str):
+    driver = drivers_cache.get(driver_id)
+    batch = db.batch()
+    batch.delete(drivers_ref.document(driver_id))
+    if driver and driver.get('name'):
+        batch.delete(name_reservation(driver_names_ref, driver['name']))
+    batch.commit()
+    drivers_cache.remove(driver_id)
+
+# Maximum number of writes Firestore accepts in one batch or transaction
+FIRESTORE_WRITE_LIMIT = 500
+
+# Function to delete a team and detach its drivers. The roster updates, the
+# team delete and the name release commit together in one transaction. When
+# the roster read by the transaction is too large for one commit, every
+# driver that does not fit is detached in full WriteBatch chunks and the
+# transaction runs again on the rest. Returns False if the team does not exist.
+def delete_team_record(team_id: str) -> bool:
+    team_ref = teams_ref.document(team_id)
+    roster_query = drivers_ref.where('team_id', '==', team_id)
+    detached = []
+    overflow = []
+
+    @firestore.transactional
+    def delete_in_transaction(transaction):
+        team_doc = team_ref.get(transaction=transaction)
+        if not team_doc.exists:
+            return False
+        roster = [driver_doc.reference for driver_doc in roster_query.stream(transaction=transaction)]
+        # the team delete and the name release take two of the writes
+        if len(roster) + 2 > FIRESTORE_WRITE_LIMIT:
+            overflow[:] = roster[:len(roster) + 2 - FIRESTORE_WRITE_LIMIT]
+            return None
+
+        for driver_ref in roster:
+            transaction.update(driver_ref, {'team_id': ''})
+        transaction.delete(team_ref)
+        name = team_doc.to_dict().get('name')
+        if name:
+            transaction.delete(name_reservation(team_names_ref, name))
+        detached[:] = [driver_ref.id for driver_ref in roster]
+        return True
+
+    while True:
+        deleted = delete_in_transaction(db.transaction())
+        if deleted is not None:
+            break
+
+        for start in range(0, len(overflow), FIRESTORE_WRITE_LIMIT):
+            chunk = overflow[start:start + FIRESTORE_WRITE_LIMIT]
+            batch = db.batch()
+            for driver_ref in chunk:
+                batch.update(driver_ref, {'team_id': ''})
+            batch.commit()
+            for driver_ref in chunk:
+                drivers_cache.merge(driver_ref.id, {'team_id': ''})
+
+    for driver_id in detached:
+        drivers_cache.merge(driver_id, {'team_id': ''})
+    teams_cache.remove(team_id)
+    return deleted
+
+# Get one page of a collection in name order, optionally only names starting with
+# `prefix`. Always served from the name index, built first when it is cold: a
+# Firestore query on name_lower would skip documents written before the field
+# existed until `backfill-names` has been run over them.
+def list_page(index: CollectionIndex, cache: CollectionCache, page_size: int,
+              start_after: Optional[str] = None, prefix: str = '') -> list:
+    cache.ensure_index()
+    ids = index.by_name(prefix, start_after, page_size)
+    docs = cache.get_many(ids)
+    return Page([docs[doc_id] for doc_id in ids if doc_id in docs], ids[-1] if len(ids) == page_size else None)
+
+# Function to get one page of drivers
+def list_drivers(page_size: int = PAGE_SIZE_DEFAULT, start_after: Optional[str] = None, prefix: str = '') -> list:
+    return list_page(drivers_index, drivers_cache, page_size, start_after, prefix)
+
+# Function to get one page of teams
+def list_teams(page_size: int = PAGE_SIZE_DEFAULT, start_after: Optional[str] = None, prefix: str = '') -> list:
+    return list_page(teams_index, teams_cache, page_size, start_after, prefix)
+
+# Function to get a page of teams for a dropdown, keeping the selected team in the options.
+# Returns the options and the cursor for the next page.
+async def team_options(loader: RequestLoader, page_size: int = PAGE_SIZE_DEFAULT, start_after: Optional[str] = None,
+                       selected_id: Optional[str] = None) -> tuple:
+    if selected_id:
+        teams, selected = await asyncio.gather(run_blocking(list_teams, page_size, start_after),
+                                               loader.load('teams', selected_id))
+    else:
+        teams, selected = await run_blocking(list_teams, page_size, start_after), None
+    cursor = next_cursor(teams, page_size)
+    if selected and all(team['id'] != selected_id for team in teams):
+        teams.insert(0, selected)
+    return teams, cursor
+
+# Function to get several teams by id in a single lookup
+def get_teams_by_ids(team_ids) -> Dict[str, Dict[str, Any]]:
+    return teams_cache.get_many([team_id for team_id in team_ids if team_id])
+
+# Function to set 'team_name' on each driver, resolving all teams in one step
+def attach_team_names(drivers: list) -> list:
+    teams = get_teams_by_ids({driver.get('team_id') for driver in drivers})
+    for driver in drivers:
+        if not driver.get('team_id'):
+            driver['team_name'] = "No Team"
+        elif driver['team_id'] in teams:
+            driver['team_name'] = teams[driver['team_id']].get('name', "Unknown Team")
+        else:
+            driver['team_name'] = "Unknown Team"
+    return drivers
+
+# Function to get the drivers of one team, from the team_id index when it is
+# built, otherwise with an indexed Firestore query
+def get_team_drivers(team_id: str) -> list:
+    if drivers_cache.index_ready():
+        ids = drivers_index.members(team_id)
+        docs = drivers_cache.get_many(ids)
+        return [docs[driver_id] for driver_id in ids if driver_id in docs]
 
-# Function to get all teams
-def get_all_teams() -> list:
-    teams = []
-    for team in teams_ref.stream():
-        team_data = team.to_dict()
-        team_data['id'] = team.id
-        teams.append(team_data)
-    return teams
-
-# Function to get all drivers.
-def get_all_drivers() -> list:
     drivers = []
-    for driver in drivers_ref.stream():
-        driver_data = driver.to_dict()
-        driver_data['id'] = driver.id
-        drivers.append(driver_data)
+    for doc in drivers_ref.where('team_id', '==', team_id).stream():
+        record = Driver.from_snapshot(doc)
+        drivers_cache.remember(record)
+        drivers.append(record.to_dict())
     return drivers
 
-# Function to query drivers.
-def query_drivers(attribute: str, comparison: str, value: Any) -> list:
-    all_drivers = get_all_drivers()
-    results = []
-    
-    for driver in all_drivers:
-        
-        if attribute in driver:
-            if comparison == 'lt' and driver[attribute] < value:
-                results.append(driver)
-            elif comparison == 'gt' and driver[attribute] > value:
-                results.append(driver)
-            elif comparison == 'eq' and driver[attribute] == value:
-                results.append(driver)
-    
-    return results
+# Function to get a driver together with its team
+async def get_driver_with_team(loader: RequestLoader, driver_id: str) -> tuple:
+    driver = await loader.load('drivers', driver_id)
+    team = None
+    if driver and driver.get('team_id'):
+        team = await loader.load('teams', driver['team_id'])
+    return driver, team
+
+# Function to get a team together with its drivers, reading both at once
+async def get_team_with_drivers(loader: RequestLoader, team_id: str) -> tuple:
+    team, drivers = await asyncio.gather(loader.load('teams', team_id), run_blocking(get_team_drivers, team_id))
+    return team, drivers if team else []
+
+# Raised when two records cannot be compared with each other
+class ComparisonError(ValueError):
+    pass
+
+# Function to load two drivers and their teams for a comparison
+def load_driver_comparison(driver1_id: str, driver2_id: str) -> Dict[str, Any]:
+    if driver1_id == driver2_id:
+        raise ComparisonError("Cannot compare the driver with same name.")
+
+    drivers = drivers_cache.get_many([driver1_id, driver2_id])
+    driver1 = drivers.get(driver1_id)
+    driver2 = drivers.get(driver2_id)
+    team1 = None
+    team2 = None
+    if driver1 and driver2:
+        if driver1.get('name') == driver2.get('name'):
+            raise ComparisonError("Cannot compare drivers with the same name")
+        teams = get_teams_by_ids([driver1.get('team_id'), driver2.get('team_id')])
+        team1 = teams.get(driver1.get('team_id'))
+        team2 = teams.get(driver2.get('team_id'))
+
+    return {'driver1': driver1, 'driver2': driver2, 'team1': team1, 'team2': team2}
+
+# Function to load two teams and their drivers for a comparison
+def load_team_comparison(team1_id: str, team2_id: str) -> Dict[str, Any]:
+    if team1_id == team2_id:
+        raise ComparisonError("Cannot compare the same teams")
+
+    teams = teams_cache.get_many([team1_id, team2_id])
+    team1 = teams.get(team1_id)
+    team2 = teams.get(team2_id)
+    team1_drivers = []
+    team2_drivers = []
+    if team1 and team2:
+        if team1.get('name') == team2.get('name'):
+            raise ComparisonError("Cannot compare teams with the same name")
+        team1_drivers = get_team_drivers(team1_id)
+        team2_drivers = get_team_drivers(team2_id)
+
+    return {'team1': team1, 'team2': team2, 'team1_drivers': team1_drivers, 'team2_drivers': team2_drivers}
+
+COMPARISON_CACHE_MAX_ENTRIES = int(os.environ.get('F1_COMPARISON_CACHE_MAX_ENTRIES', '2000'))
+
+# Stats compared head to head, with whether a higher value is better
+DRIVER_COMPARISON_STATS = {
+    "total_race_wins": True,
+    "total_pole_positions": True,
+    "total_points_scored": True,
+    "total_world_titles": True,
+    "total_fastest_laps": True
+}
+
+TEAM_COMPARISON_STATS = {
+    "total_race_wins": True,
+    "total_pole_positions": True,
+    "total_constructor_titles": True,
+    "previous_season_position": False
+}
+
+# Memoized head-to-head comparisons. Each side is reduced to a compact tuple
+# of its compared stats to work out the deltas. Results are kept per id pair
+# and evicted when any record they include (either side, their teams or
+# roster drivers) is written. A result computed while a write happened is
+# not stored, so a stale pair is never served.
+class ComparisonEngine:
+    def __init__(self, loader, sides: tuple, stats: Dict[str, bool], numeric_fields: Dict[str, type],
+                 max_entries: int = COMPARISON_CACHE_MAX_ENTRIES):
+        self.loader = loader
+        self.sides = sides
+        self.stats = stats
+        self.numeric_fields = numeric_fields
+        self.max_entries = max_entries
+        self._results = OrderedDict()
+        self._keys_by_id = {}
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def compact(self, record: Dict[str, Any]) -> tuple:
+        values = []
+        for field in self.stats:
+            try:
+                values.append(self.numeric_fields[field](record.get(field, 0)))
+            except (TypeError, ValueError):
+                values.append(0)
+        return tuple(values)
+
+    # Per-stat values, difference and leader (1 or 2, 0 for a tie)
+    def deltas(self, first: tuple, second: tuple) -> Dict[str, Dict[str, Any]]:
+        deltas = {}
+        for (field, higher_is_better), a, b in zip(self.stats.items(), first, second):
+            if a == b:
+                leader = 0
+            elif (a > b) == higher_is_better:
+                leader = 1
+            else:
+                leader = 2
+            deltas[field] = {'first': a, 'second': b, 'delta': a - b, 'leader': leader}
+        return deltas
+
+    def compare(self, id1: str, id2: str) -> Dict[str, Any]:
+        key = (id1, id2)
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None:
+                self._results.move_to_end(key)
+                return dict(cached)
+            version = self._version
+
+        result = self.loader(id1, id2)
+        first, second = (result[side] for side in self.sides)
+        if not first or not second:
+            return result
+        result['deltas'] = self.deltas(self.compact(first), self.compact(second))
+
+        with self._lock:
+            if self._version == version:
+                self._store(key, result)
+        return dict(result)
+
+    # Ids of every record a result was built from
+    @staticmethod
+    def _involved_ids(result: Dict[str, Any]) -> set:
+        ids = set()
+        for value in result.values():
+            if isinstance(value, dict) and 'id' in value:
+                ids.add(value['id'])
+            elif isinstance(value, list):
+                ids.update(item['id'] for item in value if 'id' in item)
+        return ids
+
+    def _store(self, key: tuple, result: Dict[str, Any]):
+        self._results[key] = result
+        for doc_id in self._involved_ids(result):
+            self._keys_by_id.setdefault(doc_id, set()).add(key)
+        while len(self._results) > self.max_entries:
+            old_key, old_result = self._results.popitem(last=False)
+            self._unlink(old_key, old_result)
+
+    def _unlink(self, key: tuple, result: Dict[str, Any]):
+        for doc_id in self._involved_ids(result):
+            keys = self._keys_by_id.get(doc_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_id[doc_id]
+
+    # Cache listener: drop every result that includes the written record, or
+    # the team a driver was just moved to
+    def on_write(self, doc_id: Optional[str], fields: Dict[str, Any]):
+        with self._lock:
+            self._version += 1
+            if doc_id is None:
+                self._results.clear()
+                self._keys_by_id.clear()
+                return
+            keys = set(self._keys_by_id.get(doc_id, ()))
+            if fields.get('team_id'):
+                keys |= self._keys_by_id.get(fields['team_id'], set())
+            for key in keys:
+                result = self._results.pop(key, None)
+                if result is not None:
+                    self._unlink(key, result)
+
+driver_comparisons = ComparisonEngine(load_driver_comparison, ('driver1', 'driver2'), DRIVER_COMPARISON_STATS, DRIVER_NUMERIC_FIELDS)
+team_comparisons = ComparisonEngine(load_team_comparison, ('team1', 'team2'), TEAM_COMPARISON_STATS, TEAM_NUMERIC_FIELDS)
+
+for engine in (driver_comparisons, team_comparisons):
+    drivers_cache.listeners.append(engine.on_write)
+    teams_cache.listeners.append(engine.on_write)
+
+# Run one attribute comparison as a Firestore query, ordered by the attribute.
+# Legacy documents that store numbers as strings are picked up by a second
+# query: Firestore orders every string after every number, so `>= ''` selects
+# exactly the string-valued ones, which loading them as records coerces.
+def query_collection(collection_ref, record_type: type, attribute: str, comparison: str,
+                     value: Any, limit: int = QUERY_RESULT_LIMIT, start_after: Optional[str] = None) -> list:
+    numeric_fields = record_type.numeric_fields
+    if attribute not in numeric_fields:
+        raise ValueError(f"Cannot query on attribute '{attribute}'")
+    if comparison not in QUERY_COMPARISONS:
+        raise ValueError(f"Unknown comparison '{comparison}'")
+
+    field_type = numeric_fields[attribute]
+    query_value = field_type(value)
+    firestore_op, compare = QUERY_COMPARISONS[comparison]
+
+    query = collection_ref.where(attribute, firestore_op, query_value)
+    if comparison != 'eq':
+        query = query.order_by(attribute)
+    query = query.order_by(FieldPath.document_id())
+    cursor_key = None
+    if start_after:
+        cursor_doc = collection_ref.document(start_after).get()
+        if not cursor_doc.exists:
+            raise StaleCursorError(f"Cursor '{start_after}' is no longer valid, start again from the first page")
+        try:
+            cursor_key = (field_type(cursor_doc.get(attribute)), start_after)
+        except (KeyError, TypeError, ValueError):
+            cursor_key = None
+        if cursor_key is None:
+            query = query.start_after(cursor_doc)
+        else:
+            # Firestore sorts every string after every number, so a cursor
+            # document storing a legacy string gives its coerced value
+            cursor = {FieldPath.document_id(): cursor_doc.reference}
+            if comparison != 'eq':
+                cursor[attribute] = cursor_key[0]
+            query = query.start_after(cursor)
+    results = [record_type.from_snapshot(doc) for doc in query.limit(limit).stream()]
+
+    for doc in collection_ref.where(attribute, '>=', '').stream():
+        record = record_type.from_snapshot(doc)
+        field_value = getattr(record, attribute)
+        if not isinstance(field_value, field_type):
+            continue
+        if compare(field_value, query_value) and (cursor_key is None or (field_value, record.id) > cursor_key):
+            results.append(record)
+
+    results.sort(key=lambda record: (getattr(record, attribute), record.id))
+    return [record.to_dict() for record in results[:limit]]
+
+# Answer one attribute comparison from a sorted index, fetching only the matching documents
+def query_index(index: CollectionIndex, cache: CollectionCache, attribute: str, comparison: str,
+                value: Any, limit: int = QUERY_RESULT_LIMIT, start_after: Optional[str] = None) -> list:
+    ids = index.query(attribute, comparison, value, start_after, limit)
+    docs = cache.get_many(ids)
+    return Page([docs[doc_id] for doc_id in ids if doc_id in docs], ids[-1] if len(ids) == limit else None)
+
+# Comparisons a query predicate may use, on top of lt/eq/gt: 'between' takes a
+# "low,high" value (inclusive) and 'in' a comma-separated list of values
+PREDICATE_COMPARISONS = ('lt', 'eq', 'gt', 'between', 'in')
+
+# Firestore caps the number of values in an 'in' filter
+FIRESTORE_IN_LIMIT = 30
+
+# Without an index to count matches, push down the predicate most likely to be
+# selective: equality first, then membership, then ranges
+PUSHDOWN_RANK = {'eq': 0, 'in': 1, 'between': 2, 'lt': 3, 'gt': 3}
+
+# Turn the parallel attribute/comparison/value lists of a query form into
+# (attribute, comparison, value) predicates with coerced values, skipping blank rows
+def parse_predicates(numeric_fields: Dict[str, type], attributes: list, comparisons: list, values: list) -> list:
+    predicates = []
+    for attribute, comparison, value in zip(attributes, comparisons, values):
+        if not attribute or value is None or str(value).strip() == '':
+            continue
+        if attribute not in numeric_fields:
+            raise ValueError(f"Cannot query on attribute '{attribute}'")
+        if comparison not in PREDICATE_COMPARISONS:
+            raise ValueError(f"Unknown comparison '{comparison}'")
+        field_type = numeric_fields[attribute]
+        try:
+            items = [field_type(item.strip()) for item in str(value).split(',') if item.strip()]
+        except ValueError:
+            raise ValueError(f"Invalid value for {attribute}: {value}")
+        if comparison == 'between':
+            if len(items) != 2:
+                raise ValueError("'between' needs two values, e.g. 10,20")
+            predicates.append((attribute, comparison, (min(items), max(items))))
+        elif comparison == 'in':
+            predicates.append((attribute, comparison, tuple(items)))
+        elif len(items) != 1:
+            raise ValueError(f"Invalid value for {attribute}: {value}")
+        else:
+            predicates.append((attribute, comparison, items[0]))
+    if not predicates:
+        raise ValueError("Enter at least one query condition")
+    return predicates
+
+def predicate_matches(doc, predicate: tuple) -> bool:
+    attribute, comparison, value = predicate
+    field_value = doc.get(attribute)
+    if isinstance(field_value, bool) or not isinstance(field_value, (int, float)):
+        return False
+    if comparison == 'between':
+        return value[0] <= field_value <= value[1]
+    if comparison == 'in':
+        return field_value in value
+    return QUERY_COMPARISONS[comparison][1](field_value, value)
+
+# Candidate records for one predicate from Firestore, plus every legacy
+# document storing the attribute as a string; callers filter them in memory
+def pushdown_records(collection_ref, record_type: type, predicate: tuple) -> list:
+    attribute, comparison, value = predicate
+    if comparison == 'between':
+        query = collection_ref.where(attribute, '>=', value[0]).where(attribute, '<=', value[1])
+    elif comparison == 'in':
+        query = collection_ref.where(attribute, 'in', list(value))
+    else:
+        query = collection_ref.where(attribute, QUERY_COMPARISONS[comparison][0], value)
+    records = [record_type.from_snapshot(doc) for doc in query.stream()]
+    records += [record_type.from_snapshot(doc) for doc in collection_ref.where(attribute, '>=', '').stream()]
+    return records
+
+# Run predicates combined with AND (match='all') or OR (match='any'), sorted by
+# `sort_by` (the first predicate's attribute by default) and paged after the
+# `start_after` id. A single lt/eq/gt predicate in its natural order goes
+# straight to the index or Firestore query. Otherwise the planner fetches
+# candidates for the most selective predicate, by index count when the index
+# is built and by PUSHDOWN_RANK against Firestore before that, or the union of
+# every predicate for OR, and filters the remaining predicates in memory.
+def run_query(index: CollectionIndex, cache: CollectionCache, collection_ref, record_type: type, predicates: list,
+              limit: int = QUERY_RESULT_LIMIT, start_after: Optional[str] = None, match: str = 'all',
+              sort_by: Optional[str] = None, descending: bool = False) -> list:
+    if match not in ('all', 'any'):
+        raise ValueError(f"Unknown match '{match}'")
+    sort_by = sort_by or predicates[0][0]
+    if sort_by not in record_type.numeric_fields:
+        raise ValueError(f"Cannot sort on attribute '{sort_by}'")
+
+    if len(predicates) == 1 and predicates[0][1] in QUERY_COMPARISONS and sort_by == predicates[0][0] and not descending:
+        attribute, comparison, value = predicates[0]
+        if cache.index_ready():
+            return query_index(index, cache, attribute, comparison, value, limit, start_after)
+        return query_collection(collection_ref, record_type, attribute, comparison, value, limit, start_after)
+
+    if cache.index_ready():
+        if match == 'all':
+            probes = [min(predicates, key=lambda predicate: index.count(*predicate))]
+        else:
+            probes = predicates
+        ids = list(dict.fromkeys(doc_id for predicate in probes for doc_id in index.match_ids(*predicate)))
+        docs = cache.get_many(ids)
+        candidates = [docs[doc_id] for doc_id in ids if doc_id in docs]
+    else:
+        pushable = [predicate for predicate in predicates
+                    if predicate[1] != 'in' or len(predicate[2]) <= FIRESTORE_IN_LIMIT]
+        if match == 'all' and pushable:
+            probes = [min(pushable, key=lambda predicate: PUSHDOWN_RANK[predicate[1]])]
+        elif match == 'any' and len(pushable) == len(predicates):
+            probes = predicates
+        else:
+            probes = []
+        if probes:
+            records = {}
+            for predicate in probes:
+                for record in pushdown_records(collection_ref, record_type, predicate):
+                    records[record.id] = record
+            candidates = [record.to_dict() for record in records.values()]
+        else:
+            candidates = cache.all()
+
+    combine = all if match == 'all' else any
+    results = [doc for doc in candidates if combine(predicate_matches(doc, predicate) for predicate in predicates)]
+
+    def sort_key(doc):
+        value = doc.get(sort_by)
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            value = float('-inf')
+        return value, doc['id']
+
+    results.sort(key=sort_key, reverse=descending)
+    if start_after:
+        cursor_doc = next((doc for doc in results if doc['id'] == start_after), None) or cache.get(start_after)
+        if cursor_doc is None:
+            raise StaleCursorError(f"Cursor '{start_after}' is no longer valid, start again from the first page")
+        cursor_key = sort_key(cursor_doc)
+        results = [doc for doc in results if (sort_key(doc) < cursor_key if descending else sort_key(doc) > cursor_key)]
+    return results[:limit]
+
+# Function to run a driver query and attach each result's team name
+def search_driver_records(predicates: list, page_size: int = PAGE_SIZE_DEFAULT, start_after: Optional[str] = None,
+                          match: str = 'all', sort_by: Optional[str] = None, descending: bool = False) -> list:
+    return attach_team_names(query_drivers(predicates, page_size, start_after, match, sort_by, descending))
+
+# Function to query drivers with one or more predicates
+def query_drivers(predicates: list, limit: int = QUERY_RESULT_LIMIT, start_after: Optional[str] = None,
+                  match: str = 'all', sort_by: Optional[str] = None, descending: bool = False) -> list:
+    return run_query(drivers_index, drivers_cache, drivers_ref, Driver, predicates, limit, start_after, match, sort_by, descending)
+
+# Ranking order for each attribute; everything not listed ranks highest first
+RANK_ASCENDING_FIELDS = {"age", "year_founded", "previous_season_position"}
+
+def rank_descending(attribute: str, order: Optional[str] = None) -> bool:
+    if order is None:
+        return attribute not in RANK_ASCENDING_FIELDS
+    if order not in ('asc', 'desc'):
+        raise ValueError(f"Unknown order '{order}'")
+    return order == 'desc'
+
+# Leaderboards are answered from the sorted indexes, which add/edit/delete
+# keep current through the collection caches; a cold index is built first
+def leaderboard(index: CollectionIndex, cache: CollectionCache, attribute: str, limit: int,
+                order: Optional[str] = None) -> list:
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+    cache.ensure_index()
+    descending = rank_descending(attribute, order)
+    ids = index.top(attribute, min(limit, PAGE_SIZE_MAX), descending)
+    docs = cache.get_many(ids)
+    entries = []
+    for doc_id in ids:
+        position = index.rank(attribute, doc_id, descending)
+        # skip documents deleted since top() ran
+        if doc_id in docs and position is not None:
+            entries.append({**docs[doc_id], 'rank': position['rank']})
+    return entries
+
+def rank_of(index: CollectionIndex, cache: CollectionCache, attribute: str, doc_id: str,
+            order: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    cache.ensure_index()
+    return index.rank(attribute, doc_id, rank_descending(attribute, order))
+
+# Columnar copy of a collection for analytics: one float64 array per numeric
+# field (NaN where a value is missing or unparseable) and, when `group_field`
+# is given, an integer code per document into the sorted group keys. It is
+# built from the collection cache on first use and dropped on every write.
+# numpy is imported by the methods that need it, so it stays out of startup.
+class ColumnarSnapshot:
+    def __init__(self, cache: CollectionCache, numeric_fields: Dict[str, type], group_field: Optional[str] = None):
+        self.cache = cache
+        self.numeric_fields = numeric_fields
+        self.group_field = group_field
+        self._data = None
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def on_write(self, doc_id: Optional[str], fields: Dict[str, Any]):
+        with self._lock:
+            self._version += 1
+            self._data = None
+
+    @staticmethod
+    def _number(value: Any) -> float:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return float('nan')
+
+    def data(self) -> Dict[str, Any]:
+        import numpy as np
+        with self._lock:
+            if self._data is not None:
+                return self._data
+            version = self._version
+
+        records = self.cache.records()
+        data = {
+            'ids': np.array([record.id for record in records], dtype=object),
+            'columns': {
+                field: np.array([self._number(getattr(record, field)) for record in records], dtype=np.float64)
+                for field in self.numeric_fields
+            }
+        }
+        if self.group_field:
+            keys, codes = np.unique(np.array([getattr(record, self.group_field) or '' for record in records], dtype=str),
+                                    return_inverse=True)
+            data['group_keys'] = keys.tolist()
+            data['group_codes'] = codes.ravel()
+
+        with self._lock:
+            if self._version == version:
+                self._data = data
+        return data
+
+    def column(self, field: str) -> 'np.ndarray':
+        if field not in self.numeric_fields:
+            raise ValueError(f"Cannot analyse attribute '{field}'")
+        return self.data()['columns'][field]
+
+    # Rows matching every (attribute, comparison, value) filter
+    def mask(self, filters: list) -> 'np.ndarray':
+        import numpy as np
+        data = self.data()
+        mask = np.ones(len(data['ids']), dtype=bool)
+        for attribute, comparison, value in filters:
+            mask &= QUERY_COMPARISONS[comparison][1](self.column(attribute), value)
+        return mask
+
+    def summary(self, field: str, mask: 'np.ndarray') -> Dict[str, Any]:
+        import numpy as np
+        values = self.column(field)[mask]
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return {'count': 0}
+        p25, median, p75 = np.percentile(values, [25, 50, 75])
+        return {
+            'count': int(len(values)),
+            'sum': float(values.sum()),
+            'mean': float(values.mean()),
+            'std': float(values.std()),
+            'min': float(values.min()),
+            'p25': float(p25),
+            'median': float(median),
+            'p75': float(p75),
+            'max': float(values.max())
+        }
+
+    def histogram(self, field: str, mask: 'np.ndarray', bins: int) -> Dict[str, list]:
+        import numpy as np
+        values = self.column(field)[mask]
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return {'edges': [], 'counts': []}
+        counts, edges = np.histogram(values, bins=bins)
+        return {'edges': edges.tolist(), 'counts': counts.tolist()}
+
+    # Count, sum, mean, min and max of `field` per group key
+    def group_by(self, field: str, mask: 'np.ndarray') -> list:
+        import numpy as np
+        data = self.data()
+        values = self.column(field)
+        keep = mask & ~np.isnan(values)
+        codes = data['group_codes'][keep]
+        values = values[keep]
+        groups = len(data['group_keys'])
+        counts = np.bincount(codes, minlength=groups)
+        sums = np.bincount(codes, weights=values, minlength=groups)
+        mins = np.full(groups, np.inf)
+        maxs = np.full(groups, -np.inf)
+        np.minimum.at(mins, codes, values)
+        np.maximum.at(maxs, codes, values)
+        return [
+            {'key': key, 'count': int(counts[i]), 'sum': float(sums[i]), 'mean': float(sums[i] / counts[i]),
+             'min': float(mins[i]), 'max': float(maxs[i])}
+            for i, key in enumerate(data['group_keys']) if counts[i]
+        ]
+
+    # Pearson correlation between every pair of numeric fields, over the rows
+    # where all of them are present
+    def correlation(self, mask: 'np.ndarray') -> Dict[str, Any]:
+        import numpy as np
+        fields = list(self.numeric_fields)
+        matrix = np.vstack([self.column(field) for field in fields])[:, mask]
+        matrix = matrix[:, ~np.isnan(matrix).any(axis=0)]
+        if matrix.shape[1] < 2:
+            return {'fields': fields, 'matrix': None}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = np.corrcoef(matrix)
+        return {'fields': fields, 'matrix': [[None if np.isnan(v) else round(float(v), 4) for v in row] for row in corr]}
+
+driver_columns = ColumnarSnapshot(drivers_cache, DRIVER_NUMERIC_FIELDS, 'team_id')
+team_columns = ColumnarSnapshot(teams_cache, TEAM_NUMERIC_FIELDS)
+drivers_cache.listeners.append(driver_columns.on_write)
+teams_cache.listeners.append(team_columns.on_write)
+
+ANALYTICS_DEFAULT_BINS = 10
+ANALYTICS_MAX_BINS = 100
+
+# Turn the parallel attribute/comparison/value lists of a filter form into
+# (attribute, comparison, number) triples, skipping blank rows
+def parse_filters(numeric_fields: Dict[str, type], attributes: list, comparisons: list, values: list) -> list:
+    filters = []
+    for attribute, comparison, value in zip(attributes, comparisons, values):
+        if not attribute or value in (None, ''):
+            continue
+        if attribute not in numeric_fields:
+            raise ValueError(f"Cannot filter on attribute '{attribute}'")
+        if comparison not in QUERY_COMPARISONS:
+            raise ValueError(f"Unknown comparison '{comparison}'")
+        try:
+            filters.append((attribute, comparison, float(value)))
+        except ValueError:
+            raise ValueError(f"Invalid value for {attribute}: {value}")
+    return filters
+
+# Summary, histogram and correlations of the filtered rows, plus per-team
+# aggregates for drivers with the team names attached
+def analytics_report(snapshot: ColumnarSnapshot, field: str, filters: list, bins: int = ANALYTICS_DEFAULT_BINS) -> Dict[str, Any]:
+    mask = snapshot.mask(filters)
+    report = {
+        'field': field,
+        'matched': int(mask.sum()),
+        'summary': snapshot.summary(field, mask),
+        'histogram': snapshot.histogram(field, mask, max(1, min(bins, ANALYTICS_MAX_BINS))),
+        'correlation': snapshot.correlation(mask)
+    }
+    if snapshot.group_field:
+        groups = snapshot.group_by(field, mask)
+        teams = get_teams_by_ids([group['key'] for group in groups if group['key']])
+        for group in groups:
+            group['name'] = teams.get(group['key'], {}).get('name', 'No team')
+        report['groups'] = sorted(groups, key=lambda group: -group['mean'])
+    return report
+
+# Check whether a name is held by a document other than `exclude_id`, using the
+# in-memory name index, built first when it is cold. The index normalizes names
+# itself, so it also sees documents that predate name_lower; those still need
+# `backfill-names` before their names are reserved against concurrent creates.
+def name_exists(cache: CollectionCache, name: str, exclude_id: Optional[str] = None) -> bool:
+    cache.ensure_index()
+    owner = cache.index.name_owner(name)
+    return owner is not None and owner != exclude_id
 
 # Function to check if a team name already exists
-def team_name_exists(name: str) -> bool:
-    teams = get_all_teams()
-    for team in teams:
-        if team.get('name', '').lower() == name.lower():
-            return True
-    return False
+def team_name_exists(name: str, exclude_id: Optional[str] = None) -> bool:
+    return name_exists(teams_cache, name, exclude_id)
 
 # Function to check if a driver name already exists
-def driver_name_exists(name: str) -> bool:
-    drivers = get_all_drivers()
-    for driver in drivers:
-        if driver.get('name', '').lower() == name.lower():
-            return True
-    return False
+def driver_name_exists(name: str, exclude_id: Optional[str] = None) -> bool:
+    return name_exists(drivers_cache, name, exclude_id)
 
 @app.get("/", response_class=HTMLResponse)
-async def root(request: Request):
-    id_token = request.cookies.get("token")
-    error_message = "No error here"
-    user_token = None
-
-    if id_token:
-        try:
-            user_token = google.oauth2.id_token.verify_firebase_token(id_token, firebase_request_adapter)
-            error_message = None 
-        except ValueError as err:
-           
-            print(str(err))
-            user_token = None 
-            error_message = str(err) 
+async def root(request: Request, auth: tuple = Depends(get_auth)):
+    user_token, error_message = auth
+    if not request.cookies.get("token"):
+        error_message = "No error here"
 
     return templates.TemplateResponse('main.html', {
         'request': request,
@@ -181,28 +2520,23 @@ async def logout():
 
 # Routes for adding drivers
 @app.get("/add-driver", response_class=HTMLResponse)
-async def add_driver_page(request: Request):
-    id_token = request.cookies.get("token")
-    error_message = None
-    user_token = None
+async def add_driver_page(request: Request, page_size: int = PAGE_SIZE_DEFAULT, cursor: Optional[str] = None,
+                          auth: tuple = Depends(get_auth), loader: RequestLoader = Depends(get_loader)):
+    user_token, error_message = auth
 
-    if id_token:
-        try:
-            user_token = google.oauth2.id_token.verify_firebase_token(id_token, firebase_request_adapter)
-        except ValueError as err:
-            print(str(err))
-            error_message = str(err)
-    
     if not user_token:
         return RedirectResponse(url="/")
     
-    teams = get_all_teams()
+    page_size = clamp_page_size(page_size)
+    teams, teams_cursor = await team_options(loader, page_size, cursor)
     
     return templates.TemplateResponse('add_driver.html', {
         'request': request,
         'user_token': user_token,
         'error_message': error_message,
-        'teams': teams
+        'teams': teams,
+        'next_cursor': teams_cursor,
+        'page_size': page_size
     })
 
 @app.post("/add-driver", response_class=HTMLResponse)
@@ -215,71 +2549,64 @@ async def create_driver(
     total_points_scored: float = Form(...),
     total_world_titles: int = Form(...),
     total_fastest_laps: int = Form(...),
-    team_id: str = Form(...)
+    team_id: str = Form(...),
+    auth: tuple = Depends(get_auth),
+    loader: RequestLoader = Depends(get_loader)
 ):
-    id_token = request.cookies.get("token")
-    error_message = None
-    user_token = None
+    user_token, error_message = auth
     success_message = None
 
-    if id_token:
-        try:
-            user_token = google.oauth2.id_token.verify_firebase_token(id_token, firebase_request_adapter)
-            
-            if driver_name_exists(name):
-                error_message = f"Driver '{name}' already exists. Please use a different name."
-                return templates.TemplateResponse('add_driver.html', {
-                    'request': request,
-                    'user_token': user_token,
-                    'error_message': error_message,
-                    'teams': get_all_teams()
-                })
+    if not user_token:
+        return RedirectResponse(url="/")
+    
+    try:
+        if await run_blocking(driver_name_exists, name):
+            error_message = f"Driver '{name}' already exists. Please use a different name."
+            teams, teams_cursor = await team_options(loader, PAGE_SIZE_DEFAULT, None, team_id)
+            return templates.TemplateResponse('add_driver.html', {
+                'request': request,
+                'user_token': user_token,
+                'error_message': error_message,
+                'teams': teams,
+                'next_cursor': teams_cursor,
+                'page_size': PAGE_SIZE_DEFAULT
+            })
             
-            driver_data = {
-                "name": name,
-                "age": age,
-                "total_pole_positions": total_pole_positions,
-                "total_race_wins": total_race_wins,
-                "total_points_scored": total_points_scored,
-                "total_world_titles": total_world_titles,
-                "total_fastest_laps": total_fastest_laps,
-                "team_id": team_id
-            }
+        driver_data = {
+            "name": name,
+            "age": age,
+            "total_pole_positions": total_pole_positions,
+            "total_race_wins": total_race_wins,
+            "total_points_scored": total_points_scored,
+            "total_world_titles": total_world_titles,
+            "total_fastest_laps": total_fastest_laps,
+            "team_id": team_id
+        }
             
-            add_driver(driver_data)
-            success_message = f"Driver {name} added successfully!"
+        await run_blocking(add_driver, driver_data)
+        success_message = f"Driver {name} added successfully!"
             
-        except ValueError as err:
-            print(str(err))
-            error_message = str(err)
-    
-    if not user_token:
-        return RedirectResponse(url="/")
+    except ValueError as err:
+        print(str(err))
+        error_message = str(err)
     
-    teams = get_all_teams()
+    teams, teams_cursor = await team_options(loader, PAGE_SIZE_DEFAULT)
     
     return templates.TemplateResponse('add_driver.html', {
         'request': request,
         'user_token': user_token,
         'error_message': error_message,
         'success_message': success_message,
-        'teams': teams
+        'teams': teams,
+        'next_cursor': teams_cursor,
+        'page_size': PAGE_SIZE_DEFAULT
     })
 
 # Routes for adding teams
 @app.get("/add-team", response_class=HTMLResponse)
-async def add_team_page(request: Request):
-    id_token = request.cookies.get("token")
-    error_message = None
-    user_token = None
+async def add_team_page(request: Request, auth: tuple = Depends(get_auth)):
+    user_token, error_message = auth
 
-    if id_token:
-        try:
-            user_token = google.oauth2.id_token.verify_firebase_token(id_token, firebase_request_adapter)
-        except ValueError as err:
-            print(str(err))
-            error_message = str(err)
-    
     if not user_token:
         return RedirectResponse(url="/")
     
@@ -297,43 +2624,39 @@ async def create_team(
     total_pole_positions: int = Form(...),
     total_race_wins: int = Form(...),
     total_constructor_titles: int = Form(...),
-    previous_season_position: int = Form(...)
+    previous_season_position: int = Form(...),
+    auth: tuple = Depends(get_auth)
 ):
-    id_token = request.cookies.get("token")
-    error_message = None
-    user_token = None
+    user_token, error_message = auth
     success_message = None
 
-    if id_token:
-        try:
-            user_token = google.oauth2.id_token.verify_firebase_token(id_token, firebase_request_adapter)
-            
-            if team_name_exists(name):
-                error_message = f"Team '{name}' already exists. Please use a different name."
-                return templates.TemplateResponse('add_team.html', {
-                    'request': request,
-                    'user_token': user_token,
-                    'error_message': error_message
-                })
+    if not user_token:
+        return RedirectResponse(url="/")
+    
+    try:
+        if await run_blocking(team_name_exists, name):
+            error_message = f"Team '{name}' already exists. Please use a different name."
+            return templates.TemplateResponse('add_team.html', {
+                'request': request,
+                'user_token': user_token,
+                'error_message': error_message
+            })
             
-            team_data = {
-                "name": name,
-                "year_founded": year_founded,
-                "total_pole_positions": total_pole_positions,
-                "total_race_wins": total_race_wins,
-                "total_constructor_titles": total_constructor_titles,
-                "previous_season_position": previous_season_position
-            }
+        team_data = {
+            "name": name,
+            "year_founded": year_founded,
+            "total_pole_positions": total_pole_positions,
+            "total_race_wins": total_race_wins,
+            "total_constructor_titles": total_constructor_titles,
+            "previous_season_position": previous_season_position
+        }
             
-            add_team(team_data)
-            success_message = f"Team {name} added successfully!"
+        await run_blocking(add_team, team_data)
+        success_message = f"Team {name} added successfully!"
             
-        except ValueError as err:
-            print(str(err))
-            error_message = str(err)
-    
-    if not user_token:
-        return RedirectResponse(url="/")
+    except ValueError as err:
+        print(str(err))
+        error_message = str(err)
     
     return templates.TemplateResponse('add_team.html', {
         'request': request,
@@ -343,19 +2666,22 @@ async def create_team(
     })
 
 # Routes for querying drivers
-@app.get("/query-drivers", response_class=HTMLResponse)
-async def query_drivers_form(request: Request):
-    id_token = request.cookies.get("token")
-    error_message = None
-    user_token = None
+QUERY_PREDICATE_ROWS = 3
 
-    if id_token:
-        try:
-            user_token = google.oauth2.id_token.verify_firebase_token(id_token, firebase_request_adapter)
-        except ValueError as err:
-            print(str(err))
-            error_message = str(err)
-    
+# Values to refill the query form with: one row per predicate, padded with
+# blank rows up to QUERY_PREDICATE_ROWS
+def query_form_state(attributes: Optional[list] = None, comparisons: Optional[list] = None,
+                     values: Optional[list] = None, match: str = 'all', sort_by: str = '', order: str = 'asc') -> Dict[str, Any]:
+    rows = [
+        {'attribute': attribute, 'comparison': comparison, 'value': value}
+        for attribute, comparison, value in zip(attributes or [], comparisons or [], values or [])
+    ]
+    rows += [{'attribute': '', 'comparison': '', 'value': ''}] * (QUERY_PREDICATE_ROWS - len(rows))
+    return {'rows': rows, 'match': match, 'sort_by': sort_by, 'order': order}
+
+@app.get("/query-drivers", response_class=HTMLResponse)
+async def query_drivers_form(request: Request, auth: tuple = Depends(get_auth)):
+    user_token, error_message = auth
 
     attributes = [
         {"value": "age", "label": "Age"},
@@ -369,7 +2695,9 @@ async def query_drivers_form(request: Request):
     comparisons = [
         {"value": "lt", "label": "Less than"},
         {"value": "eq", "label": "Equal to"},
-        {"value": "gt", "label": "Greater than"}
+        {"value": "gt", "label": "Greater than"},
+        {"value": "between", "label": "Between"},
+        {"value": "in", "label": "One of"}
     ]
     
     return templates.TemplateResponse('query.html', {
@@ -377,69 +2705,31 @@ async def query_drivers_form(request: Request):
         'user_token': user_token,
         'error_message': error_message,
         'attributes': attributes,
-        'comparisons': comparisons
+        'comparisons': comparisons,
+        'query': query_form_state()
     })
 
 @app.post("/query-drivers", response_class=HTMLResponse)
 async def process_query_drivers(
     request: Request,
-    attribute: str = Form(...),
-    comparison: str = Form(...),
-    value: str = Form(...)
+    attribute: List[str] = Form(...),
+    comparison: List[str] = Form(...),
+    value: List[str] = Form(...),
+    match: str = Form('all'),
+    sort_by: str = Form(''),
+    order: str = Form('asc'),
+    cursor: str = Form(''),
+    page_size: int = Form(PAGE_SIZE_DEFAULT),
+    auth: tuple = Depends(get_auth)
 ):
-    error_message = None
-    user_token = None
+    user_token, error_message = auth
     results = []
+    page_size = clamp_page_size(page_size)
 
-    id_token = request.cookies.get("token")
-    if id_token:
-        try:
-            user_token = google.oauth2.id_token.verify_firebase_token(id_token, firebase_request_adapter)
-        except ValueError as err:
-            print(str(err))
-            error_message = str(err)
-    
     try:
-        query_value = value
-        if attribute in ["age", "total_pole_positions", "total_race_wins", "total_world_titles", "total_fastest_laps"]:
-            query_value = int(value)
-        elif attribute == "total_points_scored":
-            query_value = float(value)
-        
-        all_drivers = []
-        for driver in drivers_ref.stream():
-            driver_data = driver.to_dict()
-            driver_data["id"] = driver.id
-            all_drivers.append(driver_data)
-        
-        for driver in all_drivers:
-            if attribute in driver:
-                driver_value = driver[attribute]
-                if isinstance(driver_value, str) and attribute in ["age", "total_pole_positions", "total_race_wins", 
-                                                                  "total_world_titles", "total_fastest_laps"]:
-                    driver_value = int(driver_value)
-                elif isinstance(driver_value, str) and attribute == "total_points_scored":
-                    driver_value = float(driver_value)
-                
-                match_found = False
-                if comparison == "lt" and driver_value < query_value:
-                    match_found = True
-                elif comparison == "eq" and driver_value == query_value:
-                    match_found = True
-                elif comparison == "gt" and driver_value > query_value:
-                    match_found = True
-                
-                if match_found:
-                    if "team_id" in driver:
-                        team_doc = teams_ref.document(driver["team_id"]).get()
-                        if team_doc.exists:
-                            driver["team_name"] = team_doc.to_dict().get("name", "Unknown Team")
-                        else:
-                            driver["team_name"] = "Unknown Team"
-                    else:
-                        driver["team_name"] = "No Team"
-                    
-                    results.append(driver)
+        predicates = parse_predicates(DRIVER_NUMERIC_FIELDS, attribute, comparison, value)
+        results = await run_blocking(search_driver_records, predicates, page_size, cursor or None,
+                                     match, sort_by or None, order == 'desc')
         
     except Exception as e:
         error_message = f"Error processing query: {str(e)}"
@@ -459,7 +2749,9 @@ async def process_query_drivers(
     comparisons = [
         {"value": "lt", "label": "Less than"},
         {"value": "eq", "label": "Equal to"},
-        {"value": "gt", "label": "Greater than"}
+        {"value": "gt", "label": "Greater than"},
+        {"value": "between", "label": "Between"},
+        {"value": "in", "label": "One of"}
     ]
     
     return templates.TemplateResponse('query.html', {
@@ -469,43 +2761,22 @@ async def process_query_drivers(
         'attributes': attributes,
         'comparisons': comparisons,
         'results': results,
-        'query': {
-            'attribute': attribute,
-            'comparison': comparison,
-            'value': value
-        }
+        'query': query_form_state(attribute, comparison, value, match, sort_by, order),
+        'cursor': cursor,
+        'next_cursor': next_cursor(results, page_size),
+        'page_size': page_size
     })
 
-# Function to query teams
-def query_teams(attribute: str, comparison: str, value: Any) -> list:
-    all_teams = get_all_teams()
-    results = []
-    
-    for team in all_teams:
-        if attribute in team:
-            if comparison == 'lt' and team[attribute] < value:
-                results.append(team)
-            elif comparison == 'gt' and team[attribute] > value:
-                results.append(team)
-            elif comparison == 'eq' and team[attribute] == value:
-                results.append(team)
-    
-    return results
+# Function to query teams with one or more predicates
+def query_teams(predicates: list, limit: int = QUERY_RESULT_LIMIT, start_after: Optional[str] = None,
+                match: str = 'all', sort_by: Optional[str] = None, descending: bool = False) -> list:
+    return run_query(teams_index, teams_cache, teams_ref, Team, predicates, limit, start_after, match, sort_by, descending)
 
 # Routes for querying teams
 @app.get("/query-teams", response_class=HTMLResponse)
-async def query_teams_form(request: Request):
-    id_token = request.cookies.get("token")
-    error_message = None
-    user_token = None
+async def query_teams_form(request: Request, auth: tuple = Depends(get_auth)):
+    user_token, error_message = auth
 
-    if id_token:
-        try:
-            user_token = google.oauth2.id_token.verify_firebase_token(id_token, firebase_request_adapter)
-        except ValueError as err:
-            print(str(err))
-            error_message = str(err)
-    
     attributes = [
         {"value": "year_founded", "label": "Year Founded"},
         {"value": "total_pole_positions", "label": "Total Pole Positions"},
@@ -517,7 +2788,9 @@ async def query_teams_form(request: Request):
     comparisons = [
         {"value": "lt", "label": "Less than"},
         {"value": "eq", "label": "Equal to"},
-        {"value": "gt", "label": "Greater than"}
+        {"value": "gt", "label": "Greater than"},
+        {"value": "between", "label": "Between"},
+        {"value": "in", "label": "One of"}
     ]
     
     return templates.TemplateResponse('query_teams.html', {
@@ -525,48 +2798,34 @@ async def query_teams_form(request: Request):
         'user_token': user_token,
         'error_message': error_message,
         'attributes': attributes,
-        'comparisons': comparisons
+        'comparisons': comparisons,
+        'query': query_form_state()
     })
 
 @app.post("/query-teams", response_class=HTMLResponse)
 async def process_query_teams(
     request: Request,
-    attribute: str = Form(...),
-    comparison: str = Form(...),
-    value: str = Form(...)
+    attribute: List[str] = Form(...),
+    comparison: List[str] = Form(...),
+    value: List[str] = Form(...),
+    match: str = Form('all'),
+    sort_by: str = Form(''),
+    order: str = Form('asc'),
+    cursor: str = Form(''),
+    page_size: int = Form(PAGE_SIZE_DEFAULT),
+    auth: tuple = Depends(get_auth)
 ):
-    id_token = request.cookies.get("token")
-    error_message = None
-    user_token = None
+    user_token, error_message = auth
     results = []
+    page_size = clamp_page_size(page_size)
 
-    if id_token:
-        try:
-            user_token = google.oauth2.id_token.verify_firebase_token(id_token, firebase_request_adapter)
-        except ValueError as err:
-            print(str(err))
-            error_message = str(err)
-    
-    if attribute in ["year_founded", "total_pole_positions", "total_race_wins", 
-                     "total_constructor_titles", "previous_season_position"]:
-        query_value = int(value)
-    else:
-        query_value = value
-    
-    all_teams = []
-    for team in teams_ref.stream():
-        team_data = team.to_dict()
-        team_data["id"] = team.id
-        all_teams.append(team_data)
-    
-    for team in all_teams:
-        if attribute in team:
-            if comparison == "lt" and team[attribute] < query_value:
-                results.append(team)
-            elif comparison == "eq" and team[attribute] == query_value:
-                results.append(team)
-            elif comparison == "gt" and team[attribute] > query_value:
-                results.append(team)
+    try:
+        predicates = parse_predicates(TEAM_NUMERIC_FIELDS, attribute, comparison, value)
+        results = await run_blocking(query_teams, predicates, page_size, cursor or None,
+                                     match, sort_by or None, order == 'desc')
+    except Exception as e:
+        error_message = f"Error processing query: {str(e)}"
+        print(f"ERROR: {error_message}")
     
     attributes = [
         {"value": "year_founded", "label": "Year Founded"},
@@ -579,7 +2838,9 @@ async def process_query_teams(
     comparisons = [
         {"value": "lt", "label": "Less than"},
         {"value": "eq", "label": "Equal to"},
-        {"value": "gt", "label": "Greater than"}
+        {"value": "gt", "label": "Greater than"},
+        {"value": "between", "label": "Between"},
+        {"value": "in", "label": "One of"}
     ]
     
     return templates.TemplateResponse('query_teams.html', {
@@ -589,41 +2850,23 @@ async def process_query_teams(
         'attributes': attributes,
         'comparisons': comparisons,
         'results': results,
-        'query': {
-            'attribute': attribute,
-            'comparison': comparison,
-            'value': value
-        }
+        'query': query_form_state(attribute, comparison, value, match, sort_by, order),
+        'cursor': cursor,
+        'next_cursor': next_cursor(results, page_size),
+        'page_size': page_size
     })
 
 # Route for driver details
 @app.get("/driver/{driver_id}", response_class=HTMLResponse)
-async def driver_details(request: Request, driver_id: str):
-    error_message = None
-    user_token = None
+async def driver_details(request: Request, driver_id: str, auth: tuple = Depends(get_auth),
+                         loader: RequestLoader = Depends(get_loader)):
+    user_token, error_message = auth
     driver = None
     team = None
 
-    id_token = request.cookies.get("token")
-    if id_token:
-        try:
-            user_token = google.oauth2.id_token.verify_firebase_token(id_token, firebase_request_adapter)
-        except ValueError as err:
-            print(str(err))
-            error_message = str(err)
-    
     try:
-        driver_doc = drivers_ref.document(driver_id).get()
-        if driver_doc.exists:
-            driver = driver_doc.to_dict()
-            driver['id'] = driver_id
-            
-            if 'team_id' in driver and driver['team_id']:
-                team_doc = teams_ref.document(driver['team_id']).get()
-                if team_doc.exists:
-                    team = team_doc.to_dict()
-                    team['id'] = driver['team_id']
-        else:
+        driver, team = await get_driver_with_team(loader, driver_id)
+        if not driver:
             error_message = "Driver not found"
     except Exception as e:
         error_message = f"Error retrieving driver details: {str(e)}"
@@ -638,32 +2881,15 @@ async def driver_details(request: Request, driver_id: str):
 
 # Route for team details
 @app.get("/team/{team_id}", response_class=HTMLResponse)
-async def team_details(request: Request, team_id: str):
-    error_message = None
-    user_token = None
+async def team_details(request: Request, team_id: str, auth: tuple = Depends(get_auth),
+                       loader: RequestLoader = Depends(get_loader)):
+    user_token, error_message = auth
     team = None
     drivers = []
 
-    id_token = request.cookies.get("token")
-    if id_token:
-        try:
-            user_token = google.oauth2.id_token.verify_firebase_token(id_token, firebase_request_adapter)
-        except ValueError as err:
-            print(str(err))
-            error_message = str(err)
-    
     try:
-        team_doc = teams_ref.document(team_id).get()
-        if team_doc.exists:
-            team = team_doc.to_dict()
-            team['id'] = team_id
-            
-            drivers_query = drivers_ref.where('team_id', '==', team_id).stream()
-            for driver_doc in drivers_query:
-                driver_data = driver_doc.to_dict()
-                driver_data['id'] = driver_doc.id
-                drivers.append(driver_data)
-        else:
+        team, drivers = await get_team_with_drivers(loader, team_id)
+        if not team:
             error_message = "Team not found"
     except Exception as e:
         error_message = f"Error retrieving team details: {str(e)}"
@@ -678,40 +2904,33 @@ async def team_details(request: Request, team_id: str):
 
 # Routes for editing drivers
 @app.get("/edit-driver/{driver_id}", response_class=HTMLResponse)
-async def edit_driver_page(request: Request, driver_id: str):
-    id_token = request.cookies.get("token")
-    error_message = None
-    user_token = None
+async def edit_driver_page(request: Request, driver_id: str, page_size: int = PAGE_SIZE_DEFAULT,
+                           cursor: Optional[str] = None, auth: tuple = Depends(get_auth),
+                           loader: RequestLoader = Depends(get_loader)):
+    user_token, error_message = auth
     driver = None
 
-    if id_token:
-        try:
-            user_token = google.oauth2.id_token.verify_firebase_token(id_token, firebase_request_adapter)
-        except ValueError as err:
-            print(str(err))
-            error_message = str(err)
-    
     if not user_token:
         return RedirectResponse(url="/")
     
     try:
-        driver_doc = drivers_ref.document(driver_id).get()
-        if driver_doc.exists:
-            driver = driver_doc.to_dict()
-            driver['id'] = driver_id
-        else:
+        driver = await loader.load('drivers', driver_id)
+        if not driver:
             error_message = "Driver not found"
     except Exception as e:
         error_message = f"Error retrieving driver details: {str(e)}"
     
-    teams = get_all_teams()
+    page_size = clamp_page_size(page_size)
+    teams, teams_cursor = await team_options(loader, page_size, cursor, driver.get('team_id') if driver else None)
     
     return templates.TemplateResponse('edit_driver.html', {
         'request': request,
         'user_token': user_token,
         'error_message': error_message,
         'driver': driver,
-        'teams': teams
+        'teams': teams,
+        'next_cursor': teams_cursor,
+        'page_size': page_size
     })
 
 @app.post("/edit-driver/{driver_id}", response_class=HTMLResponse)
@@ -725,33 +2944,23 @@ async def update_driver(
     total_points_scored: float = Form(...),
     total_world_titles: int = Form(...),
     total_fastest_laps: int = Form(...),
-    team_id: str = Form(...)
+    team_id: str = Form(...),
+    auth: tuple = Depends(get_auth),
+    loader: RequestLoader = Depends(get_loader)
 ):
-    id_token = request.cookies.get("token")
-    error_message = None
-    user_token = None
+    user_token, error_message = auth
     success_message = None
     driver = None
 
-    if id_token:
-        try:
-            user_token = google.oauth2.id_token.verify_firebase_token(id_token, firebase_request_adapter)
-        except ValueError as err:
-            print(str(err))
-            error_message = str(err)
-    
     if not user_token:
         return RedirectResponse(url="/")
     
     try:
-        driver_doc = drivers_ref.document(driver_id).get()
-        if not driver_doc.exists:
+        driver = await loader.load('drivers', driver_id)
+        if not driver:
             error_message = "Driver not found"
         else:
-            driver = driver_doc.to_dict()
-            driver['id'] = driver_id
-            
-            if name != driver.get('name', '') and driver_name_exists(name):
+            if name != driver.get('name', '') and await run_blocking(driver_name_exists, name, driver_id):
                 error_message = f"Driver '{name}' already exists. Please use a different name."
             else:
                 updated_driver_data = {
@@ -765,14 +2974,16 @@ async def update_driver(
                     "team_id": team_id
                 }
                 
-                drivers_ref.document(driver_id).update(updated_driver_data)
+                await run_blocking(update_driver_record, driver_id, updated_driver_data, driver.get('name'))
                 success_message = f"Driver {name} updated successfully!"
                 
                 driver.update(updated_driver_data)
+    except NameTakenError as err:
+        error_message = str(err)
     except Exception as e:
         error_message = f"Error updating driver: {str(e)}"
     
-    teams = get_all_teams()
+    teams, teams_cursor = await team_options(loader, PAGE_SIZE_DEFAULT, None, driver.get('team_id') if driver else None)
     
     return templates.TemplateResponse('edit_driver.html', {
         'request': request,
@@ -780,34 +2991,25 @@ async def update_driver(
         'error_message': error_message,
         'success_message': success_message,
         'driver': driver,
-        'teams': teams
+        'teams': teams,
+        'next_cursor': teams_cursor,
+        'page_size': PAGE_SIZE_DEFAULT
     })
 
 # Routes for editing teams
 @app.get("/edit-team/{team_id}", response_class=HTMLResponse)
-async def edit_team_page(request: Request, team_id: str):
+async def edit_team_page(request: Request, team_id: str, auth: tuple = Depends(get_auth),
+                         loader: RequestLoader = Depends(get_loader)):
+    user_token, error_message = auth
 
-    id_token = request.cookies.get("token")
-    error_message = None
-    user_token = None
     team = None
 
-    if id_token:
-        try:
-            user_token = google.oauth2.id_token.verify_firebase_token(id_token, firebase_request_adapter)
-        except ValueError as err:
-            print(str(err))
-            error_message = str(err)
-    
     if not user_token:
         return RedirectResponse(url="/")
     
     try:
-        team_doc = teams_ref.document(team_id).get()
-        if team_doc.exists:
-            team = team_doc.to_dict()
-            team['id'] = team_id
-        else:
+        team = await loader.load('teams', team_id)
+        if not team:
             error_message = "Team not found"
     except Exception as e:
         error_message = f"Error retrieving team details: {str(e)}"
@@ -828,33 +3030,23 @@ async def update_team(
     total_pole_positions: int = Form(...),
     total_race_wins: int = Form(...),
     total_constructor_titles: int = Form(...),
-    previous_season_position: int = Form(...)
+    previous_season_position: int = Form(...),
+    auth: tuple = Depends(get_auth),
+    loader: RequestLoader = Depends(get_loader)
 ):
-    id_token = request.cookies.get("token")
-    error_message = None
-    user_token = None
+    user_token, error_message = auth
     success_message = None
     team = None
 
-    if id_token:
-        try:
-            user_token = google.oauth2.id_token.verify_firebase_token(id_token, firebase_request_adapter)
-        except ValueError as err:
-            print(str(err))
-            error_message = str(err)
-    
     if not user_token:
         return RedirectResponse(url="/")
     
     try:
-        team_doc = teams_ref.document(team_id).get()
-        if not team_doc.exists:
+        team = await loader.load('teams', team_id)
+        if not team:
             error_message = "Team not found"
         else:
-            team = team_doc.to_dict()
-            team['id'] = team_id
-            
-            if name != team.get('name', '') and team_name_exists(name):
+            if name != team.get('name', '') and await run_blocking(team_name_exists, name, team_id):
                 error_message = f"Team '{name}' already exists. Please use a different name."
             else:
                 updated_team_data = {
@@ -866,10 +3058,12 @@ async def update_team(
                     "previous_season_position": previous_season_position
                 }
                 
-                teams_ref.document(team_id).update(updated_team_data)
+                await run_blocking(update_team_record, team_id, updated_team_data, team.get('name'))
                 success_message = f"Team {name} updated successfully!"
                 
                 team.update(updated_team_data)
+    except NameTakenError as err:
+        error_message = str(err)
     except Exception as e:
         error_message = f"Error updating team: {str(e)}"
     
@@ -884,24 +3078,16 @@ async def update_team(
 
 # Routes for deleting drivers
 @app.get("/delete-driver/{driver_id}", response_class=HTMLResponse)
-async def delete_driver(request: Request, driver_id: str):
-    id_token = request.cookies.get("token")
-    user_token = None
+async def delete_driver(request: Request, driver_id: str, auth: tuple = Depends(get_auth),
+                        loader: RequestLoader = Depends(get_loader)):
+    user_token, _ = auth
 
-    if id_token:
-        try:
-            user_token = google.oauth2.id_token.verify_firebase_token(id_token, firebase_request_adapter)
-        except ValueError as err:
-            print(str(err))
-            return RedirectResponse(url="/")
-    
     if not user_token:
         return RedirectResponse(url="/")
     
     try:
-        driver_doc = drivers_ref.document(driver_id).get()
-        if driver_doc.exists:
-            drivers_ref.document(driver_id).delete()
+        if await loader.load('drivers', driver_id):
+            await run_blocking(delete_driver_record, driver_id)
             return RedirectResponse(url="/query-drivers?deleted=true")
         else:
             return RedirectResponse(url="/query-drivers?error=not_found")
@@ -910,31 +3096,14 @@ async def delete_driver(request: Request, driver_id: str):
         return RedirectResponse(url="/query-drivers?error=delete_failed")
 
 @app.get("/delete-team/{team_id}", response_class=HTMLResponse)
-async def delete_team(request: Request, team_id: str):
-    id_token = request.cookies.get("token")
-    user_token = None
+async def delete_team(request: Request, team_id: str, auth: tuple = Depends(get_auth)):
+    user_token, _ = auth
 
-    if id_token:
-        try:
-            user_token = google.oauth2.id_token.verify_firebase_token(id_token, firebase_request_adapter)
-        except ValueError as err:
-            print(str(err))
-            return RedirectResponse(url="/")
-    
     if not user_token:
         return RedirectResponse(url="/")
     
     try:
-        team_doc = teams_ref.document(team_id).get()
-        if team_doc.exists:
-            drivers_query = drivers_ref.where('team_id', '==', team_id).stream()
-            
-            for driver_doc in drivers_query:
-                driver_ref = drivers_ref.document(driver_doc.id)
-                driver_ref.update({'team_id': ''})
-            
-            teams_ref.document(team_id).delete()
-            
+        if await run_blocking(delete_team_record, team_id):
             return RedirectResponse(url="/query-teams?deleted=true")
         else:
             return RedirectResponse(url="/query-teams?error=not_found")
@@ -945,208 +3114,843 @@ async def delete_team(request: Request, team_id: str):
 
 # Routes for comparing drivers
 @app.get("/compare-drivers", response_class=HTMLResponse)
-async def compare_drivers_form(request: Request):
-    id_token = request.cookies.get("token")
-    error_message = None
-    user_token = None
+async def compare_drivers_form(request: Request, page_size: int = PAGE_SIZE_DEFAULT, cursor: Optional[str] = None,
+                               auth: tuple = Depends(get_auth)):
+    user_token, error_message = auth
 
-    if id_token:
-        try:
-            user_token = google.oauth2.id_token.verify_firebase_token(id_token, firebase_request_adapter)
-        except ValueError as err:
-            print(str(err))
-            error_message = str(err)
-    
-    all_drivers = get_all_drivers()
+    page_size = clamp_page_size(page_size)
+    drivers = await run_blocking(list_drivers, page_size, cursor)
     
     return templates.TemplateResponse('compare_drivers.html', {
         'request': request,
         'user_token': user_token,
         'error_message': error_message,
-        'drivers': all_drivers
+        'drivers': drivers,
+        'next_cursor': next_cursor(drivers, page_size),
+        'page_size': page_size
     })
 
 @app.post("/compare-drivers", response_class=HTMLResponse)
 async def process_driver_comparison(
     request: Request,
     driver1_id: str = Form(...),
-    driver2_id: str = Form(...)
+    driver2_id: str = Form(...),
+    auth: tuple = Depends(get_auth)
 ):
-    id_token = request.cookies.get("token")
-    error_message = None
-    user_token = None
-    driver1 = None
-    driver2 = None
-    team1 = None
-    team2 = None
+    user_token, error_message = auth
+    comparison = {'driver1': None, 'driver2': None, 'team1': None, 'team2': None}
 
-    if id_token:
-        try:
-            user_token = google.oauth2.id_token.verify_firebase_token(id_token, firebase_request_adapter)
-        except ValueError as err:
-            print(str(err))
-            error_message = str(err)
-    
     try:
-        if driver1_id == driver2_id:
-            error_message = "Cannot compare the driver with same name."
-            all_drivers = get_all_drivers()
-            return templates.TemplateResponse('compare_drivers.html', {
-                'request': request,
-                'user_token': user_token,
-                'error_message': error_message,
-                'drivers': all_drivers
-            })
-            
-        driver1_doc = drivers_ref.document(driver1_id).get()
-        driver2_doc = drivers_ref.document(driver2_id).get()
-        
-        if driver1_doc.exists and driver2_doc.exists:
-            driver1 = driver1_doc.to_dict()
-            driver1['id'] = driver1_id
-            
-            driver2 = driver2_doc.to_dict()
-            driver2['id'] = driver2_id
-            
-            if driver1.get('name') == driver2.get('name'):
-                error_message = "Cannot compare drivers with the same name"
-                all_drivers = get_all_drivers()
-                return templates.TemplateResponse('compare_drivers.html', {
-                    'request': request,
-                    'user_token': user_token,
-                    'error_message': error_message,
-                    'drivers': all_drivers
-                })
-            
-            if 'team_id' in driver1 and driver1['team_id']:
-                team1_doc = teams_ref.document(driver1['team_id']).get()
-                if team1_doc.exists:
-                    team1 = team1_doc.to_dict()
-                    team1['id'] = driver1['team_id']
-            
-            if 'team_id' in driver2 and driver2['team_id']:
-                team2_doc = teams_ref.document(driver2['team_id']).get()
-                if team2_doc.exists:
-                    team2 = team2_doc.to_dict()
-                    team2['id'] = driver2['team_id']
-        
-        if not driver1 or not driver2:
+        comparison = await run_blocking(driver_comparisons.compare, driver1_id, driver2_id)
+        if not comparison['driver1'] or not comparison['driver2']:
             error_message = "One or both drivers not found"
-            
+    except ComparisonError as err:
+        drivers = await run_blocking(list_drivers, PAGE_SIZE_DEFAULT)
+        return templates.TemplateResponse('compare_drivers.html', {
+            'request': request,
+            'user_token': user_token,
+            'error_message': str(err),
+            'drivers': drivers,
+            'next_cursor': next_cursor(drivers, PAGE_SIZE_DEFAULT),
+            'page_size': PAGE_SIZE_DEFAULT
+        })
     except Exception as e:
         error_message = f"Error retrieving driver details: {str(e)}"
     
-    all_drivers = get_all_drivers()
-    
     return templates.TemplateResponse('comparison_results.html', {
         'request': request,
         'user_token': user_token,
         'error_message': error_message,
-        'driver1': driver1,
-        'driver2': driver2,
-        'team1': team1,
-        'team2': team2,
-        'drivers': all_drivers
+        **comparison
     })
 
 # Routes for comparing teams
 @app.get("/compare-teams", response_class=HTMLResponse)
-async def compare_teams_form(request: Request):
-    id_token = request.cookies.get("token")
-    error_message = None
-    user_token = None
+async def compare_teams_form(request: Request, page_size: int = PAGE_SIZE_DEFAULT, cursor: Optional[str] = None,
+                             auth: tuple = Depends(get_auth)):
+    user_token, error_message = auth
 
-    if id_token:
-        try:
-            user_token = google.oauth2.id_token.verify_firebase_token(id_token, firebase_request_adapter)
-        except ValueError as err:
-            print(str(err))
-            error_message = str(err)
-    
-    all_teams = get_all_teams()
+    page_size = clamp_page_size(page_size)
+    teams = await run_blocking(list_teams, page_size, cursor)
     
     return templates.TemplateResponse('compare_teams.html', {
         'request': request,
         'user_token': user_token,
         'error_message': error_message,
-        'teams': all_teams
+        'teams': teams,
+        'next_cursor': next_cursor(teams, page_size),
+        'page_size': page_size
     })
 
 @app.post("/compare-teams", response_class=HTMLResponse)
-async def process_team_comparison(request: Request, team1_id: str = Form(...), team2_id: str = Form(...)):
-    id_token = request.cookies.get("token")
-    error_message = None
-    user_token = None
-    team1 = None
-    team2 = None
-    team1_drivers = []
-    team2_drivers = []
+async def process_team_comparison(request: Request, team1_id: str = Form(...), team2_id: str = Form(...), auth: tuple = Depends(get_auth)):
+    user_token, error_message = auth
+    comparison = {'team1': None, 'team2': None, 'team1_drivers': [], 'team2_drivers': []}
 
-    if id_token:
-        try:
-            user_token = google.oauth2.id_token.verify_firebase_token(id_token, firebase_request_adapter)
-        except ValueError as err:
-            print(str(err))
-            error_message = str(err)
-    
     try:
-        if team1_id == team2_id:
-            error_message = "Cannot compare the same teams"
-            all_teams = get_all_teams()
-            return templates.TemplateResponse('compare_teams.html', {
-                'request': request,
-                'user_token': user_token,
-                'error_message': error_message,
-                'teams': all_teams
-            })
-            
-        team1_doc = teams_ref.document(team1_id).get()
-        team2_doc = teams_ref.document(team2_id).get()
-        
-        if team1_doc.exists and team2_doc.exists:
-            team1 = team1_doc.to_dict()
-            team1['id'] = team1_id
-            
-            team2 = team2_doc.to_dict()
-            team2['id'] = team2_id
-            
-            if team1.get('name') == team2.get('name'):
-                error_message = "Cannot compare teams with the same name"
-                all_teams = get_all_teams()
-                return templates.TemplateResponse('compare_teams.html', {
-                    'request': request,
-                    'user_token': user_token,
-                    'error_message': error_message,
-                    'teams': all_teams
-                })
-            
-            team1_drivers_query = drivers_ref.where('team_id', '==', team1_id).stream()
-            for driver_doc in team1_drivers_query:
-                driver_data = driver_doc.to_dict()
-                driver_data['id'] = driver_doc.id
-                team1_drivers.append(driver_data)
-            
-            team2_drivers_query = drivers_ref.where('team_id', '==', team2_id).stream()
-            for driver_doc in team2_drivers_query:
-                driver_data = driver_doc.to_dict()
-                driver_data['id'] = driver_doc.id
-                team2_drivers.append(driver_data)
-        
-        if not team1 or not team2:
+        comparison = await run_blocking(team_comparisons.compare, team1_id, team2_id)
+        if not comparison['team1'] or not comparison['team2']:
             error_message = "One or both teams not found"
-            
+    except ComparisonError as err:
+        teams = await run_blocking(list_teams, PAGE_SIZE_DEFAULT)
+        return templates.TemplateResponse('compare_teams.html', {
+            'request': request,
+            'user_token': user_token,
+            'error_message': str(err),
+            'teams': teams,
+            'next_cursor': next_cursor(teams, PAGE_SIZE_DEFAULT),
+            'page_size': PAGE_SIZE_DEFAULT
+        })
     except Exception as e:
         error_message = f"Error retrieving team details: {str(e)}"
     
-    all_teams = get_all_teams()
-    
     return templates.TemplateResponse('team_comparison_results.html', {
         'request': request,
         'user_token': user_token,
         'error_message': error_message,
-        'team1': team1,
-        'team2': team2,
-        'team1_drivers': team1_drivers,
-        'team2_drivers': team2_drivers,
-        'teams': all_teams
-    })
\ No newline at end of file
+        **comparison
+    })
+
+ANALYTICS_FILTER_ROWS = 3
+
+@app.get("/analytics", response_class=HTMLResponse)
+async def analytics_page(request: Request, field: Optional[str] = None, bins: int = ANALYTICS_DEFAULT_BINS,
+                         attribute: List[str] = Query([]), comparison: List[str] = Query([]),
+                         value: List[str] = Query([]), auth: tuple = Depends(get_auth)):
+    user_token, error_message = auth
+    report = None
+
+    if field:
+        try:
+            filters = parse_filters(DRIVER_NUMERIC_FIELDS, attribute, comparison, value)
+            report = await run_blocking(analytics_report, driver_columns, field, filters, bins)
+        except ValueError as e:
+            error_message = str(e)
+
+    attributes = [
+        {"value": "age", "label": "Age"},
+        {"value": "total_pole_positions", "label": "Total Pole Positions"},
+        {"value": "total_race_wins", "label": "Total Race Wins"},
+        {"value": "total_points_scored", "label": "Total Points Scored"},
+        {"value": "total_world_titles", "label": "Total World Titles"},
+        {"value": "total_fastest_laps", "label": "Total Fastest Laps"}
+    ]
+
+    comparisons = [
+        {"value": "lt", "label": "Less than"},
+        {"value": "eq", "label": "Equal to"},
+        {"value": "gt", "label": "Greater than"}
+    ]
+
+    filter_rows = [
+        {'attribute': attr, 'comparison': comp, 'value': val}
+        for attr, comp, val in zip(attribute, comparison, value)
+    ][:ANALYTICS_FILTER_ROWS]
+    filter_rows += [{}] * (ANALYTICS_FILTER_ROWS - len(filter_rows))
+
+    return templates.TemplateResponse('analytics.html', {
+        'request': request,
+        'user_token': user_token,
+        'error_message': error_message,
+        'attributes': attributes,
+        'comparisons': comparisons,
+        'field': field,
+        'filter_rows': filter_rows,
+        'report': report
+    })
+
+# Typeahead search used by the driver and team dropdowns
+@app.get("/search/drivers")
+async def search_drivers(q: str = '', cursor: Optional[str] = None, page_size: int = PAGE_SIZE_DEFAULT):
+    page_size = clamp_page_size(page_size)
+    drivers = await run_blocking(list_drivers, page_size, cursor, q)
+    return JSONResponse({
+        'items': [{'id': driver['id'], 'name': driver.get('name', '')} for driver in drivers],
+        'next_cursor': next_cursor(drivers, page_size)
+    })
+
+@app.get("/search/teams")
+async def search_teams(q: str = '', cursor: Optional[str] = None, page_size: int = PAGE_SIZE_DEFAULT):
+    page_size = clamp_page_size(page_size)
+    teams = await run_blocking(list_teams, page_size, cursor, q)
+    return JSONResponse({
+        'items': [{'id': team['id'], 'name': team.get('name', '')} for team in teams],
+        'next_cursor': next_cursor(teams, page_size)
+    })
+
+# Readiness for the load balancer: 503 until the warm-up has finished
+@app.get("/ready")
+async def ready():
+    return JSONResponse(warm_up.status(), status_code=200 if warm_up.ready() else 503)
+
+@app.get("/health")
+async def health():
+    sync = {'drivers': drivers_sync.status(), 'teams': teams_sync.status()}
+    if not LIVE_SYNC:
+        return JSONResponse({'status': 'ok', 'live_sync': False, 'sync': sync})
+    ready = drivers_sync.ready and teams_sync.ready
+    return JSONResponse({'status': 'ok' if ready else 'starting', 'live_sync': True, 'sync': sync},
+                        status_code=200 if ready else 503)
+
+# JSON API. Bodies are serialized with orjson and carry an ETag over their
+# bytes, so pollers that send If-None-Match get an empty 304 when nothing changed.
+def api_response(request: Request, payload: Any, status_code: int = 200) -> Response:
+    body = orjson.dumps(payload, default=str)
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    if status_code == 200 and etag_matches(request, etag):
+        return Response(status_code=304, headers={'ETag': etag})
+    return Response(content=body, status_code=status_code, media_type='application/json', headers={'ETag': etag})
+
+@app.get("/api/drivers")
+async def api_list_drivers(request: Request, q: str = '', cursor: Optional[str] = None, page_size: int = PAGE_SIZE_DEFAULT):
+    page_size = clamp_page_size(page_size)
+    drivers = await run_blocking(list_drivers, page_size, cursor, q)
+    return api_response(request, {'items': drivers, 'next_cursor': next_cursor(drivers, page_size)})
+
+@app.get("/api/teams")
+async def api_list_teams(request: Request, q: str = '', cursor: Optional[str] = None, page_size: int = PAGE_SIZE_DEFAULT):
+    page_size = clamp_page_size(page_size)
+    teams = await run_blocking(list_teams, page_size, cursor, q)
+    return api_response(request, {'items': teams, 'next_cursor': next_cursor(teams, page_size)})
+
+@app.get("/api/drivers/{driver_id}")
+async def api_driver_details(request: Request, driver_id: str, loader: RequestLoader = Depends(get_loader)):
+    driver, team = await get_driver_with_team(loader, driver_id)
+    if not driver:
+        return api_response(request, {'detail': "Driver not found"}, 404)
+    return api_response(request, {'driver': driver, 'team': team})
+
+@app.get("/api/teams/{team_id}")
+async def api_team_details(request: Request, team_id: str, loader: RequestLoader = Depends(get_loader)):
+    team, drivers = await get_team_with_drivers(loader, team_id)
+    if not team:
+        return api_response(request, {'detail': "Team not found"}, 404)
+    return api_response(request, {'team': team, 'drivers': drivers})
+
+@app.get("/api/query/drivers")
+async def api_query_drivers(request: Request, attribute: List[str] = Query(...), comparison: List[str] = Query(...),
+                            value: List[str] = Query(...), match: str = 'all', sort_by: Optional[str] = None,
+                            order: str = 'asc', cursor: Optional[str] = None, page_size: int = PAGE_SIZE_DEFAULT):
+    page_size = clamp_page_size(page_size)
+    try:
+        predicates = parse_predicates(DRIVER_NUMERIC_FIELDS, attribute, comparison, value)
+        results = await run_blocking(search_driver_records, predicates, page_size, cursor, match, sort_by, order == 'desc')
+    except ValueError as err:
+        return api_response(request, {'detail': str(err)}, 400)
+    return api_response(request, {'items': results, 'next_cursor': next_cursor(results, page_size)})
+
+@app.get("/api/query/teams")
+async def api_query_teams(request: Request, attribute: List[str] = Query(...), comparison: List[str] = Query(...),
+                          value: List[str] = Query(...), match: str = 'all', sort_by: Optional[str] = None,
+                          order: str = 'asc', cursor: Optional[str] = None, page_size: int = PAGE_SIZE_DEFAULT):
+    page_size = clamp_page_size(page_size)
+    try:
+        predicates = parse_predicates(TEAM_NUMERIC_FIELDS, attribute, comparison, value)
+        results = await run_blocking(query_teams, predicates, page_size, cursor, match, sort_by, order == 'desc')
+    except ValueError as err:
+        return api_response(request, {'detail': str(err)}, 400)
+    return api_response(request, {'items': results, 'next_cursor': next_cursor(results, page_size)})
+
+@app.get("/api/compare/drivers")
+async def api_compare_drivers(request: Request, driver1_id: str, driver2_id: str):
+    try:
+        comparison = await run_blocking(driver_comparisons.compare, driver1_id, driver2_id)
+    except ComparisonError as err:
+        return api_response(request, {'detail': str(err)}, 400)
+    if not comparison['driver1'] or not comparison['driver2']:
+        return api_response(request, {'detail': "One or both drivers not found"}, 404)
+    return api_response(request, comparison)
+
+@app.get("/api/compare/teams")
+async def api_compare_teams(request: Request, team1_id: str, team2_id: str):
+    try:
+        comparison = await run_blocking(team_comparisons.compare, team1_id, team2_id)
+    except ComparisonError as err:
+        return api_response(request, {'detail': str(err)}, 400)
+    if not comparison['team1'] or not comparison['team2']:
+        return api_response(request, {'detail': "One or both teams not found"}, 404)
+    return api_response(request, comparison)
+
+@app.get("/api/leaderboard/drivers")
+async def api_driver_leaderboard(request: Request, attribute: str, limit: int = 10, order: Optional[str] = None):
+    try:
+        drivers = await run_blocking(leaderboard, drivers_index, drivers_cache, attribute, limit, order)
+    except ValueError as err:
+        return api_response(request, {'detail': str(err)}, 400)
+    return api_response(request, {'attribute': attribute, 'items': drivers})
+
+@app.get("/api/leaderboard/teams")
+async def api_team_leaderboard(request: Request, attribute: str, limit: int = 10, order: Optional[str] = None):
+    try:
+        teams = await run_blocking(leaderboard, teams_index, teams_cache, attribute, limit, order)
+    except ValueError as err:
+        return api_response(request, {'detail': str(err)}, 400)
+    return api_response(request, {'attribute': attribute, 'items': teams})
+
+@app.get("/api/leaderboard/drivers/{driver_id}")
+async def api_driver_rank(request: Request, driver_id: str, attribute: str, order: Optional[str] = None):
+    try:
+        rank = await run_blocking(rank_of, drivers_index, drivers_cache, attribute, driver_id, order)
+    except ValueError as err:
+        return api_response(request, {'detail': str(err)}, 400)
+    if rank is None:
+        return api_response(request, {'detail': "Driver not ranked on this attribute"}, 404)
+    return api_response(request, {'id': driver_id, 'attribute': attribute, **rank})
+
+@app.get("/api/leaderboard/teams/{team_id}")
+async def api_team_rank(request: Request, team_id: str, attribute: str, order: Optional[str] = None):
+    try:
+        rank = await run_blocking(rank_of, teams_index, teams_cache, attribute, team_id, order)
+    except ValueError as err:
+        return api_response(request, {'detail': str(err)}, 400)
+    if rank is None:
+        return api_response(request, {'detail': "Team not ranked on this attribute"}, 404)
+    return api_response(request, {'id': team_id, 'attribute': attribute, **rank})
+
+@app.get("/api/analytics/drivers")
+async def api_driver_analytics(request: Request, field: str = 'total_points_scored', bins: int = ANALYTICS_DEFAULT_BINS,
+                               attribute: List[str] = Query([]), comparison: List[str] = Query([]),
+                               value: List[str] = Query([])):
+    try:
+        filters = parse_filters(DRIVER_NUMERIC_FIELDS, attribute, comparison, value)
+        report = await run_blocking(analytics_report, driver_columns, field, filters, bins)
+    except ValueError as err:
+        return api_response(request, {'detail': str(err)}, 400)
+    return api_response(request, report)
+
+@app.get("/api/analytics/teams")
+async def api_team_analytics(request: Request, field: str = 'total_race_wins', bins: int = ANALYTICS_DEFAULT_BINS,
+                             attribute: List[str] = Query([]), comparison: List[str] = Query([]),
+                             value: List[str] = Query([])):
+    try:
+        filters = parse_filters(TEAM_NUMERIC_FIELDS, attribute, comparison, value)
+        report = await run_blocking(analytics_report, team_columns, field, filters, bins)
+    except ValueError as err:
+        return api_response(request, {'detail': str(err)}, 400)
+    return api_response(request, report)
+
+# Bulk export. Collections are streamed from Firestore in document id order,
+# EXPORT_PAGE_SIZE documents per query, so memory stays flat however large
+# they are; driver rows get their team name from one in-memory id -> name map.
+EXPORT_PAGE_SIZE = int(os.environ.get('F1_EXPORT_PAGE_SIZE', '500'))
+EXPORT_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+EXPORT_COLUMNS = {
+    'drivers': ['id', 'name'] + list(DRIVER_NUMERIC_FIELDS) + ['team_id', 'team_name'],
+    'teams': ['id', 'name'] + list(TEAM_NUMERIC_FIELDS)
+}
+
+# Every document of a collection in id order, one page of snapshots at a time
+def stream_pages(collection_ref, page_size: int = EXPORT_PAGE_SIZE):
+    last_doc = None
+    while True:
+        query = collection_ref.order_by(FieldPath.document_id()).limit(page_size)
+        if last_doc is not None:
+            query = query.start_after(last_doc)
+        docs = list(query.stream())
+        if docs:
+            yield docs
+        if len(docs) < page_size:
+            return
+        last_doc = docs[-1]
+
+def stream_records(collection_ref, record_type: type, page_size: int = EXPORT_PAGE_SIZE):
+    for docs in stream_pages(collection_ref, page_size):
+        for doc in docs:
+            yield record_type.from_snapshot(doc)
+
+def team_name_map() -> Dict[str, str]:
+    return {record.id: record.name or "Unknown Team" for record in teams_cache.records()}
+
+# Export rows for a collection, as dicts holding the export columns
+def export_rows(collection: str):
+    if collection == 'drivers':
+        team_names = team_name_map()
+        for record in stream_records(drivers_ref, Driver):
+            row = record.to_dict()
+            team_id = row.get('team_id')
+            row['team_name'] = team_names.get(team_id, "Unknown Team") if team_id else "No Team"
+            yield row
+    elif collection == 'teams':
+        for record in stream_records(teams_ref, Team):
+            yield record.to_dict()
+    else:
+        raise ValueError(f"Unknown collection '{collection}'")
+
+def encode_csv(rows, columns: list):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction='ignore')
+    writer.writeheader()
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % EXPORT_PAGE_SIZE == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+def encode_ndjson(rows, columns: list):
+    for row in rows:
+        yield orjson.dumps({column: row.get(column) for column in columns}) + b'\n'
+
+def export_chunks(collection: str, export_format: str):
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{export_format}'")
+    if collection not in EXPORT_COLUMNS:
+        raise ValueError(f"Unknown collection '{collection}'")
+    encode = encode_csv if export_format == 'csv' else encode_ndjson
+    return encode(export_rows(collection), EXPORT_COLUMNS[collection])
+
+def export_response(collection: str, export_format: str) -> Response:
+    try:
+        chunks = export_chunks(collection, export_format)
+    except ValueError as err:
+        return JSONResponse({'detail': str(err)}, status_code=400)
+    return StreamingResponse(chunks, media_type=EXPORT_FORMATS[export_format], headers={
+        'Content-Disposition': f'attachment; filename="{collection}.{export_format}"'
+    })
+
+@app.get("/export/drivers")
+async def export_drivers(format: str = 'csv'):
+    return export_response('drivers', format)
+
+@app.get("/export/teams")
+async def export_teams(format: str = 'csv'):
+    return export_response('teams', format)
+
+# Bulk import. Rows are validated against the record's schema, names are
+# checked for clashes within the file and against the name index in one pass,
+# and the valid rows are written with chunked WriteBatch commits: a document
+# plus its name reservation per row. A chunk hitting a reservation taken in
+# the meantime is retried row by row, so only the clashing rows fail.
+IMPORT_FORMATS = ('csv', 'ndjson')
+IMPORT_ROWS_PER_BATCH = FIRESTORE_WRITE_LIMIT // 2
+
+class ImportTarget:
+    def __init__(self, collection_ref, names_ref, record_type: type, index: CollectionIndex,
+                 cache: CollectionCache, label: str):
+        self.collection_ref = collection_ref
+        self.names_ref = names_ref
+        self.record_type = record_type
+        self.index = index
+        self.cache = cache
+        self.label = label
+
+IMPORT_TARGETS = {
+    'drivers': ImportTarget(drivers_ref, driver_names_ref, Driver, drivers_index, drivers_cache, "Driver"),
+    'teams': ImportTarget(teams_ref, team_names_ref, Team, teams_index, teams_cache, "Team")
+}
+
+def import_format(filename: Optional[str], import_format: Optional[str] = None) -> str:
+    if import_format:
+        if import_format not in IMPORT_FORMATS:
+            raise ValueError(f"Unknown import format '{import_format}'")
+        return import_format
+    if filename and filename.lower().endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    return 'csv'
+
+# Parsed rows of an upload; unparseable NDJSON lines come through as None
+def parse_import(content: bytes, import_format: str):
+    text = content.decode('utf-8-sig')
+    if import_format == 'csv':
+        yield from csv.DictReader(io.StringIO(text))
+        return
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            row = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            row = None
+        yield row if isinstance(row, dict) else None
+
+# The document to write for one row, or raise ValueError saying what is wrong
+def validate_import_row(target: ImportTarget, row: Optional[Dict[str, Any]], team_ids: set) -> Dict[str, Any]:
+    if row is None:
+        raise ValueError("Row is not a JSON object")
+    name = str(row.get('name') or '').strip()
+    if not name:
+        raise ValueError("Name is required")
+    data = {'name': name}
+    for field, field_type in target.record_type.numeric_fields.items():
+        value = row.get(field)
+        if value is None or str(value).strip() == '':
+            raise ValueError(f"{field} is required")
+        # JSON values are taken only when the conversion loses nothing
+        if isinstance(value, bool):
+            raise ValueError(f"Invalid value for {field}: {orjson.dumps(value).decode()}")
+        if field_type is int and isinstance(value, float) and not value.is_integer():
+            raise ValueError(f"{field} must be a whole number: {value}")
+        try:
+            data[field] = field_type(value.strip() if isinstance(value, str) else value)
+        except (TypeError, ValueError, OverflowError):
+            raise ValueError(f"Invalid value for {field}: {value}")
+    if target.record_type is Driver:
+        team_id = str(row.get('team_id') or '').strip()
+        if not team_id and row.get('team_name'):
+            team_id = teams_index.name_owner(str(row['team_name'])) or ''
+            if not team_id:
+                raise ValueError(f"Unknown team '{row['team_name']}'")
+        if team_id and team_id not in team_ids:
+            raise ValueError(f"Unknown team id '{team_id}'")
+        data['team_id'] = team_id
+    return data
+
+def write_import_chunk(target: ImportTarget, chunk: list) -> list:
+    batch = db.batch()
+    doc_refs = []
+    for _, data in chunk:
+        doc_ref = target.collection_ref.document()
+        batch.create(name_reservation(target.names_ref, data['name']), {'name_lower': data['name_lower'], 'owner_id': doc_ref.id})
+        batch.set(doc_ref, data)
+        doc_refs.append(doc_ref)
+    batch.commit()
+    for doc_ref, (_, data) in zip(doc_refs, chunk):
+        target.cache.put(doc_ref.id, data)
+    return [doc_ref.id for doc_ref in doc_refs]
+
+# Import rows into a collection. Returns how many were imported, their ids and
+# a list of {row, name, error} for every rejected row, rows counted from 1.
+def import_records(collection: str, rows, dry_run: bool = False) -> Dict[str, Any]:
+    target = IMPORT_TARGETS.get(collection)
+    if target is None:
+        raise ValueError(f"Unknown collection '{collection}'")
+    target.cache.ensure_index()
+    team_ids = {record.id for record in teams_cache.records()} if target.record_type is Driver else set()
+
+    errors = []
+    valid = []
+    seen = {}
+    for number, row in enumerate(rows, 1):
+        try:
+            data = validate_import_row(target, row, team_ids)
+            data['name_lower'] = normalize_name(data['name'])
+            if data['name_lower'] in seen:
+                raise ValueError(f"Duplicate of row {seen[data['name_lower']]}")
+            if target.index.name_owner(data['name']) is not None:
+                raise ValueError(f"{target.label} '{data['name']}' already exists")
+        except ValueError as err:
+            errors.append({'row': number, 'name': (row or {}).get('name'), 'error': str(err)})
+            continue
+        seen[data['name_lower']] = number
+        valid.append((number, data))
+
+    ids = []
+    if not dry_run:
+        for start in range(0, len(valid), IMPORT_ROWS_PER_BATCH):
+            chunk = valid[start:start + IMPORT_ROWS_PER_BATCH]
+            try:
+                ids.extend(write_import_chunk(target, chunk))
+            except Conflict:
+                for number, data in chunk:
+                    try:
+                        ids.extend(write_import_chunk(target, [(number, data)]))
+                    except Conflict:
+                        errors.append({'row': number, 'name': data['name'],
+                                       'error': f"{target.label} '{data['name']}' already exists"})
+
+    errors.sort(key=lambda error: error['row'])
+    return {'imported': len(ids), 'valid': len(valid), 'ids': ids, 'errors': errors, 'dry_run': dry_run}
+
+async def import_upload(request: Request, collection: str, file: UploadFile, format: Optional[str],
+                        dry_run: bool, auth: tuple) -> Response:
+    user_token, error_message = auth
+    if not user_token:
+        return api_response(request, {'detail': error_message or "Login required"}, 401)
+    try:
+        rows = parse_import(await file.read(), import_format(file.filename, format))
+        report = await run_blocking(import_records, collection, rows, dry_run)
+    except (UnicodeDecodeError, csv.Error) as err:
+        return api_response(request, {'detail': f"Could not read the file: {err}"}, 400)
+    except ValueError as err:
+        return api_response(request, {'detail': str(err)}, 400)
+    return api_response(request, report)
+
+@app.post("/import/drivers")
+async def import_drivers(request: Request, file: UploadFile = File(...), format: Optional[str] = Form(None),
+                         dry_run: bool = Form(False), auth: tuple = Depends(get_auth)):
+    return await import_upload(request, 'drivers', file, format, dry_run, auth)
+
+@app.post("/import/teams")
+async def import_teams(request: Request, file: UploadFile = File(...), format: Optional[str] = Form(None),
+                       dry_run: bool = Form(False), auth: tuple = Depends(get_auth)):
+    return await import_upload(request, 'teams', file, format, dry_run, auth)
+
+# One-off backfill for documents written before names were normalized: sets
+# name_lower and creates the missing name reservations, a page at a time with
+# one get_all for the page's reservations and one batch for its writes.
+# Documents whose name is already reserved by another document are reported
+# as duplicates and left for a person to rename.
+def backfill_names(collection: str, dry_run: bool = False) -> Dict[str, Any]:
+    target = IMPORT_TARGETS.get(collection)
+    if target is None:
+        raise ValueError(f"Unknown collection '{collection}'")
+    report = {'collection': collection, 'scanned': 0, 'name_lower_set': 0, 'reserved': 0,
+              'duplicates': [], 'unnamed': [], 'dry_run': dry_run}
+    owners = {}
+    for docs in stream_pages(target.collection_ref, IMPORT_ROWS_PER_BATCH):
+        report['scanned'] += len(docs)
+        named = []
+        for doc in docs:
+            data = doc.to_dict() or {}
+            name = data.get('name')
+            if isinstance(name, str) and name.strip():
+                named.append((doc, data, name, normalize_name(name)))
+            else:
+                report['unnamed'].append(doc.id)
+        reservations = {reservation.id: reservation for reservation in
+                        db.get_all([name_reservation(target.names_ref, name) for _, _, name, _ in named])}
+
+        batch = db.batch()
+        writes = 0
+        for doc, data, name, name_lower in named:
+            if data.get('name_lower') != name_lower:
+                batch.update(doc.reference, {'name_lower': name_lower})
+                report['name_lower_set'] += 1
+                writes += 1
+            reservation_ref = name_reservation(target.names_ref, name)
+            reservation = reservations.get(reservation_ref.id)
+            owner_id = owners.get(name_lower)
+            if owner_id is None and reservation is not None and reservation.exists:
+                owner_id = reservation.get('owner_id')
+            if owner_id is None:
+                batch.create(reservation_ref, {'name_lower': name_lower, 'owner_id': doc.id})
+                report['reserved'] += 1
+                writes += 1
+                owner_id = doc.id
+            elif owner_id != doc.id:
+                report['duplicates'].append({'id': doc.id, 'name': name, 'owner_id': owner_id})
+            owners[name_lower] = owner_id
+        if writes and not dry_run:
+            batch.commit()
+    return report
+
+def cli_backfill_names(args):
+    for collection in args.collections:
+        if collection not in IMPORT_TARGETS:
+            sys.exit(f"Unknown collection '{collection}'")
+    reports = [backfill_names(collection, args.dry_run) for collection in args.collections or IMPORT_TARGETS]
+    sys.stdout.buffer.write(orjson.dumps(reports, option=orjson.OPT_INDENT_2) + b'\n')
+    if any(report['duplicates'] for report in reports):
+        sys.exit(1)
+
+def cli_import(args):
+    with open(args.file, 'rb') as f:
+        rows = parse_import(f.read(), import_format(args.file, args.format))
+        report = import_records(args.collection, rows, args.dry_run)
+    sys.stdout.buffer.write(orjson.dumps(report, option=orjson.OPT_INDENT_2) + b'\n')
+    if report['errors']:
+        sys.exit(1)
+
+def cli_export(args):
+    output = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        for chunk in export_chunks(args.collection, args.format):
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+
+# Asset build. Stylesheets and scripts under static/ are minified and written
+# to static/dist under a content hash, each with a .gz and, when brotli is
+# installed, a .br sibling. With --vendor the modules the scripts import from
+# gstatic are downloaded and built alongside them, and the Font Awesome icons
+# the templates use are inlined into icons.css, so pages load nothing from CDNs.
+FONT_AWESOME_SVG_URL = 'https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.0.0/svgs/solid/{}.svg'
+REMOTE_IMPORT = re.compile(r'''(\bfrom\s*|\bimport\s*\(?\s*)(["'])(https://www\.gstatic\.com/[^"']+\.js)\2''')
+
+# Icon names the templates use that Font Awesome 6 renamed
+ICON_ALIASES = {
+    'balance-scale': 'scale-balanced',
+    'edit': 'pen-to-square',
+    'exclamation-circle': 'circle-exclamation',
+    'home': 'house',
+    'search': 'magnifying-glass',
+    'sign-in-alt': 'right-to-bracket',
+    'sign-out-alt': 'right-from-bracket',
+    'sync-alt': 'rotate'
+}
+
+def minify_css(source: str) -> str:
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(r'\s*([{};,>])\s*', r'\1', source)
+    source = re.sub(r':\s+', ':', source)
+    return source.replace(';}', '}').strip()
+
+# Drops indentation, blank lines and whole-line comments. Scripts with
+# template literals are left alone, as their whitespace is content.
+def minify_js(source: str) -> str:
+    if '`' in source:
+        return source
+    lines = (line.strip() for line in source.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//')) + '\n'
+
+def fetch_url(url: str) -> bytes:
+    with urllib.request.urlopen(url, timeout=30) as response:
+        return response.read()
+
+# Write one built asset and its compressed variants, recording it in the manifest
+def write_asset(relative_path: str, body: bytes, manifest: Dict[str, str]) -> str:
+    stem, extension = os.path.splitext(relative_path)
+    built = f"{stem}.{hashlib.sha256(body).hexdigest()[:12]}{extension}"
+    path = os.path.join(ASSET_DIST_DIR, built)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(body)
+    with open(path + '.gz', 'wb') as f:
+        f.write(gzip.compress(body, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(body, quality=11))
+    manifest[relative_path] = 'dist/' + built
+    return built
+
+# Point a script's gstatic imports at vendored copies, building each module once
+def vendor_imports(source: str, relative_path: str, manifest: Dict[str, str], vendored: Dict[str, str]) -> str:
+    def replace(match):
+        url = match.group(3)
+        if url not in vendored:
+            name = 'vendor/' + url.rsplit('/', 1)[1]
+            module = vendor_imports(fetch_url(url).decode('utf-8'), name, manifest, vendored)
+            vendored[url] = write_asset(name, module.encode('utf-8'), manifest)
+        specifier = os.path.relpath(vendored[url], os.path.dirname(relative_path) or '.').replace(os.sep, '/')
+        if not specifier.startswith('.'):
+            specifier = './' + specifier
+        return match.group(1) + match.group(2) + specifier + match.group(2)
+    return REMOTE_IMPORT.sub(replace, source)
+
+# One mask-image rule per icon, drawn in the text colour at the icon's own aspect ratio
+def build_icons(manifest: Dict[str, str]):
+    used = set()
+    for name in templates.env.list_templates(extensions=['html']):
+        source, _, _ = templates.env.loader.get_source(templates.env, name)
+        used.update(re.findall(r'\bfa-([a-z0-9-]+)', source))
+
+    rules = ['.fas{display:inline-block;height:1em;vertical-align:-.125em;background-color:currentColor;'
+             '-webkit-mask:var(--fa-icon) no-repeat center/contain;mask:var(--fa-icon) no-repeat center/contain}']
+    for icon in sorted(used):
+        svg = fetch_url(FONT_AWESOME_SVG_URL.format(ICON_ALIASES.get(icon, icon)))
+        width, height = re.search(rb'viewBox="0 0 (\d+) (\d+)"', svg).groups()
+        data = base64.b64encode(svg).decode('ascii')
+        rules.append(f'.fa-{icon}{{width:{int(width) / int(height):.4g}em;'
+                     f'--fa-icon:url("data:image/svg+xml;base64,{data}")}}')
+    write_asset('icons.css', '\n'.join(rules).encode('utf-8'), manifest)
+
+def cli_build_assets(args):
+    manifest = {}
+    vendored = {}
+    shutil.rmtree(ASSET_DIST_DIR, ignore_errors=True)
+    for root, dirs, files in os.walk('static'):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != ASSET_DIST_DIR)
+        for file_name in sorted(files):
+            relative_path = os.path.relpath(os.path.join(root, file_name), 'static').replace(os.sep, '/')
+            extension = os.path.splitext(file_name)[1]
+            if extension not in ('.css', '.js'):
+                continue
+            with open(os.path.join(root, file_name), encoding='utf-8') as f:
+                source = f.read()
+            if extension == '.css':
+                body = minify_css(source)
+            else:
+                body = minify_js(source)
+                if args.vendor:
+                    body = vendor_imports(body, relative_path, manifest, vendored)
+            write_asset(relative_path, body.encode('utf-8'), manifest)
+    if args.vendor:
+        build_icons(manifest)
+
+    with open(ASSET_MANIFEST, 'wb') as f:
+        f.write(orjson.dumps(manifest, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS))
+    print(f"Built {len(manifest)} assets into {ASSET_DIST_DIR}" + ("" if brotli else " (no brotli variants, brotli is not installed)"))
+
+# Compression benchmark against a running server. Each route is fetched
+# uncompressed, with gzip and with brotli; for each coding it reports the bytes
+# saved, the extra server time, and the net time saved once the transfer at
+# --bandwidth-kbps (default: mobile Lighthouse throttling) is counted.
+BENCH_ROUTES = ['/', '/query-drivers', '/query-teams', '/compare-drivers', '/compare-teams', '/analytics',
+                '/api/drivers', '/export/drivers']
+
+def fetch_encoded(url: str, coding: str, cookie: Optional[str]) -> tuple:
+    headers = {'Accept-Encoding': coding}
+    if cookie:
+        headers['Cookie'] = f"token={cookie}"
+    start = time.perf_counter()
+    with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=60) as response:
+        body = response.read()
+        served = response.headers.get('Content-Encoding', 'identity')
+    return len(body), time.perf_counter() - start, served
+
+def cli_bench_compression(args):
+    print(f"{'route':<20} {'coding':<8} {'bytes':>9} {'saved':>9} {'ratio':>6} {'server ms':>10} {'net saved ms':>13}")
+    for route in args.routes or BENCH_ROUTES:
+        url = args.url.rstrip('/') + route
+        results = {}
+        try:
+            for coding in ('identity', 'gzip', 'br'):
+                runs = [fetch_encoded(url, coding, args.token) for _ in range(args.repeat)]
+                results[coding] = (runs[0][0], statistics.median(run[1] for run in runs), runs[0][2])
+        except urllib.error.URLError as err:
+            print(f"{route:<20} error: {err}")
+            continue
+
+        identity_bytes, identity_time, _ = results['identity']
+        print(f"{route:<20} {'identity':<8} {identity_bytes:>9} {0:>9} {1:>6.2f} {identity_time * 1000:>10.1f} {0:>13.1f}")
+        for coding in ('gzip', 'br'):
+            size, elapsed, served = results[coding]
+            if served != coding:
+                print(f"{route:<20} {coding:<8} {'not served':>9}")
+                continue
+            transfer_saved = (identity_bytes - size) * 8 / (args.bandwidth_kbps * 1000)
+            net_saved = transfer_saved - (elapsed - identity_time)
+            print(f"{route:<20} {coding:<8} {size:>9} {identity_bytes - size:>9} {size / max(identity_bytes, 1):>6.2f} "
+                  f"{elapsed * 1000:>10.1f} {net_saved * 1000:>13.1f}")
+
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
+metrics.observe('f1_import_seconds', "Time to import the application module", IMPORT_SECONDS)
+
+# Command line entry point, e.g. `python main.py export drivers --format ndjson -o drivers.ndjson`
+# or `python main.py import drivers drivers.csv --dry-run`, or `python main.py build-assets --vendor`
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Formula 1 database tools")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = commands.add_parser('export', help="Export a collection as CSV or NDJSON")
+    export_parser.add_argument('collection', choices=list(EXPORT_COLUMNS))
+    export_parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='csv')
+    export_parser.add_argument('-o', '--output', help="File to write, standard output by default")
+    export_parser.set_defaults(handler=cli_export)
+
+    import_parser = commands.add_parser('import', help="Import a CSV or NDJSON file into a collection")
+    import_parser.add_argument('collection', choices=list(IMPORT_TARGETS))
+    import_parser.add_argument('file')
+    import_parser.add_argument('--format', choices=IMPORT_FORMATS, help="Taken from the file extension by default")
+    import_parser.add_argument('--dry-run', action='store_true', help="Validate the rows without writing them")
+    import_parser.set_defaults(handler=cli_import)
+
+    backfill_parser = commands.add_parser('backfill-names',
+                                          help="Set name_lower and reserve the names of existing documents")
+    backfill_parser.add_argument('collections', nargs='*',
+                                 help=f"Collections to backfill out of {', '.join(IMPORT_TARGETS)}, all of them by default")
+    backfill_parser.add_argument('--dry-run', action='store_true', help="Report what would change without writing")
+    backfill_parser.set_defaults(handler=cli_backfill_names)
+
+    build_parser = commands.add_parser('build-assets', help="Minify, fingerprint and precompress the static assets")
+    build_parser.add_argument('--vendor', action='store_true',
+                              help="Also vendor the Firebase modules and the Font Awesome icons the templates use")
+    build_parser.set_defaults(handler=cli_build_assets)
+
+    bench_parser = commands.add_parser('bench-compression', help="Measure response compression against a running server")
+    bench_parser.add_argument('routes', nargs='*', help=f"Routes to fetch, by default {' '.join(BENCH_ROUTES)}")
+    bench_parser.add_argument('--url', default='http://localhost:8000')
+    bench_parser.add_argument('--token', help="Firebase ID token to send as the token cookie")
+    bench_parser.add_argument('--repeat', type=int, default=5)
+    bench_parser.add_argument('--bandwidth-kbps', type=float, default=1600)
+    bench_parser.set_defaults(handler=cli_bench_compression)
+
+    args = parser.parse_args(argv)
+    args.handler(args)
+
+if __name__ == '__main__':
+    main()
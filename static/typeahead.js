@@ -0,0 +1,93 @@
+'use strict';
+
+// Typeahead search and "load more" paging for the driver and team dropdowns.
+// Every <select data-search-url="..."> gets a search box above it, and its
+// options are fetched from the JSON search endpoint one page at a time.
+document.addEventListener("DOMContentLoaded", function() {
+    document.querySelectorAll("select[data-search-url]").forEach(setupTypeahead);
+});
+
+function setupTypeahead(select) {
+    const searchUrl = select.dataset.searchUrl;
+    const pageSize = select.dataset.pageSize || "50";
+    let query = "";
+    let cursor = select.dataset.nextCursor || "";
+    let debounceTimer = null;
+
+    const searchInput = document.createElement("input");
+    searchInput.type = "search";
+    searchInput.className = "typeahead-input";
+    searchInput.placeholder = "Type to search...";
+    select.parentNode.insertBefore(searchInput, select);
+
+    const moreButton = document.createElement("button");
+    moreButton.type = "button";
+    moreButton.className = "typeahead-more";
+    moreButton.innerText = "Load more";
+    select.parentNode.insertBefore(moreButton, select.nextSibling);
+    updateMoreButton();
+
+    searchInput.addEventListener("input", function() {
+        clearTimeout(debounceTimer);
+        debounceTimer = setTimeout(function() {
+            query = searchInput.value.trim();
+            cursor = "";
+            fetchPage(true);
+        }, 250);
+    });
+
+    moreButton.addEventListener("click", function() {
+        fetchPage(false);
+    });
+
+    function updateMoreButton() {
+        moreButton.hidden = !cursor;
+    }
+
+    function fetchPage(replace) {
+        const params = new URLSearchParams({ q: query, page_size: pageSize });
+        if (cursor) {
+            params.set("cursor", cursor);
+        }
+
+        fetch(searchUrl + "?" + params.toString())
+            .then((response) => {
+                if (!response.ok) {
+                    throw new Error("Search failed with status " + response.status);
+                }
+                return response.json();
+            })
+            .then((data) => {
+                if (replace) {
+                    clearOptions();
+                }
+                data.items.forEach(addOption);
+                cursor = data.next_cursor || "";
+                updateMoreButton();
+            })
+            .catch((error) => {
+                console.error("Error searching:", error);
+                cursor = "";
+                updateMoreButton();
+            });
+    }
+
+    // Keep the placeholder and the current selection when replacing the options
+    function clearOptions() {
+        Array.from(select.options).forEach((option) => {
+            if (option.value && !option.selected) {
+                option.remove();
+            }
+        });
+    }
+
+    function addOption(item) {
+        if (select.querySelector('option[value="' + CSS.escape(item.id) + '"]')) {
+            return;
+        }
+        const option = document.createElement("option");
+        option.value = item.id;
+        option.textContent = item.name;
+        select.appendChild(option);
+    }
+}
@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# main.py resolves templates/ and static/ relative to the working directory
+os.chdir(ROOT)
+
+import main  # noqa: E402
+from fake_firestore import FakeClient, fake_transactional  # noqa: E402
+
+TEST_TOKEN = 'test-token'
+
+
+# Every test gets an empty fake Firestore and cold caches and indexes
+@pytest.fixture(autouse=True)
+def fake_db(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(main.db, '_lazy_client', client)
+    monkeypatch.setattr(main.firestore, 'transactional', fake_transactional)
+    monkeypatch.setattr(main, 'REQUEST_LOG', False)
+    for ref in (main.drivers_ref, main.teams_ref, main.driver_names_ref, main.team_names_ref):
+        monkeypatch.setattr(ref, '_ref', None)
+    for sync in (main.drivers_sync, main.teams_sync):
+        sync.stop()
+    for cache in (main.drivers_cache, main.teams_cache):
+        cache.index.__init__(cache.index.numeric_fields, cache.index.group_field)
+        cache.clear()
+        cache._notify(None, {})
+    main.fragments._entries.clear()
+    yield client
+    for sync in (main.drivers_sync, main.teams_sync):
+        sync.stop()
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+# A signed-in session: the token's claims are already cached, so no cert fetch happens
+@pytest.fixture
+def auth_client(client):
+    main.token_cache.put(TEST_TOKEN, {'email': 'tester@example.com', 'exp': time.time() + 3600})
+    client.cookies.set('token', TEST_TOKEN)
+    return client
+
+
+def seed_drivers(fake_db, count=3, **overrides):
+    drivers = {}
+    for number in range(1, count + 1):
+        name = f"Driver {number}"
+        drivers[f"d{number}"] = dict({
+            'name': name,
+            'name_lower': main.normalize_name(name),
+            'age': 20 + number,
+            'total_pole_positions': number,
+            'total_race_wins': number * 2,
+            'total_points_scored': number * 10.5,
+            'total_world_titles': number % 2,
+            'total_fastest_laps': number,
+            'team_id': 't1' if number % 2 else 't2'
+        }, **overrides)
+    fake_db.seed('drivers', drivers)
+    return drivers
+
+
+def seed_teams(fake_db):
+    teams = {
+        't1': {'name': "Team One", 'name_lower': "team one", 'year_founded': 1950, 'total_pole_positions': 10,
+               'total_race_wins': 20, 'total_constructor_titles': 3, 'previous_season_position': 2},
+        't2': {'name': "Team Two", 'name_lower': "team two", 'year_founded': 1970, 'total_pole_positions': 5,
+               'total_race_wins': 8, 'total_constructor_titles': 1, 'previous_season_position': 5}
+    }
+    fake_db.seed('teams', teams)
+    return teams
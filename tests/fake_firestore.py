@@ -0,0 +1,296 @@
+# In-memory stand-in for the parts of the Firestore client main.py uses:
+# collection and document references, where/order_by/limit/start_after
+# queries, get_all, write batches, transactions and on_snapshot watches.
+import copy
+import itertools
+import operator
+import threading
+
+from google.api_core.exceptions import Conflict, NotFound
+
+OPERATORS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'in': lambda value, options: value in options
+}
+
+_auto_ids = itertools.count(1)
+
+
+# Sort key of a value in Firestore's cross-type order: null, booleans,
+# numbers (ints and floats together), strings, then everything else
+def firestore_order(value):
+    if value is None:
+        return (0,)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, str):
+        return (3, value)
+    return (4, repr(value))
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = copy.deepcopy(data)
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+    def get(self, field):
+        return (self._data or {}).get(field)
+
+
+class FakeDocumentReference:
+    def __init__(self, client, collection, doc_id):
+        self._client = client
+        self._path = (collection, doc_id)
+        self.id = doc_id
+
+    def get(self, transaction=None):
+        return FakeSnapshot(self, self._client.read(self._path))
+
+    def set(self, data, merge=False):
+        self._client.apply([('set', self._path, data)])
+
+    def update(self, data):
+        self._client.apply([('update', self._path, data)])
+
+    def delete(self):
+        self._client.apply([('delete', self._path, None)])
+
+    def create(self, data):
+        self._client.apply([('create', self._path, data)])
+
+
+class FakeChange:
+    def __init__(self, kind, document):
+        self.type = type('ChangeType', (), {'name': kind})()
+        self.document = document
+
+
+class FakeWatch:
+    def __init__(self, client, collection, callback):
+        self.client = client
+        self.collection = collection
+        self.callback = callback
+        self.closed = False
+
+    @property
+    def is_active(self):
+        return not self.closed
+
+    # Also how a test ends the stream, as a dropped connection would
+    def unsubscribe(self):
+        self.closed = True
+        if self in self.client.watches:
+            self.client.watches.remove(self)
+
+
+class FakeQuery:
+    def __init__(self, client, collection, filters=(), orders=(), limit=None, start_after=None):
+        self._client = client
+        self._collection = collection
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._start_after = start_after
+
+    def _copy(self, **changes):
+        state = dict(filters=self._filters, orders=self._orders, limit=self._limit, start_after=self._start_after)
+        state.update(changes)
+        return FakeQuery(self._client, self._collection, **state)
+
+    def where(self, field, op, value):
+        return self._copy(filters=self._filters + ((field, op, value),))
+
+    def order_by(self, field, direction='ASCENDING'):
+        return self._copy(orders=self._orders + ((str(field), direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, snapshot):
+        return self._copy(start_after=snapshot)
+
+    @staticmethod
+    def _value(doc_id, data, field):
+        return doc_id if field == '__name__' else data.get(field)
+
+    def _matches(self, doc_id, data):
+        for field, op, value in self._filters:
+            if field != '__name__' and field not in data:
+                return False
+            try:
+                if not OPERATORS[op](self._value(doc_id, data, field), value):
+                    return False
+            except TypeError:
+                return False
+        return all(field == '__name__' or field in data for field, _ in self._orders)
+
+    def _sort_key(self, item):
+        doc_id, data = item
+        return tuple(firestore_order(self._value(doc_id, data, field)) for field, _ in self._orders) + \
+            (firestore_order(doc_id),)
+
+    # A snapshot cursor holds the full sort key; a dict cursor holds values
+    # for a prefix of the order_by fields, '__name__' given as a reference
+    def _cursor(self):
+        if not isinstance(self._start_after, dict):
+            return self._sort_key((self._start_after.id, self._start_after.to_dict() or {}))
+        values = []
+        for field, _ in self._orders:
+            if field not in self._start_after:
+                break
+            value = self._start_after[field]
+            values.append(firestore_order(value.id if field == '__name__' else value))
+        return tuple(values)
+
+    def stream(self, transaction=None):
+        self._client.stream_calls += 1
+        self._client.queries.append((self._collection, self._filters))
+        docs = [(doc_id, data) for doc_id, data in self._client.documents(self._collection).items()
+                if self._matches(doc_id, data)]
+        docs.sort(key=self._sort_key)
+        if self._start_after is not None:
+            cursor = self._cursor()
+            docs = [item for item in docs if self._sort_key(item)[:len(cursor)] > cursor]
+        if self._limit is not None:
+            docs = docs[:self._limit]
+        for doc_id, data in docs:
+            self._client.documents_read += 1
+            yield FakeSnapshot(FakeDocumentReference(self._client, self._collection, doc_id), data)
+
+    def get(self, transaction=None):
+        return list(self.stream(transaction))
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, client, collection):
+        super().__init__(client, collection)
+        self.id = collection
+
+    def document(self, doc_id=None):
+        return FakeDocumentReference(self._client, self._collection, doc_id or f"auto{next(_auto_ids)}")
+
+    def on_snapshot(self, callback):
+        watch = FakeWatch(self._client, self._collection, callback)
+        self._client.watches.append(watch)
+        docs = [FakeSnapshot(FakeDocumentReference(self._client, self._collection, doc_id), data)
+                for doc_id, data in self._client.documents(self._collection).items()]
+        callback(docs, [FakeChange('ADDED', doc) for doc in docs], None)
+        return watch
+
+
+class FakeWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def create(self, reference, data):
+        self._writes.append(('create', reference._path, data))
+
+    def set(self, reference, data, merge=False):
+        self._writes.append(('set', reference._path, data))
+
+    def update(self, reference, data):
+        self._writes.append(('update', reference._path, data))
+
+    def delete(self, reference):
+        self._writes.append(('delete', reference._path, None))
+
+    def commit(self):
+        writes, self._writes = self._writes, []
+        # commits that write nothing are not counted
+        self._client.commits += bool(writes)
+        self._client.largest_commit = max(self._client.largest_commit, len(writes))
+        self._client.apply(writes)
+        return writes
+
+
+class FakeTransaction(FakeWriteBatch):
+    pass
+
+
+# Runs the function and commits, standing in for firestore.transactional
+def fake_transactional(function):
+    def run(transaction, *args, **kwargs):
+        result = function(transaction, *args, **kwargs)
+        transaction.commit()
+        return result
+    return run
+
+
+class FakeClient:
+    def __init__(self):
+        self.data = {}
+        self.watches = []
+        self.stream_calls = 0
+        self.queries = []
+        self.get_all_calls = 0
+        self.documents_read = 0
+        self.commits = 0
+        self.largest_commit = 0
+        self._lock = threading.RLock()
+
+    def documents(self, collection):
+        with self._lock:
+            return copy.deepcopy(self.data.get(collection, {}))
+
+    def read(self, path):
+        with self._lock:
+            return copy.deepcopy(self.data.get(path[0], {}).get(path[1]))
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def transaction(self, **kwargs):
+        return FakeTransaction(self)
+
+    def get_all(self, references):
+        self.get_all_calls += 1
+        for reference in references:
+            yield FakeSnapshot(reference, self.read(reference._path))
+
+    # Apply writes all or nothing, then tell the collection's watches
+    def apply(self, writes):
+        with self._lock:
+            for kind, (collection, doc_id), _ in writes:
+                exists = doc_id in self.data.get(collection, {})
+                if kind == 'create' and exists:
+                    raise Conflict(f"Document {collection}/{doc_id} already exists")
+                if kind == 'update' and not exists:
+                    raise NotFound(f"No document to update: {collection}/{doc_id}")
+            changes = []
+            for kind, (collection, doc_id), data in writes:
+                documents = self.data.setdefault(collection, {})
+                if kind == 'delete':
+                    if documents.pop(doc_id, None) is not None:
+                        changes.append((collection, 'REMOVED', doc_id, None))
+                    continue
+                change = 'MODIFIED' if doc_id in documents else 'ADDED'
+                if kind == 'update':
+                    documents[doc_id] = dict(documents[doc_id], **copy.deepcopy(data))
+                else:
+                    documents[doc_id] = copy.deepcopy(data)
+                changes.append((collection, change, doc_id, documents[doc_id]))
+        for collection, change, doc_id, data in changes:
+            reference = FakeDocumentReference(self, collection, doc_id)
+            for watch in list(self.watches):
+                if watch.collection == collection:
+                    watch.callback([], [FakeChange(change, FakeSnapshot(reference, data))], None)
+
+    # Seed documents directly, without notifying watches
+    def seed(self, collection, documents):
+        with self._lock:
+            self.data.setdefault(collection, {}).update(copy.deepcopy(documents))
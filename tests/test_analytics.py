@@ -0,0 +1,40 @@
+import main
+from conftest import seed_drivers, seed_teams
+
+
+def test_analytics_report_summarises_filtered_drivers_by_team(fake_db):
+    seed_teams(fake_db)
+    seed_drivers(fake_db, 4)
+
+    report = main.analytics_report(main.driver_columns, 'total_race_wins', [('age', 'gt', 21)], bins=2)
+
+    assert report['matched'] == 3
+    summary = report['summary']
+    assert (summary['count'], summary['sum'], summary['mean'], summary['min'], summary['max']) == (3, 18.0, 6.0, 4.0, 8.0)
+    assert report['histogram'] == {'edges': [4.0, 6.0, 8.0], 'counts': [1, 2]}
+    fields = report['correlation']['fields']
+    assert report['correlation']['matrix'][fields.index('age')][fields.index('total_race_wins')] == 1.0
+    groups = {group['key']: (group['name'], group['count'], group['sum']) for group in report['groups']}
+    assert groups == {'t1': ("Team One", 1, 6.0), 't2': ("Team Two", 2, 12.0)}
+
+
+def test_columns_coerce_legacy_strings_and_skip_missing_values(fake_db):
+    seed_drivers(fake_db, 2)
+    fake_db.seed('drivers', {'d3': {'name': "Driver 3", 'total_race_wins': "10", 'team_id': ''},
+                             'd4': {'name': "Driver 4", 'total_race_wins': "n/a"}})
+
+    report = main.analytics_report(main.driver_columns, 'total_race_wins', [])
+
+    assert report['matched'] == 4
+    assert report['summary']['count'] == 3
+    assert report['summary']['max'] == 10.0
+    assert {group['key']: group['name'] for group in report['groups']}[''] == 'No team'
+
+
+def test_columns_are_rebuilt_after_a_write(fake_db):
+    seed_drivers(fake_db, 2)
+    assert main.analytics_report(main.driver_columns, 'age', [])['summary']['max'] == 22.0
+
+    main.update_driver_record('d1', {'name': "Driver 1", 'age': 50})
+
+    assert main.analytics_report(main.driver_columns, 'age', [])['summary']['max'] == 50.0
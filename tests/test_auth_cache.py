@@ -0,0 +1,75 @@
+import time
+
+import main
+
+
+class FakeResponse:
+    def __init__(self, status=200, cache_control=''):
+        self.status = status
+        self.headers = {'cache-control': cache_control} if cache_control else {}
+
+
+def make_adapter(responses):
+    calls = []
+    factories = []
+
+    def transport(url, method='GET', **kwargs):
+        calls.append((url, method))
+        return responses[url]
+
+    def factory():
+        factories.append(1)
+        return transport
+
+    return main.CachingAuthRequest(factory), calls, factories
+
+
+def test_token_cache_drops_expired_claims():
+    cache = main.TokenCache()
+    cache.put('live', {'exp': time.time() + 60})
+    cache.put('expired', {'exp': time.time() - 1})
+
+    assert cache.get('live') is not None
+    assert cache.get('expired') is None
+    assert cache.get('unknown') is None
+    assert len(cache._entries) == 1
+
+
+def test_token_cache_evicts_the_least_recently_used_token():
+    cache = main.TokenCache(max_entries=2)
+    cache.put('a', {'exp': time.time() + 60})
+    cache.put('b', {'exp': time.time() + 60})
+    cache.get('a')
+    cache.put('c', {'exp': time.time() + 60})
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+
+
+def test_caching_auth_request_keeps_responses_for_their_max_age(monkeypatch):
+    adapter, calls, factories = make_adapter({'certs': FakeResponse(cache_control='public, max-age=300')})
+    now = time.time()
+    monkeypatch.setattr(main.time, 'time', lambda: now)
+
+    first = adapter('certs')
+    assert adapter('certs') is first
+    assert len(calls) == 1 and len(factories) == 1
+
+    now += 301
+    adapter('certs')
+    assert len(calls) == 2 and len(factories) == 1
+
+
+def test_caching_auth_request_only_caches_successful_gets_with_a_max_age():
+    adapter, calls, _ = make_adapter({
+        'no-cache': FakeResponse(cache_control='no-store'),
+        'error': FakeResponse(status=500, cache_control='max-age=300'),
+        'certs': FakeResponse(cache_control='max-age=300')
+    })
+
+    for url in ('no-cache', 'no-cache', 'error', 'error'):
+        adapter(url)
+    adapter('certs', method='POST', body=b'{}')
+    adapter('certs', method='POST', body=b'{}')
+
+    assert len(calls) == 6
@@ -0,0 +1,98 @@
+import hashlib
+
+import orjson
+import pytest
+
+import main
+from conftest import seed_drivers, seed_teams
+
+
+def reservation_id(name):
+    return hashlib.sha256(main.normalize_name(name).encode('utf-8')).hexdigest()
+
+
+def test_backfill_sets_name_lower_and_reserves_names(fake_db):
+    fake_db.seed('drivers', {'d1': {'name': "Lewis Hamilton"}, 'd2': {'name': " Max Verstappen "}, 'd3': {'age': 30}})
+
+    report = main.backfill_names('drivers')
+
+    assert report['scanned'] == 3
+    assert report['name_lower_set'] == 2
+    assert report['reserved'] == 2
+    assert report['unnamed'] == ['d3']
+    assert fake_db.data['drivers']['d2']['name_lower'] == "max verstappen"
+    assert fake_db.data['driver_names'][reservation_id("Lewis Hamilton")] == {
+        'name_lower': "lewis hamilton", 'owner_id': 'd1'}
+
+
+def test_backfill_is_idempotent(fake_db):
+    seed_teams(fake_db)
+    main.backfill_names('teams')
+
+    report = main.backfill_names('teams')
+
+    assert (report['name_lower_set'], report['reserved'], report['duplicates']) == (0, 0, [])
+
+
+def test_backfill_reports_duplicate_names(fake_db):
+    fake_db.seed('teams', {'t1': {'name': "Ferrari"}, 't2': {'name': "FERRARI"}, 't3': {'name': "McLaren"}})
+    fake_db.seed('team_names', {reservation_id("McLaren"): {'name_lower': "mclaren", 'owner_id': 't9'}})
+
+    report = main.backfill_names('teams')
+
+    assert report['duplicates'] == [{'id': 't2', 'name': "FERRARI", 'owner_id': 't1'},
+                                    {'id': 't3', 'name': "McLaren", 'owner_id': 't9'}]
+    assert fake_db.data['team_names'][reservation_id("Ferrari")]['owner_id'] == 't1'
+    assert fake_db.data['teams']['t2']['name_lower'] == "ferrari"
+
+
+def test_backfill_dry_run_writes_nothing(fake_db):
+    fake_db.seed('drivers', {'d1': {'name': "Lewis Hamilton"}})
+
+    report = main.backfill_names('drivers', dry_run=True)
+
+    assert report['reserved'] == 1
+    assert 'name_lower' not in fake_db.data['drivers']['d1']
+    assert 'driver_names' not in fake_db.data
+
+
+def test_cli_backfill_names_covers_every_collection(fake_db, capsysbinary):
+    fake_db.seed('drivers', {'d1': {'name': "Lewis Hamilton"}})
+    fake_db.seed('teams', {'t1': {'name': "Ferrari"}})
+
+    main.main(['backfill-names'])
+
+    reports = orjson.loads(capsysbinary.readouterr().out)
+    assert [report['collection'] for report in reports] == ['drivers', 'teams']
+    assert fake_db.data['teams']['t1']['name_lower'] == "ferrari"
+
+
+def test_cli_backfill_names_exits_non_zero_on_duplicates(fake_db):
+    fake_db.seed('teams', {'t1': {'name': "Ferrari"}, 't2': {'name': "ferrari"}})
+
+    with pytest.raises(SystemExit) as exit_info:
+        main.main(['backfill-names', 'teams'])
+
+    assert exit_info.value.code == 1
+
+
+def test_list_page_fallback_orders_by_name_lower(fake_db):
+    seed_drivers(fake_db, count=2)
+    fake_db.seed('drivers', {'d3': {'name': "alain prost", 'name_lower': "alain prost", 'team_id': ''}})
+
+    page = main.list_drivers(page_size=2)
+
+    assert [driver['id'] for driver in page] == ['d3', 'd1']
+    assert [driver['id'] for driver in main.list_drivers(page_size=2, start_after='d1')] == ['d2']
+
+
+def test_documents_without_name_lower_are_listed_and_checked_before_a_backfill(fake_db, client):
+    fake_db.seed('drivers', {'d1': {'name': "Lewis Hamilton", 'age': 40}})
+
+    items = client.get('/api/drivers').json()['items']
+    assert [item['id'] for item in items] == ['d1']
+    assert [item['id'] for item in client.get('/api/drivers', params={'q': "lew"}).json()['items']] == ['d1']
+
+    main.drivers_cache.clear()
+    assert main.driver_name_exists("lewis HAMILTON")
+    assert not main.driver_name_exists("Lewis Hamilton", exclude_id='d1')
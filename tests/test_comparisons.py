@@ -0,0 +1,81 @@
+import pytest
+
+import main
+from conftest import seed_drivers, seed_teams
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    calls = []
+    for engine in (main.driver_comparisons, main.team_comparisons):
+        def counting_loader(id1, id2, load=engine.loader):
+            calls.append((id1, id2))
+            return load(id1, id2)
+        monkeypatch.setattr(engine, 'loader', counting_loader)
+    return calls
+
+
+def test_driver_comparison_is_cached_and_evicted_by_a_write_to_either_side(fake_db, loads):
+    seed_teams(fake_db)
+    seed_drivers(fake_db, 2)
+
+    first = main.driver_comparisons.compare('d1', 'd2')
+    assert main.driver_comparisons.compare('d1', 'd2') == first
+    assert len(loads) == 1
+    assert first['deltas']['total_race_wins'] == {'first': 2, 'second': 4, 'delta': -2, 'leader': 2}
+
+    main.update_driver_record('d2', {'name': "Driver 2", 'total_race_wins': 1})
+    assert main.driver_comparisons.compare('d1', 'd2')['deltas']['total_race_wins']['leader'] == 1
+    assert len(loads) == 2
+
+    main.update_team_record('t1', {'name': "Team One", 'total_race_wins': 21})
+    assert main.driver_comparisons.compare('d1', 'd2')['team1']['total_race_wins'] == 21
+    assert len(loads) == 3
+
+
+def test_team_comparison_is_evicted_by_a_write_to_a_roster_driver(fake_db, loads):
+    seed_teams(fake_db)
+    seed_drivers(fake_db, 2)
+
+    main.team_comparisons.compare('t1', 't2')
+    main.team_comparisons.compare('t1', 't2')
+    assert len(loads) == 1
+
+    main.update_driver_record('d1', {'name': "Driver 1", 'age': 40})
+    result = main.team_comparisons.compare('t1', 't2')
+    assert len(loads) == 2
+    assert result['team1_drivers'][0]['age'] == 40
+
+
+def test_team_comparison_is_evicted_when_a_driver_moves_into_a_team(fake_db, loads):
+    seed_teams(fake_db)
+    seed_drivers(fake_db, 2)
+    fake_db.seed('drivers', {'d9': {'name': "Driver 9", 'name_lower': "driver 9", 'team_id': 'elsewhere'}})
+
+    before = main.team_comparisons.compare('t1', 't2')
+    assert [driver['id'] for driver in before['team2_drivers']] == ['d2']
+
+    main.update_driver_record('d9', {'name': "Driver 9", 'team_id': 't2'})
+    after = main.team_comparisons.compare('t1', 't2')
+    assert len(loads) == 2
+    assert [driver['id'] for driver in after['team2_drivers']] == ['d2', 'd9']
+
+
+def test_a_result_computed_during_a_write_is_not_stored(fake_db, loads, monkeypatch):
+    seed_teams(fake_db)
+    seed_drivers(fake_db, 2)
+    load = main.driver_comparisons.loader
+
+    def load_then_write(id1, id2):
+        result = load(id1, id2)
+        main.update_driver_record('d2', {'name': "Driver 2", 'total_race_wins': 1})
+        return result
+    monkeypatch.setattr(main.driver_comparisons, 'loader', load_then_write)
+
+    stale = main.driver_comparisons.compare('d1', 'd2')
+    assert stale['driver2']['total_race_wins'] == 4
+
+    monkeypatch.setattr(main.driver_comparisons, 'loader', load)
+    fresh = main.driver_comparisons.compare('d1', 'd2')
+    assert fresh['driver2']['total_race_wins'] == 1
+    assert len(loads) == 2
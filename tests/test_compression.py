@@ -0,0 +1,103 @@
+import gzip
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from fastapi.testclient import TestClient
+
+import main
+
+BODY = "lap time " * 500
+
+
+@pytest.fixture
+def app_client():
+    app = FastAPI()
+
+    @app.get('/text')
+    async def text():
+        return PlainTextResponse(BODY, headers={'ETag': '"abc"'})
+
+    @app.get('/small')
+    async def small():
+        return PlainTextResponse("ok")
+
+    @app.get('/png')
+    async def png():
+        return Response(b'\x89PNG' * 1000, media_type='image/png')
+
+    @app.get('/encoded')
+    async def encoded():
+        return Response(gzip.compress(BODY.encode()), media_type='text/plain', headers={'Content-Encoding': 'gzip'})
+
+    @app.get('/stream')
+    async def stream():
+        async def chunks():
+            for number in range(50):
+                yield f"row {number} {'x' * 100}\n".encode()
+        return StreamingResponse(chunks(), media_type='application/x-ndjson')
+
+    app.add_middleware(main.CompressionMiddleware)
+    # decompression is checked by hand, so the test client must not undo it
+    return TestClient(app, headers={'Accept-Encoding': 'gzip'})
+
+
+def raw_get(app_client, path, **headers):
+    with app_client.stream('GET', path, headers=headers) as response:
+        return response, b''.join(response.iter_raw())
+
+
+def test_large_text_is_gzipped_with_a_weak_etag(app_client):
+    response, body = raw_get(app_client, '/text')
+
+    assert response.headers['content-encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['vary']
+    assert response.headers['etag'] == 'W/"abc"'
+    assert 'content-length' not in response.headers or int(response.headers['content-length']) == len(body)
+    assert gzip.decompress(body).decode() == BODY
+
+
+def test_streamed_responses_are_compressed_chunk_by_chunk(app_client):
+    response, body = raw_get(app_client, '/stream')
+
+    assert response.headers['content-encoding'] == 'gzip'
+    assert gzip.decompress(body).decode().count('\n') == 50
+
+
+@pytest.mark.parametrize('path', ['/small', '/png'])
+def test_small_and_binary_responses_go_out_as_they_are(app_client, path):
+    response, _ = raw_get(app_client, path)
+
+    assert 'content-encoding' not in response.headers
+
+
+def test_encoded_responses_are_not_compressed_twice(app_client):
+    response, body = raw_get(app_client, '/encoded')
+
+    assert gzip.decompress(body).decode() == BODY
+
+
+def test_no_compression_without_accept_encoding(app_client):
+    response, body = raw_get(app_client, '/text', **{'Accept-Encoding': 'identity'})
+
+    assert 'content-encoding' not in response.headers
+    assert body.decode() == BODY
+
+
+def test_choose_encoding_prefers_brotli_when_installed(monkeypatch):
+    monkeypatch.setattr(main, 'brotli', None)
+    assert main.choose_encoding('br, gzip') == 'gzip'
+    assert main.choose_encoding('br') is None
+    assert main.choose_encoding('gzip;q=0, deflate') is None
+
+    brotli = pytest.importorskip('brotli')
+    monkeypatch.setattr(main, 'brotli', brotli)
+    assert main.choose_encoding('gzip, br') == 'br'
+
+
+def test_gzip_encoder_round_trips_across_chunks():
+    encoder = main.ResponseEncoder('gzip')
+
+    data = encoder.encode(b'first ', False) + encoder.encode(b'second', True)
+
+    assert gzip.decompress(data) == b'first second'
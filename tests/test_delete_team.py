@@ -0,0 +1,62 @@
+import main
+
+
+def make_team(fake_db, roster_size):
+    team_id = main.add_team({'name': "Doomed Racing", 'year_founded': 2000})
+    fake_db.seed('drivers', {f"d{number}": {'name': f"Driver {number}", 'name_lower': f"driver {number}",
+                                            'age': 30, 'team_id': team_id}
+                             for number in range(roster_size)})
+    fake_db.seed('drivers', {'other': {'name': "Other", 'name_lower': "other", 'team_id': 'elsewhere'}})
+    main.drivers_cache.all()
+    fake_db.documents_read = 0
+    fake_db.commits = 0
+    fake_db.largest_commit = 0
+    return team_id
+
+
+def roster_team_ids(fake_db):
+    return {doc_id: data['team_id'] for doc_id, data in fake_db.data['drivers'].items()}
+
+
+def test_small_roster_is_detached_in_one_transaction(fake_db):
+    team_id = make_team(fake_db, 3)
+
+    assert main.delete_team_record(team_id)
+
+    assert fake_db.commits == 1
+    assert team_id not in fake_db.data['teams']
+    assert roster_team_ids(fake_db) == {'d0': '', 'd1': '', 'd2': '', 'other': 'elsewhere'}
+    assert all(main.drivers_cache.peek(f"d{number}").team_id == '' for number in range(3))
+    assert main.teams_cache.peek(team_id) is None
+
+
+def test_large_roster_is_detached_in_chunks_reading_it_once(fake_db, monkeypatch):
+    monkeypatch.setattr(main, 'FIRESTORE_WRITE_LIMIT', 10)
+    team_id = make_team(fake_db, 45)
+
+    assert main.delete_team_record(team_id)
+
+    # 37 drivers in four batches, then the last 8 with the team delete and name release
+    assert fake_db.commits == 5
+    assert fake_db.largest_commit == 10
+    # the full roster once, then only what was left for the transaction
+    assert fake_db.documents_read == 45 + 8
+    assert set(roster_team_ids(fake_db).values()) == {'', 'elsewhere'}
+    assert all(main.drivers_cache.peek(f"d{number}").team_id == '' for number in range(45))
+    assert main.drivers_index.members(team_id) == []
+
+
+def test_deleting_a_team_releases_its_name(fake_db):
+    team_id = make_team(fake_db, 1)
+
+    main.delete_team_record(team_id)
+
+    assert fake_db.data['team_names'] == {}
+    assert main.add_team({'name': "doomed racing", 'year_founded': 2001}) != team_id
+
+
+def test_a_missing_team_is_not_deleted(fake_db):
+    make_team(fake_db, 2)
+
+    assert main.delete_team_record('missing') is False
+    assert fake_db.commits == 0
@@ -0,0 +1,54 @@
+import csv
+import io
+
+import orjson
+
+import main
+from conftest import seed_drivers, seed_teams
+
+
+def test_stream_records_pages_through_the_collection_in_id_order(fake_db):
+    seed_drivers(fake_db, count=7)
+
+    records = list(main.stream_records(main.drivers_ref, main.Driver, page_size=3))
+
+    assert [record.id for record in records] == [f"d{number}" for number in range(1, 8)]
+
+
+def test_csv_export_streams_every_driver_with_its_team_name(fake_db, client):
+    seed_drivers(fake_db, count=3)
+    seed_teams(fake_db)
+
+    response = client.get('/export/drivers')
+
+    assert response.status_code == 200
+    assert response.headers['content-disposition'] == 'attachment; filename="drivers.csv"'
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row['id'] for row in rows] == ['d1', 'd2', 'd3']
+    assert rows[0]['team_name'] == "Team One"
+    assert rows[1]['team_name'] == "Team Two"
+    assert rows[0]['total_points_scored'] == '10.5'
+
+
+def test_ndjson_export_of_teams(fake_db, client):
+    seed_teams(fake_db)
+
+    response = client.get('/export/teams', params={'format': 'ndjson'})
+
+    assert response.status_code == 200
+    rows = [orjson.loads(line) for line in response.text.splitlines()]
+    assert [row['name'] for row in rows] == ["Team One", "Team Two"]
+    assert set(rows[0]) == set(main.EXPORT_COLUMNS['teams'])
+
+
+def test_export_rejects_an_unknown_format(client):
+    assert client.get('/export/drivers', params={'format': 'xml'}).status_code == 400
+
+
+def test_cli_export_writes_the_file(fake_db, tmp_path):
+    seed_drivers(fake_db, count=2)
+    output = tmp_path / 'drivers.ndjson'
+
+    main.main(['export', 'drivers', '--format', 'ndjson', '-o', str(output)])
+
+    assert len(output.read_bytes().splitlines()) == 2
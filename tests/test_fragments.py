@@ -0,0 +1,36 @@
+import main
+from conftest import seed_teams
+
+
+def test_remember_moves_the_version_only_when_the_record_changes(fake_db):
+    seed_teams(fake_db)
+    team = main.Team.from_snapshot(main.teams_ref.document('t1').get())
+
+    main.teams_cache.remember(team)
+    version = main.teams_cache.version
+    main.teams_cache.remember(main.Team.from_snapshot(main.teams_ref.document('t1').get()))
+    assert main.teams_cache.version == version
+
+    main.teams_ref.document('t1').update({'total_race_wins': 21})
+    main.teams_cache.remember(main.Team.from_snapshot(main.teams_ref.document('t1').get()))
+    assert main.teams_cache.version == version + 1
+
+
+def test_option_tags_are_reused_for_the_same_content():
+    items = [{'id': 't1', 'name': "Team One"}, {'id': 't2', 'name': "Team Two"}]
+
+    first = main.option_tags(main.teams_cache, items, 't2')
+    main.teams_cache.put('t3', {'name': "Team Three"})
+    second = main.option_tags(main.teams_cache, items, 't2')
+
+    assert second == first
+    assert len(main.fragments._entries) == 1
+    assert '<option value="t2" selected>Team Two</option>' in first
+
+
+def test_option_tags_follow_a_rename():
+    main.option_tags(main.teams_cache, [{'id': 't1', 'name': "Team One"}])
+
+    renamed = main.option_tags(main.teams_cache, [{'id': 't1', 'name': "Team Uno"}])
+
+    assert 'Team Uno' in renamed
@@ -0,0 +1,110 @@
+import main
+from conftest import seed_drivers, seed_teams
+
+
+def start_sync(fake_db):
+    seed_drivers(fake_db, count=4)
+    seed_teams(fake_db)
+    main.drivers_sync.start()
+    main.teams_sync.start()
+
+
+def test_fingerprint_is_unknown_until_synced(fake_db):
+    seed_drivers(fake_db, count=2)
+    main.drivers_cache.load([main.Driver.from_snapshot(doc) for doc in main.drivers_ref.stream()])
+
+    assert main.drivers_cache.fingerprint() is None
+
+
+def test_fingerprint_follows_writes_and_matches_a_fresh_load(fake_db):
+    start_sync(fake_db)
+    before = main.drivers_cache.fingerprint()
+
+    main.drivers_ref.document('d1').update({'total_race_wins': 99})
+    changed = main.drivers_cache.fingerprint()
+    main.drivers_ref.document('d1').update({'total_race_wins': 2})
+
+    assert changed != before
+    assert main.drivers_cache.fingerprint() == before
+    main.drivers_cache.load([main.Driver.from_snapshot(doc) for doc in main.drivers_ref.stream()], synced=True)
+    assert main.drivers_cache.fingerprint() == before
+
+
+def test_fingerprint_drops_removed_documents(fake_db):
+    start_sync(fake_db)
+    roster = main.drivers_cache.fingerprint(['d1', 'd3'])
+
+    main.drivers_ref.document('d3').delete()
+
+    assert main.drivers_cache.fingerprint(['d1', 'd3']) != roster
+    assert main.drivers_cache.fingerprint(['d1', 'd3']) == main.drivers_cache.fingerprint(['d1'])
+
+
+def test_team_page_version_ignores_other_teams_drivers(fake_db):
+    start_sync(fake_db)
+    team_one = main.team_page_version('t1')
+    team_two = main.team_page_version('t2')
+
+    main.drivers_ref.document('d2').update({'total_points_scored': 500.0})
+
+    assert main.team_page_version('t1') == team_one
+    assert main.team_page_version('t2') != team_two
+
+
+def test_team_page_revalidates_with_304(fake_db, auth_client):
+    start_sync(fake_db)
+
+    first = auth_client.get('/team/t1')
+    assert first.status_code == 200
+    etag = first.headers['etag']
+
+    assert auth_client.get('/team/t1', headers={'If-None-Match': etag}).status_code == 304
+    main.drivers_ref.document('d2').update({'age': 40})
+    assert auth_client.get('/team/t1', headers={'If-None-Match': etag}).status_code == 304
+    main.drivers_ref.document('d1').update({'age': 40})
+    assert auth_client.get('/team/t1', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_api_responses_revalidate_with_304(fake_db, client):
+    seed_drivers(fake_db, count=2)
+
+    first = client.get('/api/drivers')
+    etag = first.headers['etag']
+    repeat = client.get('/api/drivers', headers={'If-None-Match': etag})
+
+    assert repeat.status_code == 304
+    assert repeat.content == b''
+    main.drivers_ref.document('d1').update({'age': 60})
+    main.drivers_cache.merge('d1', {'age': 60})
+    assert client.get('/api/drivers', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_compressed_pages_keep_revalidating(fake_db, auth_client):
+    start_sync(fake_db)
+
+    first = auth_client.get('/team/t1', headers={'Accept-Encoding': 'gzip'})
+    assert first.headers['content-encoding'] == 'gzip'
+    assert first.headers['etag'].startswith('W/"')
+
+    repeat = auth_client.get('/team/t1', headers={'Accept-Encoding': 'gzip', 'If-None-Match': first.headers['etag']})
+    assert repeat.status_code == 304
+
+
+def test_page_etags_depend_on_the_token_cookie(fake_db, auth_client):
+    start_sync(fake_db)
+    signed_in = auth_client.get('/driver/d1').headers['etag']
+
+    auth_client.cookies.clear()
+    signed_out = auth_client.get('/driver/d1')
+
+    assert signed_out.headers['etag'] != signed_in
+    assert auth_client.get('/driver/d1', headers={'If-None-Match': signed_in}).status_code == 200
+
+
+def test_pages_are_not_tagged_until_the_caches_are_synced(fake_db, client):
+    seed_drivers(fake_db, count=1)
+
+    response = client.get('/driver/d1')
+
+    assert response.status_code == 200
+    assert 'etag' not in response.headers
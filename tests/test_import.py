@@ -0,0 +1,124 @@
+import orjson
+import pytest
+
+import main
+from conftest import seed_teams
+
+TEAM_FIELDS = {
+    'year_founded': 1950, 'total_pole_positions': 1, 'total_race_wins': 2,
+    'total_constructor_titles': 0, 'previous_season_position': 4
+}
+
+
+def ndjson(*rows):
+    return b'\n'.join(orjson.dumps(row) for row in rows)
+
+
+def errors_by_row(report):
+    return {error['row']: error['error'] for error in report['errors']}
+
+
+def test_csv_rows_are_validated_and_imported(fake_db):
+    content = (
+        "name,year_founded,total_pole_positions,total_race_wins,total_constructor_titles,previous_season_position\n"
+        "Alpha, 1960 ,1,2,0,3\n"
+        "Beta,1960.5,1,2,0,3\n"
+        ",1960,1,2,0,3\n"
+        "Gamma,abc,1,2,0,3\n"
+        "alpha,1961,1,2,0,3\n"
+    ).encode()
+
+    report = main.import_records('teams', main.parse_import(content, 'csv'))
+
+    assert report['imported'] == 1
+    errors = errors_by_row(report)
+    assert set(errors) == {2, 3, 4, 5}
+    assert "year_founded" in errors[2]
+    assert errors[3] == "Name is required"
+    assert errors[5] == "Duplicate of row 1"
+    stored = fake_db.data['teams'][report['ids'][0]]
+    assert stored['year_founded'] == 1960 and stored['name_lower'] == "alpha"
+
+
+@pytest.mark.parametrize('value, message', [
+    (1950.9, "year_founded must be a whole number: 1950.9"),
+    (True, "Invalid value for year_founded: true"),
+    (False, "Invalid value for year_founded: false"),
+    ([1950], "Invalid value for year_founded: [1950]"),
+])
+def test_ndjson_values_that_would_be_coerced_are_rejected(fake_db, value, message):
+    rows = main.parse_import(ndjson(dict(TEAM_FIELDS, name="Lossy", year_founded=value)), 'ndjson')
+
+    report = main.import_records('teams', rows)
+
+    assert report['imported'] == 0
+    assert errors_by_row(report) == {1: message}
+
+
+def test_ndjson_accepts_whole_floats_and_numeric_strings(fake_db):
+    rows = main.parse_import(ndjson(
+        dict(TEAM_FIELDS, name="Whole", year_founded=1950.0),
+        dict(TEAM_FIELDS, name="Text", year_founded=" 1951 "),
+    ), 'ndjson')
+
+    report = main.import_records('teams', rows)
+
+    assert report['errors'] == []
+    years = sorted(team['year_founded'] for team in fake_db.data['teams'].values())
+    assert years == [1950, 1951]
+    assert all(isinstance(year, int) for year in years)
+
+
+def test_ndjson_rows_that_are_not_objects_are_reported(fake_db):
+    report = main.import_records('teams', main.parse_import(b'[1, 2]\n{not json\n', 'ndjson'))
+
+    assert errors_by_row(report) == {1: "Row is not a JSON object", 2: "Row is not a JSON object"}
+
+
+def test_driver_rows_resolve_their_team(fake_db):
+    seed_teams(fake_db)
+    driver = {'age': 30, 'total_pole_positions': 1, 'total_race_wins': 1, 'total_points_scored': 12.5,
+              'total_world_titles': 0, 'total_fastest_laps': 2}
+    rows = main.parse_import(ndjson(
+        dict(driver, name="By Name", team_name="team two"),
+        dict(driver, name="By Id", team_id='t1'),
+        dict(driver, name="Lost", team_name="Nobody"),
+    ), 'ndjson')
+
+    report = main.import_records('drivers', rows)
+
+    assert errors_by_row(report) == {3: "Unknown team 'Nobody'"}
+    teams = {data['name']: data['team_id'] for data in fake_db.data['drivers'].values()}
+    assert teams == {"By Name": 't2', "By Id": 't1'}
+
+
+def test_dry_run_writes_nothing(fake_db):
+    report = main.import_records('teams', main.parse_import(ndjson(dict(TEAM_FIELDS, name="Dry")), 'ndjson'),
+                                 dry_run=True)
+
+    assert report['valid'] == 1 and report['imported'] == 0
+    assert 'teams' not in fake_db.data
+
+
+def test_names_taken_in_firestore_are_rejected(fake_db):
+    seed_teams(fake_db)
+
+    report = main.import_records('teams', main.parse_import(ndjson(dict(TEAM_FIELDS, name="TEAM ONE")), 'ndjson'))
+
+    assert errors_by_row(report) == {1: "Team 'TEAM ONE' already exists"}
+
+
+def test_import_route_requires_login(client):
+    response = client.post('/import/teams', files={'file': ('teams.ndjson', ndjson(dict(TEAM_FIELDS, name="X")))})
+
+    assert response.status_code == 401
+
+
+def test_import_route_reports_rows(fake_db, auth_client):
+    content = ndjson(dict(TEAM_FIELDS, name="Route"), dict(TEAM_FIELDS, name="Bad", total_race_wins=2.5))
+
+    response = auth_client.post('/import/teams', files={'file': ('teams.ndjson', content)})
+
+    assert response.status_code == 200
+    assert response.json()['imported'] == 1
+    assert response.json()['errors'][0]['row'] == 2
@@ -0,0 +1,186 @@
+import pytest
+
+import main
+from conftest import seed_drivers
+
+
+def build_index(items, field_type=int):
+    index = main.SortedIndex(field_type)
+    index.build(items)
+    return index
+
+
+def test_sorted_index_orders_by_value_then_id_and_skips_bad_values():
+    index = build_index([('b', 3), ('a', 3), ('c', 1), ('d', 'fast'), ('e', None)])
+
+    assert index.between() == ['c', 'a', 'b']
+    assert len(index) == 3
+
+
+def test_sorted_index_comparisons():
+    index = build_index([('a', 1), ('b', 2), ('c', 2), ('d', 5)])
+
+    assert index.lt(2) == ['a']
+    assert index.eq(2) == ['b', 'c']
+    assert index.gt(2) == ['d']
+    assert index.between(2, 5) == ['b', 'c', 'd']
+    assert index.between(high=1) == ['a']
+    assert index.slice(*index.span('between', (1, 2))) == ['a', 'b', 'c']
+    with pytest.raises(ValueError):
+        index.span('ne', 2)
+
+
+def test_sorted_index_slice_resumes_after_an_id():
+    index = build_index([('a', 1), ('b', 2), ('c', 2), ('d', 5)])
+
+    assert index.slice(*index.span('gt', 0), start_after='b', limit=1) == ['c']
+    with pytest.raises(main.StaleCursorError):
+        index.slice(*index.span('gt', 0), start_after='missing', limit=2)
+
+
+def test_sorted_index_slice_resumes_after_a_removed_id():
+    index = build_index([('a', 1), ('b', 2), ('c', 2), ('d', 5)])
+
+    index.remove('b')
+    assert index.slice(*index.span('gt', 0), start_after='b', limit=2) == ['c', 'd']
+
+    index.build([('a', 1), ('d', 5)])
+    assert index.slice(*index.span('gt', 0), start_after='c') == ['d']
+
+    index.add('c', 9)
+    assert index.slice(*index.span('gt', 0), start_after='c') == []
+
+
+def test_sorted_index_add_moves_and_remove_drops():
+    index = build_index([('a', 1), ('b', 2)])
+
+    index.add('a', 3)
+    index.add('c', 'n/a')
+    index.remove('b')
+    index.remove('missing')
+
+    assert index.between() == ['a']
+    assert index.eq(1) == []
+
+
+def test_sorted_index_prefix_span_on_names():
+    index = build_index([('a', "max"), ('b', "mick"), ('c', "lando")], str)
+
+    assert index.slice(*index.span('prefix', 'm')) == ['a', 'b']
+    assert index.slice(*index.span('prefix', '')) == ['c', 'a', 'b']
+
+
+def test_sorted_index_top():
+    index = build_index([('a', 1), ('b', 7), ('c', 4)])
+
+    assert index.top(2) == ['b', 'c']
+    assert index.top(2, descending=False) == ['a', 'c']
+    assert index.top(10) == ['b', 'c', 'a']
+
+
+def make_collection_index():
+    index = main.CollectionIndex(main.DRIVER_NUMERIC_FIELDS, group_field='team_id')
+    index.build([
+        {'id': 'd1', 'name': "Lewis Hamilton", 'total_race_wins': 103, 'team_id': 't1'},
+        {'id': 'd2', 'name': "George Russell", 'total_race_wins': 3, 'team_id': 't1'},
+        {'id': 'd3', 'name': "Max Verstappen", 'total_race_wins': 63, 'team_id': 't2'}
+    ])
+    return index
+
+
+def test_collection_index_query_names_and_groups():
+    index = make_collection_index()
+
+    assert index.ready
+    assert index.query('total_race_wins', 'gt', '50') == ['d3', 'd1']
+    assert index.name_owner("  max VERSTAPPEN") == 'd3'
+    assert index.by_name() == ['d2', 'd1', 'd3']
+    assert index.by_name('l') == ['d1']
+    assert index.members('t1') == ['d1', 'd2']
+    with pytest.raises(ValueError):
+        index.query('name', 'eq', 1)
+    with pytest.raises(ValueError):
+        index.query('total_race_wins', 'ne', 1)
+
+
+def test_collection_index_update_and_remove():
+    index = make_collection_index()
+
+    index.update('d2', {'name': "George R", 'team_id': 't2', 'total_race_wins': 200})
+    assert index.name_owner("George Russell") is None
+    assert index.name_owner("george r") == 'd2'
+    assert index.members('t1') == ['d1']
+    assert index.members('t2') == ['d2', 'd3']
+    assert index.top('total_race_wins', 1) == ['d2']
+
+    index.remove('d2')
+    assert index.members('t2') == ['d3']
+    assert index.name_owner("George R") is None
+    assert index.top('total_race_wins', 1) == ['d1']
+
+
+def test_collection_index_counts_and_matches_predicates():
+    index = make_collection_index()
+
+    assert index.count('total_race_wins', 'in', (3, 63, 7)) == 2
+    assert index.match_ids('total_race_wins', 'in', (63, 3)) == ['d2', 'd3']
+    assert index.count('total_race_wins', 'between', (10, 100)) == 1
+    assert index.between('total_race_wins', 50) == ['d3', 'd1']
+
+
+def test_index_backed_paths_reload_once_the_ttl_runs_out(fake_db, monkeypatch):
+    seed_drivers(fake_db, count=2)
+    main.drivers_cache.all()
+    # written by another instance, so this cache never heard of it
+    fake_db.seed('drivers', {'b': {'name': "B", 'name_lower': "b", 'age': 40, 'total_race_wins': 99}})
+
+    assert not main.driver_name_exists("B")
+
+    monkeypatch.setattr(main.drivers_cache, 'ttl', 0)
+    assert 'b' in [doc['id'] for doc in main.query_drivers([('age', 'gt', 10)])]
+    assert 'b' in [doc['id'] for doc in main.list_drivers()]
+    assert main.leaderboard(main.drivers_index, main.drivers_cache, 'total_race_wins', 1)[0]['id'] == 'b'
+    assert main.driver_name_exists("B")
+
+
+def test_a_synced_index_is_never_reloaded(fake_db, monkeypatch):
+    seed_drivers(fake_db, count=2)
+    main.drivers_sync.start()
+    monkeypatch.setattr(main.drivers_cache, 'ttl', 0)
+    streams = fake_db.stream_calls
+
+    main.query_drivers([('age', 'gt', 10)])
+    main.list_drivers()
+
+    assert fake_db.stream_calls == streams
+
+
+def test_name_paging_continues_past_a_deleted_cursor_document(fake_db, client):
+    seed_drivers(fake_db, 5)
+
+    first = client.get('/search/drivers', params={'page_size': 2}).json()
+    assert [item['id'] for item in first['items']] == ['d1', 'd2']
+
+    main.delete_driver_record('d2')
+    second = client.get('/search/drivers', params={'page_size': 2, 'cursor': first['next_cursor']}).json()
+    assert [item['id'] for item in second['items']] == ['d3', 'd4']
+
+    response = client.get('/search/drivers', params={'page_size': 2, 'cursor': 'never-existed'})
+    assert response.status_code == 400
+
+
+def test_next_cursor_comes_from_the_index_when_a_document_is_dropped(fake_db, monkeypatch):
+    seed_drivers(fake_db, 5)
+    main.drivers_cache.ensure_index()
+    get_many = main.drivers_cache.get_many
+    monkeypatch.setattr(main.drivers_cache, 'get_many',
+                        lambda ids: {doc_id: doc for doc_id, doc in get_many(ids).items() if doc_id != 'd2'})
+
+    page = main.list_drivers(2)
+    assert [driver['id'] for driver in page] == ['d1']
+    assert main.next_cursor(page, 2) == 'd2'
+    assert [driver['id'] for driver in main.list_drivers(2, main.next_cursor(page, 2))] == ['d3', 'd4']
+
+    results = main.query_drivers([('age', 'gt', 20)], 2)
+    assert [driver['id'] for driver in results] == ['d1']
+    assert main.next_cursor(results, 2) == 'd2'
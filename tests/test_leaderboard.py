@@ -0,0 +1,82 @@
+import pytest
+
+import main
+from conftest import seed_drivers
+
+
+def test_leaderboard_skips_documents_deleted_while_it_runs(fake_db, monkeypatch):
+    seed_drivers(fake_db, count=3)
+    main.drivers_cache.all()
+    get_many = main.drivers_cache.get_many
+
+    def get_many_then_delete(doc_ids):
+        docs = get_many(doc_ids)
+        main.drivers_ref.document('d3').delete()
+        main.drivers_cache.remove('d3')
+        return docs
+    monkeypatch.setattr(main.drivers_cache, 'get_many', get_many_then_delete)
+
+    entries = main.leaderboard(main.drivers_index, main.drivers_cache, 'total_race_wins', 3)
+
+    assert [(entry['id'], entry['rank']) for entry in entries] == [('d2', 1), ('d1', 2)]
+
+
+def test_leaderboard_rejects_a_limit_below_one(fake_db):
+    with pytest.raises(ValueError):
+        main.leaderboard(main.drivers_index, main.drivers_cache, 'total_race_wins', 0)
+
+
+def test_leaderboard_api_answers_400_for_limit_zero(fake_db, client):
+    seed_drivers(fake_db, count=2)
+
+    response = client.get('/api/leaderboard/drivers', params={'attribute': 'total_race_wins', 'limit': 0})
+
+    assert response.status_code == 400
+    assert response.json()['detail'] == "limit must be at least 1"
+
+
+def test_leaderboard_api_caps_the_limit(fake_db, client, monkeypatch):
+    monkeypatch.setattr(main, 'PAGE_SIZE_MAX', 2)
+    seed_drivers(fake_db, count=3)
+
+    response = client.get('/api/leaderboard/drivers', params={'attribute': 'total_race_wins', 'limit': 1000})
+
+    assert [item['id'] for item in response.json()['items']] == ['d3', 'd2']
+
+
+def test_rank_and_percentile_with_ties():
+    index = main.SortedIndex(int)
+    index.build([('a', 10), ('b', 20), ('c', 20), ('d', 30)])
+
+    assert index.rank('d') == {'rank': 1, 'value': 30, 'total': 4, 'percentile': 100.0}
+    assert index.rank('b') == {'rank': 2, 'value': 20, 'total': 4, 'percentile': 75.0}
+    assert index.rank('c')['rank'] == 2
+    assert index.rank('a') == {'rank': 4, 'value': 10, 'total': 4, 'percentile': 25.0}
+    assert index.rank('a', descending=False) == {'rank': 1, 'value': 10, 'total': 4, 'percentile': 100.0}
+    assert index.rank('b', descending=False)['percentile'] == 75.0
+    assert index.rank('missing') is None
+
+
+def test_leaderboard_orders_each_attribute_its_own_way(fake_db):
+    seed_drivers(fake_db, count=3)
+
+    by_wins = main.leaderboard(main.drivers_index, main.drivers_cache, 'total_race_wins', 2)
+    by_age = main.leaderboard(main.drivers_index, main.drivers_cache, 'age', 2)
+    by_age_desc = main.leaderboard(main.drivers_index, main.drivers_cache, 'age', 2, 'desc')
+
+    assert [(entry['id'], entry['rank']) for entry in by_wins] == [('d3', 1), ('d2', 2)]
+    assert [entry['id'] for entry in by_age] == ['d1', 'd2']
+    assert [entry['id'] for entry in by_age_desc] == ['d3', 'd2']
+    with pytest.raises(ValueError):
+        main.leaderboard(main.drivers_index, main.drivers_cache, 'age', 2, 'sideways')
+
+
+def test_rank_api(fake_db, client):
+    seed_drivers(fake_db, count=4)
+
+    response = client.get('/api/leaderboard/drivers/d3', params={'attribute': 'total_race_wins'})
+
+    assert response.json() == {'id': 'd3', 'attribute': 'total_race_wins', 'rank': 2, 'value': 6,
+                               'total': 4, 'percentile': 75.0}
+    assert client.get('/api/leaderboard/drivers/d9', params={'attribute': 'age'}).status_code == 404
+    assert client.get('/api/leaderboard/drivers/d3', params={'attribute': 'name'}).status_code == 400
@@ -0,0 +1,62 @@
+import main
+from conftest import seed_drivers
+
+
+def test_a_closed_watch_is_restarted_and_reloads(fake_db):
+    seed_drivers(fake_db, count=2)
+    main.drivers_sync.start()
+    watch = fake_db.watches[0]
+
+    watch.unsubscribe()
+    # a write made while the stream was down
+    fake_db.seed('drivers', {'d9': {'name': "Late Driver", 'team_id': ''}})
+    assert main.drivers_sync.broken()
+    assert main.drivers_sync.status()['watch_active'] is False
+
+    assert main.drivers_sync.check()
+    assert fake_db.watches and fake_db.watches[0] is not watch
+    assert main.drivers_sync.ready and main.drivers_cache.synced
+    assert main.drivers_cache.peek('d9').name == "Late Driver"
+    assert main.drivers_sync.restarts == 1
+    assert not main.drivers_sync.check()
+
+
+def test_a_snapshot_that_fails_to_apply_unsyncs_the_cache(fake_db, monkeypatch):
+    seed_drivers(fake_db, count=2)
+    main.drivers_sync.start()
+
+    put = main.drivers_cache.put
+    failing = [True]
+
+    def flaky_put(doc_id, data):
+        if failing and failing.pop():
+            raise RuntimeError("disk full")
+        put(doc_id, data)
+    monkeypatch.setattr(main.drivers_cache, 'put', flaky_put)
+    main.drivers_ref.document('d1').update({'age': 50})
+
+    assert not main.drivers_cache.synced
+    assert main.drivers_cache.fingerprint() is None
+    assert main.drivers_sync.status()['last_error'] == "disk full"
+    assert main.drivers_sync.check()
+    assert main.drivers_cache.peek('d1').age == 50
+
+
+def test_a_stopped_sync_is_left_alone(fake_db):
+    main.drivers_sync.start()
+    main.drivers_sync.stop()
+
+    assert not main.drivers_sync.check()
+    assert fake_db.watches == []
+
+
+def test_health_reports_the_last_snapshot(fake_db, client):
+    seed_drivers(fake_db, count=1)
+    main.drivers_sync.start()
+    main.teams_sync.start()
+
+    body = client.get('/health').json()
+
+    assert body['status'] == 'ok'
+    assert body['sync']['drivers']['watch_active'] is True
+    assert body['sync']['drivers']['last_snapshot_age_seconds'] >= 0
@@ -0,0 +1,43 @@
+import pytest
+
+import main
+from conftest import seed_drivers
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = main.MetricsRegistry()
+    monkeypatch.setattr(main, 'metrics', registry)
+    return registry
+
+
+def test_histograms_render_cumulative_buckets():
+    registry = main.MetricsRegistry(buckets=(0.01, 0.1, 1.0))
+    for value in (0.005, 0.05, 0.07, 5.0):
+        registry.observe('latency_seconds', "Latency", value, (('route', '/a"b'),))
+
+    lines = registry.render().splitlines()
+
+    assert lines[:2] == ["# HELP latency_seconds Latency", "# TYPE latency_seconds histogram"]
+    assert lines[2:6] == [
+        'latency_seconds_bucket{route="/a\\"b",le="0.01"} 1',
+        'latency_seconds_bucket{route="/a\\"b",le="0.1"} 3',
+        'latency_seconds_bucket{route="/a\\"b",le="1.0"} 3',
+        'latency_seconds_bucket{route="/a\\"b",le="+Inf"} 4'
+    ]
+    assert lines[6].startswith('latency_seconds_sum{route="/a\\"b"} 5.12')
+    assert lines[7] == 'latency_seconds_count{route="/a\\"b"} 4'
+
+
+def test_requests_are_counted_by_route_template(fake_db, client, registry):
+    seed_drivers(fake_db, 2)
+
+    client.get('/api/drivers')
+    client.get('/api/drivers/d1')
+    client.get('/api/drivers/d2')
+    body = client.get('/metrics').text
+
+    assert 'f1_requests_total{route="/api/drivers",method="GET",status="200"} 1' in body
+    assert 'f1_requests_total{route="/api/drivers/{driver_id}",method="GET",status="200"} 2' in body
+    assert 'f1_request_duration_seconds_count{route="/api/drivers/{driver_id}",method="GET"} 2' in body
+    assert 'f1_firestore_docs_streamed_total{route="/api/drivers"} 2' in body
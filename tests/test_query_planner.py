@@ -0,0 +1,127 @@
+import pytest
+
+import main
+from conftest import seed_drivers
+
+
+def run(predicates, **kwargs):
+    return [doc['id'] for doc in main.query_drivers(predicates, **kwargs)]
+
+
+def pushed_filters(fake_db):
+    # the Firestore filters of every query, leaving out the legacy string scans
+    return [filters for _, filters in fake_db.queries if filters and filters[0][2] != '']
+
+
+@pytest.fixture(params=['firestore', 'index'])
+def plan(request, fake_db):
+    seed_drivers(fake_db, count=6)
+    if request.param == 'index':
+        main.drivers_cache.all()
+    fake_db.queries.clear()
+    return request.param
+
+
+def test_and_query(plan):
+    assert run([('total_race_wins', 'gt', 4), ('age', 'lt', 25)]) == ['d3', 'd4']
+
+
+def test_or_query(plan):
+    assert run([('age', 'eq', 21), ('total_pole_positions', 'gt', 5)], match='any') == ['d1', 'd6']
+
+
+def test_in_and_between(plan):
+    assert run([('age', 'in', (22, 24, 99)), ('total_race_wins', 'between', (4, 8))]) == ['d2', 'd4']
+
+
+def test_sort_and_page(plan):
+    predicates = [('total_race_wins', 'gt', 2), ('age', 'lt', 26)]
+
+    assert run(predicates, sort_by='age', descending=True, limit=2) == ['d5', 'd4']
+    assert run(predicates, sort_by='age', descending=True, limit=2, start_after='d4') == ['d3', 'd2']
+
+
+def test_single_predicate_is_served_in_order(plan, fake_db):
+    assert run([('total_race_wins', 'gt', 6)], limit=2) == ['d4', 'd5']
+    assert run([('total_race_wins', 'gt', 6)], limit=2, start_after='d5') == ['d6']
+
+
+def test_the_index_answers_without_firestore(fake_db):
+    seed_drivers(fake_db, count=6)
+    main.drivers_cache.all()
+    streams = fake_db.stream_calls
+
+    run([('age', 'in', (21, 23)), ('total_race_wins', 'between', (0, 100))], match='any')
+
+    assert fake_db.stream_calls == streams
+
+
+def test_and_pushes_down_only_the_most_selective_predicate(fake_db):
+    seed_drivers(fake_db, count=6)
+
+    assert run([('total_race_wins', 'gt', 1), ('total_pole_positions', 'between', (1, 4)), ('age', 'eq', 23)]) == ['d3']
+    assert pushed_filters(fake_db) == [(('age', '==', 23),)]
+
+
+def test_or_pushes_down_every_predicate(fake_db):
+    seed_drivers(fake_db, count=6)
+
+    assert run([('age', 'in', (21, 22)), ('total_race_wins', 'between', (10, 12))], match='any') == ['d1', 'd2', 'd5', 'd6']
+    assert pushed_filters(fake_db) == [(('age', 'in', [21, 22]),),
+                                       (('total_race_wins', '>=', 10), ('total_race_wins', '<=', 12))]
+
+
+def test_an_in_list_over_the_firestore_limit_is_filtered_in_memory(fake_db):
+    seed_drivers(fake_db, count=6)
+    ages = tuple(range(21, 21 + main.FIRESTORE_IN_LIMIT + 1))
+
+    assert run([('age', 'in', ages), ('total_race_wins', 'gt', 10)]) == ['d6']
+    assert pushed_filters(fake_db) == [(('total_race_wins', '>', 10),)]
+
+    fake_db.queries.clear()
+    assert len(run([('age', 'in', ages), ('total_race_wins', 'gt', 10)], match='any')) == 6
+    assert pushed_filters(fake_db) == []
+
+
+def test_legacy_string_values_are_found_before_the_index_is_built(fake_db):
+    seed_drivers(fake_db, count=3)
+    fake_db.seed('drivers', {'d9': {'name': "Legacy", 'age': '22', 'total_race_wins': '9'}})
+
+    assert run([('age', 'eq', 22), ('total_race_wins', 'gt', 3)]) == ['d2', 'd9']
+
+
+def test_parse_predicates():
+    predicates = main.parse_predicates(main.DRIVER_NUMERIC_FIELDS, ['age', 'total_race_wins', 'age', ''],
+                                       ['between', 'in', 'gt', 'eq'], ['30, 20', '1,2,3', '18', '5'])
+
+    assert predicates == [('age', 'between', (20, 30)), ('total_race_wins', 'in', (1, 2, 3)), ('age', 'gt', 18)]
+
+
+@pytest.mark.parametrize('attribute, comparison, value', [
+    ('name', 'eq', 'x'), ('age', 'ne', '1'), ('age', 'between', '1'), ('age', 'eq', '1,2'), ('age', 'eq', 'old')
+])
+def test_parse_predicates_rejects(attribute, comparison, value):
+    with pytest.raises(ValueError):
+        main.parse_predicates(main.DRIVER_NUMERIC_FIELDS, [attribute], [comparison], [value])
+
+
+def test_run_query_rejects_unknown_match_and_sort():
+    with pytest.raises(ValueError):
+        main.query_drivers([('age', 'eq', 1)], match='some')
+    with pytest.raises(ValueError):
+        main.query_drivers([('age', 'eq', 1)], sort_by='name')
+
+
+def test_paging_from_a_cursor_that_stores_a_legacy_string(fake_db):
+    seed_drivers(fake_db, count=6)
+    fake_db.seed('drivers', {'d3x': {'name': "Legacy", 'age': '23'}})
+
+    assert run([('age', 'gt', 21)], limit=3) == ['d2', 'd3', 'd3x']
+    assert run([('age', 'gt', 21)], limit=2, start_after='d3x') == ['d4', 'd5']
+    assert run([('age', 'eq', 23)], limit=2, start_after='d3') == ['d3x']
+
+
+def test_firestore_orders_strings_after_numbers(fake_db):
+    fake_db.seed('drivers', {'a': {'age': '1'}, 'b': {'age': 30}, 'c': {'age': 2.5}})
+
+    assert [doc.id for doc in main.drivers_ref.order_by('age').stream()] == ['c', 'b', 'a']
@@ -0,0 +1,27 @@
+import pytest
+
+import main
+
+
+def test_from_dict_coerces_numeric_fields_to_their_declared_types():
+    driver = main.Driver.from_dict('d1', {'name': "Max", 'age': "27", 'total_points_scored': 3,
+                                          'total_race_wins': "many", 'team_id': 't1', 'nickname': "Mad Max"})
+
+    assert driver.age == 27
+    assert isinstance(driver.total_points_scored, float) and driver.total_points_scored == 3.0
+    assert driver.total_race_wins == "many"
+    assert driver.total_pole_positions is None
+    assert driver.get('total_pole_positions', 0) == 0
+    assert driver.to_dict() == {'id': 'd1', 'name': "Max", 'age': 27, 'total_points_scored': 3.0,
+                                'total_race_wins': "many", 'team_id': 't1'}
+    with pytest.raises(AttributeError):
+        driver.nickname = "Mad Max"
+
+
+def test_fingerprint_matches_for_data_that_coerces_the_same():
+    stored_as_strings = main.Team.from_dict('t1', {'name': "Team One", 'year_founded': "1950"})
+    stored_as_numbers = main.Team.from_dict('t1', {'name': "Team One", 'year_founded': 1950})
+
+    assert stored_as_strings.fingerprint() == stored_as_numbers.fingerprint()
+    assert main.Team.from_dict('t1', {'name': "Team One", 'year_founded': 1951}).fingerprint() != \
+        stored_as_numbers.fingerprint()
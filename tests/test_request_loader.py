@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+import main
+from conftest import seed_drivers, seed_teams
+
+
+def test_loads_in_the_same_tick_share_one_round_trip(fake_db):
+    seed_drivers(fake_db, count=3)
+    seed_teams(fake_db)
+    loader = main.get_loader()
+
+    async def load():
+        return await asyncio.gather(loader.load('drivers', 'd1'), loader.load('drivers', 'd2'),
+                                    loader.load('drivers', 'd1'), loader.load('teams', 't1'),
+                                    loader.load('drivers', 'missing'))
+
+    d1, d2, d1_again, t1, missing = asyncio.run(load())
+
+    assert (d1['name'], d2['name'], t1['name']) == ("Driver 1", "Driver 2", "Team One")
+    assert d1_again == d1
+    assert missing is None
+    # one get_all for the drivers and one for the teams
+    assert fake_db.get_all_calls == 2
+
+
+def test_results_are_memoized_for_the_request(fake_db):
+    seed_drivers(fake_db, count=1)
+    loader = main.get_loader()
+
+    async def load_twice():
+        first = await loader.load('drivers', 'd1')
+        first['name'] = "Changed by the caller"
+        return first, await loader.load('drivers', 'd1')
+
+    first, second = asyncio.run(load_twice())
+
+    assert second['name'] == "Driver 1"
+    assert fake_db.get_all_calls == 1
+
+
+def test_a_failed_fetch_reaches_every_waiter(fake_db, monkeypatch):
+    def fail(doc_ids):
+        raise RuntimeError("unavailable")
+    monkeypatch.setattr(main.drivers_cache, 'get_many', fail)
+    loader = main.get_loader()
+
+    async def load():
+        return await asyncio.gather(loader.load('drivers', 'd1'), loader.load('drivers', 'd2'),
+                                    return_exceptions=True)
+
+    results = asyncio.run(load())
+
+    assert [str(result) for result in results] == ["unavailable", "unavailable"]
+
+
+def test_each_request_gets_a_fresh_loader():
+    assert main.get_loader() is not main.get_loader()
+
@@ -0,0 +1,45 @@
+import main
+from conftest import seed_drivers, seed_teams
+
+
+def test_team_drivers_use_a_firestore_query_while_the_index_is_cold(fake_db):
+    seed_drivers(fake_db, count=5)
+
+    drivers = main.get_team_drivers('t1')
+
+    assert [driver['id'] for driver in drivers] == ['d1', 'd3', 'd5']
+    assert not main.drivers_index.ready
+    # the drivers read are cached for the requests that follow
+    assert main.drivers_cache.peek('d3') is not None
+
+
+def test_team_drivers_come_from_the_index_once_it_is_built(fake_db):
+    seed_drivers(fake_db, count=5)
+    main.drivers_cache.all()
+    streams = fake_db.stream_calls
+
+    assert [driver['id'] for driver in main.get_team_drivers('t2')] == ['d2', 'd4']
+    assert fake_db.stream_calls == streams
+
+
+def test_team_index_follows_driver_writes(fake_db):
+    seed_drivers(fake_db, count=3)
+    main.drivers_cache.all()
+
+    main.drivers_cache.merge('d1', {'team_id': 't2'})
+    main.drivers_cache.put('d9', {'name': "New Driver", 'team_id': 't1'})
+    main.drivers_cache.remove('d3')
+
+    assert main.drivers_index.members('t1') == ['d9']
+    assert main.drivers_index.members('t2') == ['d1', 'd2']
+
+
+def test_team_details_list_the_roster(fake_db, auth_client):
+    seed_drivers(fake_db, count=4)
+    seed_teams(fake_db)
+
+    response = auth_client.get('/team/t2')
+
+    assert response.status_code == 200
+    assert "Driver 2" in response.text and "Driver 4" in response.text
+    assert "Driver 1" not in response.text
@@ -0,0 +1,53 @@
+import asyncio
+
+import main
+from conftest import seed_drivers
+from fake_firestore import FakeCollection, FakeWatch
+
+
+def flaky_watches(monkeypatch, *failures):
+    # Each failure is 'raise' or 'stall' for one on_snapshot call, after which watches behave
+    calls = []
+    real_on_snapshot = FakeCollection.on_snapshot
+
+    def on_snapshot(self, callback):
+        calls.append(self.id)
+        if len(calls) <= len(failures):
+            if failures[len(calls) - 1] == 'raise':
+                raise RuntimeError("watch refused")
+            watch = FakeWatch(self._client, self._collection, callback)
+            self._client.watches.append(watch)
+            return watch
+        return real_on_snapshot(self, callback)
+
+    monkeypatch.setattr(FakeCollection, 'on_snapshot', on_snapshot)
+    monkeypatch.setattr(main, 'LIVE_SYNC', True)
+    monkeypatch.setattr(main, 'WARM_UP_RETRY_SECONDS', 0)
+    monkeypatch.setattr(main, 'WARM_UP_SYNC_TIMEOUT_SECONDS', 0.1)
+    return calls
+
+
+def test_warm_up_retries_a_watch_that_fails_to_start(fake_db, monkeypatch):
+    seed_drivers(fake_db, count=2)
+    calls = flaky_watches(monkeypatch, 'raise')
+    warm_up = main.InstanceWarmUp()
+
+    asyncio.run(warm_up._load('drivers', main.drivers_sync))
+
+    assert warm_up.steps['drivers']
+    assert calls == ['drivers', 'drivers']
+    assert len(main.drivers_cache) == 2
+
+
+def test_warm_up_restarts_a_watch_that_never_delivers(fake_db, monkeypatch):
+    seed_drivers(fake_db, count=2)
+    calls = flaky_watches(monkeypatch, 'stall')
+    warm_up = main.InstanceWarmUp()
+
+    asyncio.run(warm_up._load('drivers', main.drivers_sync))
+
+    assert warm_up.steps['drivers']
+    assert calls == ['drivers', 'drivers']
+    # the stalled watch was unsubscribed, only the replacement is left
+    assert len(fake_db.watches) == 1
+    assert main.drivers_sync.ready